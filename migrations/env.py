@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+
+# Добавляем папку src в PYTHONPATH
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+)
+
+from alembic import context
+from sqlalchemy import pool, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import DB_URL, MIGRATION_LOCK_TIMEOUT
+from database import Base
+import models  # noqa: F401  (регистрирует модели в Base.metadata)
+import models.admin_model  # noqa: F401
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """Генерирует SQL миграций без подключения к БД (alembic upgrade --sql)"""
+    context.configure(
+        url=DB_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection) -> None:
+    # Не ждём блокировку таблицы дольше lock_timeout: иначе ALTER TABLE встанет
+    # в очередь за долгой транзакцией и заблокирует весь трафик к таблице
+    connection.execute(text(f"SET lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'"))
+    connection.commit()
+
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # Каждая миграция в своей транзакции, чтобы блокировки не копились
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online() -> None:
+    # Собственный движок без пула: миграции могут запускаться из потока
+    # с отдельным event loop (см. schema_migrations.ensure_schema_at_head)
+    engine = create_async_engine(DB_URL, poolclass=pool.NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_migrations_online())
@@ -1,32 +0,0 @@
-import asyncio
-import os
-import sys
-
-# Добавляем папку src в PYTHONPATH
-sys.path.insert(
-    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
-)
-
-from database import engine
-from sqlalchemy import text
-
-
-async def upgrade():
-    """
-    Изменяет тип поля winner_user_id в таблице weekly_lotteries с INTEGER на BIGINT
-    для поддержки больших Telegram user ID
-    """
-    async with engine.begin() as conn:
-        await conn.execute(
-            text(
-                """
-ALTER TABLE weekly_lotteries 
-    ALTER COLUMN winner_user_id TYPE BIGINT;
-"""
-            )
-        )
-
-
-if __name__ == "__main__":
-    asyncio.run(upgrade())
-    print("Миграция выполнена успешно: тип поля winner_user_id изменён на BIGINT.")
@@ -0,0 +1,166 @@
+"""Базовая схема
+
+Включает таблицы, которые раньше создавались через Base.metadata.create_all
+при старте бота, и изменения из разовых скриптов миграций
+(utm-колонки, contact_sent, BIGINT для winner_user_id, promo_settings).
+
+Все операции идемпотентны, поэтому ревизию можно применить как к пустой БД,
+так и к уже работающей (без таблицы alembic_version).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+CREATE TABLE IF NOT EXISTS users (
+    id BIGINT PRIMARY KEY,
+    username VARCHAR(32),
+    full_name VARCHAR(100) NOT NULL,
+    registered_at TIMESTAMP DEFAULT now(),
+    phone_last4 VARCHAR(4),
+    utm VARCHAR(200),
+    utm_source VARCHAR(200),
+    utm_medium VARCHAR(200),
+    utm_campaign VARCHAR(200)
+)
+        """
+    )
+    # Колонки из прежнего скрипта add_utm_columns.py для БД, созданных до них
+    op.execute(
+        """
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS utm VARCHAR(200),
+    ADD COLUMN IF NOT EXISTS utm_source VARCHAR(200),
+    ADD COLUMN IF NOT EXISTS utm_medium VARCHAR(200),
+    ADD COLUMN IF NOT EXISTS utm_campaign VARCHAR(200)
+        """
+    )
+    op.execute(
+        """
+CREATE TABLE IF NOT EXISTS receipts (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (id),
+    fn VARCHAR(17) NOT NULL,
+    fd VARCHAR(6) NOT NULL,
+    fpd VARCHAR(10) NOT NULL,
+    amount NUMERIC(10, 2) NOT NULL,
+    status VARCHAR(20),
+    verification_date TIMESTAMP,
+    items_count INTEGER,
+    pharmacy VARCHAR(100),
+    address TEXT,
+    aisida_items TEXT,
+    raw_api_response TEXT,
+    created_at TIMESTAMP DEFAULT now()
+)
+        """
+    )
+    op.execute(
+        """
+CREATE TABLE IF NOT EXISTS promocodes (
+    id SERIAL PRIMARY KEY,
+    code VARCHAR(50) NOT NULL UNIQUE,
+    discount_amount INTEGER NOT NULL,
+    is_used BOOLEAN,
+    is_active BOOLEAN,
+    created_at TIMESTAMP DEFAULT now(),
+    used_at TIMESTAMP
+)
+        """
+    )
+    op.execute(
+        """
+CREATE TABLE IF NOT EXISTS prizes (
+    id SERIAL PRIMARY KEY,
+    receipt_id INTEGER NOT NULL REFERENCES receipts (id),
+    type VARCHAR(20) NOT NULL,
+    code VARCHAR(50),
+    promocode_id INTEGER REFERENCES promocodes (id),
+    discount_amount INTEGER,
+    used BOOLEAN,
+    phone_last4 VARCHAR(4),
+    issued_at TIMESTAMP DEFAULT now()
+)
+        """
+    )
+    op.execute(
+        """
+CREATE TABLE IF NOT EXISTS weekly_lotteries (
+    id SERIAL PRIMARY KEY,
+    week_start TIMESTAMP NOT NULL,
+    week_end TIMESTAMP NOT NULL,
+    winner_user_id BIGINT REFERENCES users (id),
+    winner_receipt_id INTEGER REFERENCES receipts (id),
+    prize_amount INTEGER,
+    contact_info VARCHAR(100),
+    contact_sent BOOLEAN DEFAULT FALSE,
+    conducted_at TIMESTAMP,
+    notification_sent BOOLEAN,
+    created_at TIMESTAMP DEFAULT now()
+)
+        """
+    )
+    # Изменения из прежних скриптов add_contact_sent_to_weekly_lotteries.py
+    # и fix_winner_user_id_bigint.py
+    op.execute(
+        """
+ALTER TABLE weekly_lotteries
+    ADD COLUMN IF NOT EXISTS contact_sent BOOLEAN DEFAULT FALSE
+        """
+    )
+    op.execute(
+        """
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'weekly_lotteries' AND column_name = 'winner_user_id') <> 'bigint' THEN
+        ALTER TABLE weekly_lotteries ALTER COLUMN winner_user_id TYPE BIGINT;
+    END IF;
+END $$
+        """
+    )
+    # Таблица и настройки по умолчанию из прежнего скрипта add_promo_settings_table.py
+    op.execute(
+        """
+CREATE TABLE IF NOT EXISTS promo_settings (
+    id SERIAL PRIMARY KEY,
+    code VARCHAR(50) NOT NULL UNIQUE,
+    discount_single INTEGER NOT NULL,
+    discount_multi INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now()
+)
+        """
+    )
+    op.execute(
+        """
+INSERT INTO promo_settings (code, discount_single, discount_multi)
+SELECT 'ЛЕТО_КРАСОТЫ', 200, 500
+WHERE NOT EXISTS (SELECT 1 FROM promo_settings)
+        """
+    )
+    op.execute(
+        """
+CREATE TABLE IF NOT EXISTS admin_users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    password_hash VARCHAR(128) NOT NULL,
+    created_at TIMESTAMP DEFAULT now()
+)
+        """
+    )
+
+
+def downgrade() -> None:
+    # Базовую схему не откатываем: это удалило бы все данные
+    pass
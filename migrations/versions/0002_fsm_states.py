@@ -0,0 +1,33 @@
+"""Таблица состояний FSM
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "fsm_states",
+        sa.Column("key", sa.String(255), primary_key=True),
+        sa.Column("state", sa.String(255), nullable=True),
+        sa.Column("data", sa.Text(), nullable=False, server_default="{}"),
+        sa.Column("expires_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_fsm_states_expires_at", "fsm_states", ["expires_at"], if_not_exists=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_fsm_states_expires_at", table_name="fsm_states")
+    op.drop_table("fsm_states")
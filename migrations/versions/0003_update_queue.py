@@ -0,0 +1,47 @@
+"""Очередь апдейтов Telegram
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "update_queue",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("update_id", sa.BigInteger(), nullable=False, unique=True),
+        sa.Column("chat_id", sa.BigInteger(), nullable=True),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("locked_by", sa.String(64), nullable=True),
+        sa.Column("locked_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_update_queue_chat_active",
+        "update_queue",
+        ["chat_id", "id"],
+        postgresql_where=sa.text("status IN ('pending', 'processing')"),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_update_queue_status_id",
+        "update_queue",
+        ["status", "id"],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("update_queue")
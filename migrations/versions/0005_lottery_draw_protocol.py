@@ -0,0 +1,34 @@
+"""Протокол розыгрыша в weekly_lotteries
+
+Revision ID: 0005
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from schema_migrations import add_column_online
+
+revision = "0005"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("draw_mode", sa.String(20), nullable=True),
+    sa.Column("draw_commitment", sa.String(128), nullable=True),
+    sa.Column("ticket_set_hash", sa.String(64), nullable=True),
+    sa.Column("draw_seed", sa.String(64), nullable=True),
+    sa.Column("tickets_count", sa.Integer(), nullable=True),
+    sa.Column("tickets_weight", sa.BigInteger(), nullable=True),
+]
+
+
+def upgrade() -> None:
+    for column in COLUMNS:
+        add_column_online("weekly_lotteries", column)
+
+
+def downgrade() -> None:
+    for column in reversed(COLUMNS):
+        op.drop_column("weekly_lotteries", column.name)
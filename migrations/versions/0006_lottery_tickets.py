@@ -0,0 +1,73 @@
+"""Билеты еженедельного розыгрыша и счётчики недель
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "lottery_tickets",
+        sa.Column("id", sa.BigInteger(), primary_key=True),
+        sa.Column("week_key", sa.String(8), nullable=False),
+        sa.Column("ticket_no", sa.Integer(), nullable=False),
+        sa.Column(
+            "receipt_id",
+            sa.Integer(),
+            sa.ForeignKey("receipts.id"),
+            nullable=False,
+            unique=True,
+        ),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("weight", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("voided_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.UniqueConstraint("week_key", "ticket_no"),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "lottery_week_counters",
+        sa.Column("week_key", sa.String(8), primary_key=True),
+        sa.Column("tickets_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("active_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+
+    # Билеты для уже подтверждённых чеков: номера по порядку поступления
+    op.execute(
+        """
+        INSERT INTO lottery_tickets (week_key, ticket_no, receipt_id, user_id, weight)
+        SELECT to_char(created_at, 'IYYY-"W"IW'),
+               row_number() OVER (
+                   PARTITION BY to_char(created_at, 'IYYY-"W"IW')
+                   ORDER BY created_at, id
+               ),
+               id, user_id, items_count
+        FROM receipts
+        WHERE status = 'verified' AND items_count > 0 AND created_at IS NOT NULL
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO lottery_week_counters (week_key, tickets_count, active_count)
+        SELECT week_key, max(ticket_no), count(*) FILTER (WHERE voided_at IS NULL)
+        FROM lottery_tickets
+        GROUP BY week_key
+        ON CONFLICT (week_key) DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("lottery_week_counters")
+    op.drop_table("lottery_tickets")
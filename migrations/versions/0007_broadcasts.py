@@ -0,0 +1,63 @@
+"""Рассылки и доставки по получателям
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "broadcasts",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("kind", sa.String(30), nullable=False, server_default="admin"),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("text", sa.Text(), nullable=True),
+        sa.Column("media", sa.Text(), nullable=True),
+        sa.Column("disable_preview", sa.Boolean(), server_default=sa.false()),
+        sa.Column("total", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("sent_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("failed_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("blocked_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("runner_id", sa.String(64), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        if_not_exists=True,
+    )
+    op.create_table(
+        "broadcast_deliveries",
+        sa.Column(
+            "broadcast_id",
+            sa.Integer(),
+            sa.ForeignKey("broadcasts.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("user_id", sa.BigInteger(), primary_key=True),
+        sa.Column("status", sa.String(20), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_broadcast_deliveries_pending",
+        "broadcast_deliveries",
+        ["broadcast_id", "user_id"],
+        postgresql_where=sa.text("status = 'pending'"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("broadcast_deliveries")
+    op.drop_table("broadcasts")
@@ -0,0 +1,31 @@
+"""Кэш file_id картинок Telegram
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_files",
+        sa.Column("bot_id", sa.BigInteger(), primary_key=True),
+        sa.Column("content_hash", sa.String(64), primary_key=True),
+        sa.Column("file_id", sa.String(255), nullable=False),
+        sa.Column("file_unique_id", sa.String(64), nullable=True),
+        sa.Column("path", sa.String(500), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        sa.Column("last_used_at", sa.DateTime(), nullable=True),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("media_files")
@@ -0,0 +1,38 @@
+"""Доступность пользователей для отправки сообщений
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from schema_migrations import add_column_online, create_index_online, drop_index_online
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("blocked_at", sa.DateTime(), nullable=True),
+    sa.Column("last_delivery_ok_at", sa.DateTime(), nullable=True),
+]
+
+
+def upgrade() -> None:
+    for column in COLUMNS:
+        add_column_online("users", column)
+    # Повторная проверка берёт самых давно недоступных пользователей
+    create_index_online(
+        "ix_users_blocked_at",
+        "users",
+        ["blocked_at"],
+        postgresql_where=sa.text("blocked_at IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    drop_index_online("ix_users_blocked_at", "users")
+    for column in reversed(COLUMNS):
+        op.drop_column("users", column.name)
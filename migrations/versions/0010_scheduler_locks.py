@@ -0,0 +1,30 @@
+"""Аренда задач планировщика
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "scheduler_locks",
+        sa.Column("job_id", sa.String(64), primary_key=True),
+        sa.Column("last_slot", sa.DateTime(), nullable=False),
+        sa.Column("owner", sa.String(128), nullable=True),
+        sa.Column("locked_until", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("scheduler_locks")
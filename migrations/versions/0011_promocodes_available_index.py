@@ -0,0 +1,28 @@
+"""Частичный индекс свободных промокодов
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+
+from schema_migrations import create_index_online, drop_index_online
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Выдача промокода берёт первую строку этого индекса (SKIP LOCKED)
+    create_index_online(
+        "ix_promocodes_available",
+        "promocodes",
+        ["discount_amount", "id"],
+        postgresql_where=sa.text("is_used = false AND is_active = true"),
+    )
+
+
+def downgrade() -> None:
+    drop_index_online("ix_promocodes_available", "promocodes")
@@ -0,0 +1,32 @@
+"""Резерв промокодов процессами бота
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from schema_migrations import add_column_online, create_index_online, drop_index_online
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("leased_until", sa.DateTime(), nullable=True),
+    sa.Column("leased_by", sa.String(128), nullable=True),
+]
+
+
+def upgrade() -> None:
+    for column in COLUMNS:
+        add_column_online("promocodes", column)
+    create_index_online("ix_prizes_promocode_id", "prizes", ["promocode_id"])
+
+
+def downgrade() -> None:
+    drop_index_online("ix_prizes_promocode_id", "prizes")
+    for column in reversed(COLUMNS):
+        op.drop_column("promocodes", column.name)
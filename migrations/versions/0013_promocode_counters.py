@@ -0,0 +1,41 @@
+"""Счётчики промокодов по номиналам
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "promocode_counters",
+        sa.Column("discount_amount", sa.Integer(), primary_key=True),
+        sa.Column("total", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("used", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("available", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+    op.execute(
+        """
+        INSERT INTO promocode_counters (discount_amount, total, used, available)
+        SELECT discount_amount,
+               count(*),
+               count(*) FILTER (WHERE is_used),
+               count(*) FILTER (WHERE NOT is_used AND is_active)
+        FROM promocodes
+        GROUP BY discount_amount
+        ON CONFLICT (discount_amount) DO NOTHING
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("promocode_counters")
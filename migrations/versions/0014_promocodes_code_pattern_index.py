@@ -0,0 +1,26 @@
+"""Индекс поиска промокодов по началу кода
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19
+"""
+from schema_migrations import create_index_online, drop_index_online
+
+revision = "0014"
+down_revision = "0013"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Уникальный индекс по code не подходит для LIKE при collation, отличной от C
+    create_index_online(
+        "ix_promocodes_code_pattern",
+        "promocodes",
+        ["code"],
+        postgresql_ops={"code": "text_pattern_ops"},
+    )
+
+
+def downgrade() -> None:
+    drop_index_online("ix_promocodes_code_pattern", "promocodes")
@@ -0,0 +1,36 @@
+"""Один подарок на чек
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+from alembic import context, op
+
+from schema_migrations import create_index_online, drop_index_online
+
+revision = "0015"
+down_revision = "0014"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Повторные подарки за чек нужно разобрать вручную: промокоды уже у пользователей.
+    # В режиме --sql базы нет — дубликаты остановят само построение индекса
+    if not context.is_offline_mode():
+        duplicates = op.get_bind().execute(
+            sa.text(
+                "SELECT receipt_id FROM prizes GROUP BY receipt_id HAVING count(*) > 1 LIMIT 10"
+            )
+        ).scalars().all()
+        if duplicates:
+            raise RuntimeError(
+                f"Несколько подарков за один чек (receipt_id: {duplicates}), "
+                "уникальный индекс ux_prizes_receipt_id не создан"
+            )
+    create_index_online("ux_prizes_receipt_id", "prizes", ["receipt_id"], unique=True)
+
+
+def downgrade() -> None:
+    drop_index_online("ux_prizes_receipt_id", "prizes")
@@ -0,0 +1,33 @@
+"""Индексы списка чеков в админке
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+
+from schema_migrations import create_index_online, drop_index_online
+
+revision = "0016"
+down_revision = "0015"
+branch_labels = None
+depends_on = None
+
+# Страницы от новых к старым, чеки без даты — в конце (NULLS LAST)
+CREATED_AT_DESC = sa.text("created_at DESC NULLS LAST")
+ID_DESC = sa.text("id DESC")
+
+INDEXES = [
+    ("ix_receipts_created_at_desc_id", [CREATED_AT_DESC, ID_DESC]),
+    ("ix_receipts_status_created_at_desc_id", ["status", CREATED_AT_DESC, ID_DESC]),
+]
+
+
+def upgrade() -> None:
+    for name, columns in INDEXES:
+        create_index_online(name, "receipts", columns)
+
+
+def downgrade() -> None:
+    for name, _ in reversed(INDEXES):
+        drop_index_online(name, "receipts")
@@ -0,0 +1,34 @@
+"""Триграммный поиск по аптеке, адресу и товарам чека
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+from schema_migrations import create_index_online, drop_index_online
+
+revision = "0017"
+down_revision = "0016"
+branch_labels = None
+depends_on = None
+
+COLUMNS = ["pharmacy", "address", "aisida_items"]
+
+
+def upgrade() -> None:
+    # Нужны права на создание расширения (или расширение, созданное заранее)
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for column in COLUMNS:
+        create_index_online(
+            f"ix_receipts_{column}_trgm",
+            "receipts",
+            [column],
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    for column in reversed(COLUMNS):
+        drop_index_online(f"ix_receipts_{column}_trgm", "receipts")
@@ -0,0 +1,34 @@
+"""Индексы списка пользователей в админке
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+
+from schema_migrations import create_index_online, drop_index_online
+
+revision = "0018"
+down_revision = "0017"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # Страницы от новых к старым, пользователи без даты — в конце (NULLS LAST)
+    (
+        "ix_users_registered_at_desc_id",
+        "users",
+        [sa.text("registered_at DESC NULLS LAST"), sa.text("id DESC")],
+    ),
+    ("ix_receipts_user_id", "receipts", ["user_id"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        create_index_online(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        drop_index_online(name, table)
@@ -0,0 +1,39 @@
+"""Обязательства розыгрышей недель и раскрытый секрет в протоколе
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from schema_migrations import add_column_online
+
+revision = "0019"
+down_revision = "0018"
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    sa.Column("draw_secret", sa.String(64), nullable=True),
+    sa.Column("draw_exclusions", sa.Text(), nullable=True),
+]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "lottery_commitments",
+        sa.Column("week_key", sa.String(8), primary_key=True),
+        sa.Column("commitment", sa.String(64), nullable=False),
+        sa.Column("secret", sa.String(64), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+    for column in COLUMNS:
+        add_column_online("weekly_lotteries", column)
+
+
+def downgrade() -> None:
+    for column in reversed(COLUMNS):
+        op.drop_column("weekly_lotteries", column.name)
+    op.drop_table("lottery_commitments")
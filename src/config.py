@@ -9,9 +9,106 @@ load_dotenv()
 # Токен бота из переменных окружения
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+# Режим получения апдейтов: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Сбрасывать ли накопившиеся апдейты при запуске (по умолчанию сохраняем)
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"
+
+# Настройки webhook
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # secret_token для проверки запросов Telegram
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
 # Настройки базы данных
 DB_URL = os.getenv("DB_URL")
 
+# Миграции схемы БД (alembic)
+# При true бот сам накатывает недостающие миграции при старте,
+# иначе только проверяет, что схема на head, и отказывается запускаться
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() == "true"
+# Сколько миграция может ждать блокировку таблицы, прежде чем упасть
+# (не даём ALTER TABLE встать в очередь за долгой транзакцией и остановить трафик)
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+
+# Хранилище состояний FSM: memory (в процессе) или postgres (общее для всех процессов)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory").lower()
+# Время жизни состояния FSM с последнего изменения, секунды (0 — бессрочно)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(7 * 24 * 3600)))
+# Кэш чтения состояний FSM в процессе, секунды (0 — выключен)
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "0"))
+
+# Очередь апдейтов в Postgres: процесс приёма только сохраняет апдейты,
+# обработку ведут отдельные процессы-воркеры
+UPDATE_QUEUE_ENABLED = os.getenv("UPDATE_QUEUE_ENABLED", "false").lower() == "true"
+# Количество процессов-воркеров (0 — воркеры запускаются отдельно)
+UPDATE_WORKER_PROCESSES = int(
+    os.getenv("UPDATE_WORKER_PROCESSES", str(os.cpu_count() or 1))
+)
+# Сколько апдейтов один воркер обрабатывает одновременно
+UPDATE_WORKER_CONCURRENCY = int(os.getenv("UPDATE_WORKER_CONCURRENCY", "16"))
+# Пауза между опросами пустой очереди, секунды
+UPDATE_QUEUE_POLL_INTERVAL = float(os.getenv("UPDATE_QUEUE_POLL_INTERVAL", "0.5"))
+# Через сколько секунд апдейт упавшего воркера возвращается в очередь
+UPDATE_QUEUE_VISIBILITY_TIMEOUT = int(
+    os.getenv("UPDATE_QUEUE_VISIBILITY_TIMEOUT", "300")
+)
+# После скольких неудачных попыток апдейт помечается как failed
+UPDATE_QUEUE_MAX_ATTEMPTS = int(os.getenv("UPDATE_QUEUE_MAX_ATTEMPTS", "3"))
+
+# Ограничение нагрузки в процессе бота
+# Сколько апдейтов одного чата может стоять в очереди (остальным — «бот занят»)
+CHAT_QUEUE_LIMIT = int(os.getenv("CHAT_QUEUE_LIMIT", "5"))
+# Распознавание фото чеков: одновременно в работе и допустимая очередь
+PHOTO_CONCURRENCY = int(os.getenv("PHOTO_CONCURRENCY", str(os.cpu_count() or 1)))
+PHOTO_QUEUE_LIMIT = int(os.getenv("PHOTO_QUEUE_LIMIT", "50"))
+# Ручной ввод чека с проверкой через API
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "10"))
+API_QUEUE_LIMIT = int(os.getenv("API_QUEUE_LIMIT", "100"))
+# Остальные апдейты (меню, история, только БД)
+DB_CONCURRENCY = int(os.getenv("DB_CONCURRENCY", "50"))
+DB_QUEUE_LIMIT = int(os.getenv("DB_QUEUE_LIMIT", "500"))
+
+# Еженедельный розыгрыш
+# Режим: receipt (билет на чек), user (билет на пользователя), items (вес — число товаров)
+LOTTERY_DRAW_MODE = os.getenv("LOTTERY_DRAW_MODE", "receipt").lower()
+
+# Массовые рассылки
+# Сообщений в секунду на все чаты (лимит Telegram — около 30)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Сколько отправок выполняется одновременно
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+# Сколько раз повторять отправку при сетевых ошибках
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+# Через сколько секунд без признаков жизни рассылку подхватывает другой процесс
+BROADCAST_STALE_TIMEOUT = int(os.getenv("BROADCAST_STALE_TIMEOUT", "120"))
+
+# Недоступные пользователи (заблокировали бота)
+# Через сколько дней повторно проверять, не разблокировал ли пользователь бота
+REPROBE_AFTER_DAYS = int(os.getenv("REPROBE_AFTER_DAYS", "30"))
+# Сколько пользователей проверять за один запуск задачи
+REPROBE_BATCH = int(os.getenv("REPROBE_BATCH", "200"))
+# Проверок в секунду (чтобы не мешать рассылкам)
+REPROBE_RATE = float(os.getenv("REPROBE_RATE", "2"))
+
+# Планировщик на нескольких репликах
+# Срок аренды задачи, секунд: за это время другая реплика подхватит задачу упавшей
+SCHEDULER_LEASE_TTL = int(os.getenv("SCHEDULER_LEASE_TTL", "30"))
+
+# Локальный пул промокодов процесса
+# Сколько кодов номинала резервировать за раз (0 — выдавать напрямую из базы)
+PROMOCODE_POOL_SIZE = int(os.getenv("PROMOCODE_POOL_SIZE", "0"))
+# Срок резерва, секунд: после падения процесса невыданные коды вернутся в оборот
+PROMOCODE_LEASE_TTL = int(os.getenv("PROMOCODE_LEASE_TTL", "600"))
+# Как часто выданные коды пачкой отмечаются использованными, секунд
+PROMOCODE_CONFIRM_INTERVAL = float(os.getenv("PROMOCODE_CONFIRM_INTERVAL", "1"))
+# Вести счётчики промокодов в таблице promocode_counters (статистика без подсчёта строк)
+PROMOCODE_COUNTERS = os.getenv("PROMOCODE_COUNTERS", "true").lower() == "true"
+# Порог остатка свободных промокодов номинала, ниже которого пишется предупреждение
+PROMOCODE_LOW_STOCK = int(os.getenv("PROMOCODE_LOW_STOCK", "100"))
+
 # Временная админка (для тестов)
 ADMIN_PANEL_ENABLED = os.getenv("ADMIN_PANEL_ENABLED", "false").lower() == "true"
 
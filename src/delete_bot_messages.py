@@ -5,9 +5,7 @@
 import asyncio
 import sys
 import os
-from typing import List, Optional, Optional
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Optional, Tuple
 
 # Добавляем путь к src для импортов
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
@@ -20,8 +18,10 @@ from aiogram.exceptions import (
 )
 
 from config import BOT_TOKEN
-from database import engine
 from models.user_model import User
+from database import async_session
+from services.audience_service import audience_service, AudienceFilter
+from services.reachability_service import reachability_service
 from logger import logger
 
 
@@ -35,13 +35,24 @@ class MessageDeleter:
         self.blocked_users: List[int] = []
         self.chat_not_found_count = 0
 
-    async def get_all_users(self) -> List[User]:
-        """Получает всех пользователей из базы данных"""
-        async with AsyncSession(engine) as session:
-            result = await session.execute(select(User))
-            users = result.scalars().all()
-            logger.info(f"Найдено пользователей в БД: {len(users)}")
-            return list(users)
+    async def count_users(self) -> int:
+        """Количество пользователей в базе данных"""
+        count = await audience_service.count(AudienceFilter())
+        logger.info(f"Найдено пользователей в БД: {count}")
+        return count
+
+    async def iter_users(self) -> AsyncIterator[Tuple[int, Optional[str]]]:
+        """
+        Пользователи из базы данных: (id, username)
+
+        Читаются страницами по id, каждая в своей короткой сессии:
+        обход идёт часами, и транзакция между пачками не держится.
+        """
+        async for chunk in audience_service.iter_pages(
+            AudienceFilter(), User.id, User.username
+        ):
+            for user_id, username in chunk:
+                yield user_id, username
 
     async def check_chat_availability(self, chat_id: int) -> bool:
         """
@@ -535,9 +546,9 @@ class MessageDeleter:
             message_ids: Конкретные ID сообщений для удаления
             message_id_range: Кортеж (start_id, end_id) для поиска сообщений
         """
-        users = await self.get_all_users()
+        total = await self.count_users()
 
-        logger.info(f"🚀 Начинаем обработку {len(users)} пользователей")
+        logger.info(f"🚀 Начинаем обработку {total} пользователей")
 
         if search_text and message_id_range:
             logger.info(
@@ -550,13 +561,14 @@ class MessageDeleter:
             logger.error("❌ Не указан режим работы!")
             return
 
-        for i, user in enumerate(users, 1):
+        i = 0
+        async for user_id, username in self.iter_users():
+            i += 1
             logger.info(
-                f"👤 [{i}/{len(users)}] Обработка пользователя {user.id} (@{user.username})"
+                f"👤 [{i}/{total}] Обработка пользователя {user_id} (@{username})"
             )
 
             # Быстрая проверка доступности чата
-            user_id = int(user.id)  # Явное приведение типа для избежания ошибок линтера
             if not await self.check_chat_availability(user_id):
                 logger.info(f"⏭️ Пропускаем пользователя {user_id} (чат недоступен)")
                 continue
@@ -579,6 +591,11 @@ class MessageDeleter:
                 logger.error(f"❌ Ошибка при обработке пользователя {user_id}: {e}")
                 continue
 
+        # Недоступные чаты запоминаем в базе: рассылки их пропускают
+        async with async_session() as session:
+            await reachability_service.mark_blocked(session, self.blocked_users)
+            await session.commit()
+
         # Выводим статистику
         logger.info("\n" + "=" * 50)
         logger.info("📊 ИТОГОВАЯ СТАТИСТИКА:")
@@ -0,0 +1,164 @@
+"""
+Хранилище FSM aiogram в Postgres
+
+Состояние и данные чата хранятся одной строкой в таблице fsm_states,
+каждое изменение — один upsert. Благодаря этому несколько процессов бота
+видят общее состояние, а рестарт не сбрасывает незавершённую регистрацию чека.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from sqlalchemy import delete, select, or_, and_
+from sqlalchemy.dialects.postgresql import insert
+
+from database import async_session
+from models.fsm_state_model import FSMState
+from logger import logger
+
+
+class PostgresStorage(BaseStorage):
+    """Хранилище FSM на базе таблицы fsm_states"""
+
+    def __init__(
+        self,
+        session_factory=async_session,
+        key_builder: Optional[KeyBuilder] = None,
+        ttl: Optional[int] = None,
+        cache_ttl: float = 0,
+    ) -> None:
+        """
+        Args:
+            session_factory: Фабрика сессий SQLAlchemy
+            key_builder: Построитель ключей (по умолчанию DefaultKeyBuilder с bot_id)
+            ttl: Время жизни записи в секундах после последнего изменения (None — бессрочно)
+            cache_ttl: Время жизни кэша чтения в процессе, секунды (0 — кэш выключен).
+                Включайте, только если апдейты одного чата всегда обрабатывает один процесс
+        """
+        self.session_factory = session_factory
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True)
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        # key -> (момент устаревания, state, data)
+        self._cache: Dict[str, Tuple[float, Optional[str], Dict[str, Any]]] = {}
+
+    def _expires_at(self) -> Optional[datetime]:
+        if not self.ttl:
+            return None
+        return datetime.now() + timedelta(seconds=self.ttl)
+
+    def _cache_get(self, key: str) -> Optional[Tuple[Optional[str], Dict[str, Any]]]:
+        if not self.cache_ttl:
+            return None
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        expires, state, data = cached
+        if expires < time.monotonic():
+            self._cache.pop(key, None)
+            return None
+        return state, data
+
+    def _cache_put(
+        self, key: str, state: Optional[str], data: Dict[str, Any]
+    ) -> None:
+        if self.cache_ttl:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, state, data)
+
+    async def _load(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Читает состояние и данные одним запросом (с учётом TTL и кэша)"""
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(FSMState.state, FSMState.data).where(
+                    and_(
+                        FSMState.key == key,
+                        or_(
+                            FSMState.expires_at.is_(None),
+                            FSMState.expires_at > datetime.now(),
+                        ),
+                    )
+                )
+            )
+            row = result.first()
+
+        if row is None:
+            state, data = None, {}
+        else:
+            state, data = row.state, json.loads(row.data or "{}")
+        self._cache_put(key, state, data)
+        return state, data
+
+    async def _upsert(self, key: str, **values: Any) -> None:
+        values["expires_at"] = self._expires_at()
+        stmt = insert(FSMState).values(key=key, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FSMState.key],
+            set_={**values, "updated_at": datetime.now()},
+        )
+        async with self.session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        state_value = state.state if isinstance(state, State) else state
+        await self._upsert(storage_key, state=state_value)
+
+        cached = self._cache_get(storage_key)
+        if cached is not None:
+            self._cache_put(storage_key, state_value, cached[1])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        data = dict(data)
+        await self._upsert(storage_key, data=json.dumps(data, ensure_ascii=False))
+
+        cached = self._cache_get(storage_key)
+        if cached is not None:
+            self._cache_put(storage_key, cached[0], data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return data.copy()
+
+    async def purge_expired(self) -> int:
+        """
+        Удаляет устаревшие и пустые записи
+
+        Returns:
+            int: Количество удалённых записей
+        """
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(FSMState).where(
+                    or_(
+                        FSMState.expires_at < datetime.now(),
+                        and_(FSMState.state.is_(None), FSMState.data == "{}"),
+                    )
+                )
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info(f"Удалено устаревших записей FSM: {result.rowcount}")
+        return result.rowcount
+
+    async def close(self) -> None:
+        self._cache.clear()
@@ -1,9 +1,11 @@
 from aiogram import Router, F
-from aiogram.types import CopyTextButton, Message, CallbackQuery, FSInputFile
+from aiogram.types import CopyTextButton, Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.user_model import User
+from services.media_cache_service import media_cache_service
+from services.reachability_service import reachability_service
 from logger import logger
 
 # Создаем роутер для базовых команд
@@ -59,13 +61,17 @@ async def cmd_start(message: Message, session: AsyncSession):
         "Нажмите <b>«Зарегистрировать покупку»</b> или откройте <b>«Меню»</b> для подробностей.\n"
         "👇👇👇"
     )
-    photo = FSInputFile("data/pics/start.png")
-    await message.answer_photo(
-        photo=photo,
+    await media_cache_service.send_photo(
+        message.bot,
+        message.chat.id,
+        "data/pics/start.png",
         caption=message_text,
         reply_markup=get_start_keyboard(),
         parse_mode="HTML",
     )
+    # Пользователь снова пишет боту — значит, бот не заблокирован
+    await reachability_service.mark_reachable(session, message.from_user.id)
+    await session.commit()
 
 
 @router.message(Command("help"))
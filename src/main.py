@@ -7,11 +7,24 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.strategy import FSMStrategy
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import BOT_TOKEN
-from database import engine, Base, get_session
-
-# Импортируем все модели, чтобы SQLAlchemy создал таблицы
-from models import User, Receipt, Prize, WeeklyLottery, Promocode, PromoSetting
+from config import (
+    BOT_TOKEN,
+    BOT_MODE,
+    DROP_PENDING_UPDATES,
+    FSM_STORAGE,
+    FSM_STATE_TTL,
+    FSM_CACHE_TTL,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS,
+    UPDATE_QUEUE_ENABLED,
+    UPDATE_WORKER_PROCESSES,
+)
+from database import engine, get_session
+from schema_migrations import ensure_schema_at_head
 from handlers import (
     register_base_handlers,
     register_registration_handlers,
@@ -21,26 +34,47 @@ from handlers import (
 from logger import logger
 from handlers.registration_handler import register_user
 from services.scheduler_service import lottery_scheduler
+from services.promocode_pool_service import promocode_pool
+from fsm_storage import PostgresStorage
+from middlewares import ChatSerializationMiddleware
+from webhook import WebhookIngestor, create_aiohttp_app, create_fastapi_router
+from update_queue import (
+    QueueWebhookIngestor,
+    poll_into_queue,
+    start_worker_processes,
+    stop_worker_processes,
+)
+
+
+def create_fsm_storage():
+    """
+    Создаёт хранилище FSM согласно настройке FSM_STORAGE
+    """
+    if FSM_STORAGE == "postgres":
+        logger.info("Состояния FSM хранятся в Postgres")
+        return PostgresStorage(ttl=FSM_STATE_TTL or None, cache_ttl=FSM_CACHE_TTL)
+    return MemoryStorage()
 
 
-async def on_startup(bot: Bot) -> None:
+async def on_startup(bot: Bot, dispatcher: Dispatcher) -> None:
     """
     Выполняется при запуске бота
     """
     logger.info("Бот запущен")
 
-    # Создаем таблицы в базе данных
-    async with engine.begin() as conn:
-        # await conn.run_sync(Base.metadata.drop_all)  # Раскомментировать для сброса БД
-        await conn.run_sync(Base.metadata.create_all)
-
-    logger.info("Таблицы в базе данных созданы")
+    # Проверяем, что схема БД на последней миграции (alembic upgrade head)
+    await ensure_schema_at_head(engine)
 
     # Запускаем планировщик еженедельных розыгрышей
     lottery_scheduler.bot = bot
+    if isinstance(dispatcher.storage, PostgresStorage):
+        lottery_scheduler.fsm_storage = dispatcher.storage
     lottery_scheduler.start_scheduler()
     logger.info("Планировщик еженедельных розыгрышей запущен")
 
+    # Обязательство следующей недели публикуем сразу, не дожидаясь задачи планировщика
+    await lottery_scheduler.commit_lottery_week_job()
+
 
 async def on_shutdown(bot: Bot) -> None:
     """
@@ -50,23 +84,33 @@ async def on_shutdown(bot: Bot) -> None:
     lottery_scheduler.stop_scheduler()
     logger.info("Планировщик остановлен")
 
+    # Сохраняем выданные промокоды и возвращаем зарезервированные в оборот
+    if promocode_pool.enabled:
+        await promocode_pool.close()
+
     logger.info("Бот остановлен")
 
 
-async def main() -> None:
+def create_bot() -> Bot:
     """
-    Точка входа в приложение
+    Создаёт экземпляр бота
     """
-    # Проверяем наличие токена
-    if not BOT_TOKEN:
-        logger.error(
-            "Токен бота не найден. Убедитесь, что переменная окружения BOT_TOKEN установлена."
-        )
-        return
+    return Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
-    # Создаем экземпляр бота и диспетчера
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher(storage=MemoryStorage(), fsm_strategy=FSMStrategy.CHAT)
+
+def create_dispatcher(shed_load: bool = True) -> Dispatcher:
+    """
+    Создаёт диспетчер с middleware, хендлерами и обработчиками запуска/остановки
+
+    Args:
+        shed_load: Отвечать «большая нагрузка» при переполнении очередей
+            (в воркерах очереди апдейтов — False, см. middlewares.py)
+    """
+    dp = Dispatcher(storage=create_fsm_storage(), fsm_strategy=FSMStrategy.CHAT)
+
+    # Апдейты чата — по одному, общая нагрузка — в пределах лимитов
+    # (состояние чата перечитывается после ожидания своей очереди)
+    dp.update.outer_middleware(ChatSerializationMiddleware(shed=shed_load))
 
     # Регистрируем middleware для работы с базой данных
     @dp.update.middleware()
@@ -93,11 +137,151 @@ async def main() -> None:
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
+    return dp
+
+
+async def setup_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Регистрирует webhook в Telegram
+    """
+    if not WEBHOOK_BASE_URL or not WEBHOOK_SECRET:
+        raise RuntimeError(
+            "Для режима webhook нужны переменные WEBHOOK_BASE_URL и WEBHOOK_SECRET"
+        )
+    await bot.set_webhook(
+        url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=DROP_PENDING_UPDATES,
+    )
+    logger.info(f"Webhook установлен: {WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}")
+
+
+def create_ingestor(bot: Bot, dp: Dispatcher) -> WebhookIngestor:
+    """
+    Создаёт приёмник webhook: с очередью апдейтов или с обработкой в процессе
+    """
+    if UPDATE_QUEUE_ENABLED:
+        return QueueWebhookIngestor(bot, dp, WEBHOOK_SECRET)
+    return WebhookIngestor(bot, dp, WEBHOOK_SECRET)
+
+
+def start_update_workers() -> list:
+    """
+    Запускает процессы-воркеры очереди апдейтов (если очередь включена)
+    """
+    if not UPDATE_QUEUE_ENABLED or UPDATE_WORKER_PROCESSES <= 0:
+        return []
+    if FSM_STORAGE != "postgres":
+        logger.warning(
+            "Очередь апдейтов с несколькими воркерами требует FSM_STORAGE=postgres, "
+            "иначе состояния чатов не будут общими"
+        )
+    return start_worker_processes(UPDATE_WORKER_PROCESSES)
+
+
+async def run_polling(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Запускает бота в режиме long polling
+    """
+    # Очередь накопившихся апдейтов сохраняем, если не задано иное
+    await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+    if not UPDATE_QUEUE_ENABLED:
+        await dp.start_polling(bot)
+        return
+
+    # Апдейты складываются в очередь, обрабатывают их процессы-воркеры
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+    workers = start_update_workers()
+    try:
+        await poll_into_queue(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await asyncio.to_thread(stop_worker_processes, workers)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Запускает бота в режиме webhook на отдельном aiohttp-сервере
+    """
+    from aiohttp import web
+
+    ingestor = create_ingestor(bot, dp)
+    app = create_aiohttp_app(ingestor, WEBHOOK_PATH)
+    runner = web.AppRunner(app)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+    workers = start_update_workers()
+    try:
+        await setup_webhook(bot, dp)
+        await runner.setup()
+        site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+        await site.start()
+        logger.info(f"Сервер webhook слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}")
+        # Работаем до остановки процесса
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await ingestor.wait_closed()
+        await asyncio.to_thread(stop_worker_processes, workers)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+
+
+def create_webhook_asgi_app():
+    """
+    Фабрика ASGI-приложения для приёма webhook через uvicorn:
+
+        uvicorn main:create_webhook_asgi_app --factory --app-dir src
+    """
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    ingestor = create_ingestor(bot, dp)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await dp.emit_startup(bot=bot, dispatcher=dp, bots=[bot])
+        workers = start_update_workers()
+        await setup_webhook(bot, dp)
+        try:
+            yield
+        finally:
+            await ingestor.wait_closed()
+            await asyncio.to_thread(stop_worker_processes, workers)
+            await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=[bot])
+            await dp.storage.close()
+            await bot.session.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(create_fastapi_router(ingestor, WEBHOOK_PATH))
+    return app
+
+
+async def main() -> None:
+    """
+    Точка входа в приложение
+    """
+    # Проверяем наличие токена
+    if not BOT_TOKEN:
+        logger.error(
+            "Токен бота не найден. Убедитесь, что переменная окружения BOT_TOKEN установлена."
+        )
+        return
+
+    # Создаем экземпляр бота и диспетчера
+    bot = create_bot()
+    dp = create_dispatcher()
+
     # Запускаем бота
     try:
-        logger.info("Запуск бота...")
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        logger.info(f"Запуск бота (режим {BOT_MODE})...")
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {str(e)}")
     finally:
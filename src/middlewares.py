@@ -0,0 +1,177 @@
+"""
+Middleware диспетчера: очередь апдейтов каждого чата и ограничение нагрузки
+
+ChatSerializationMiddleware обрабатывает апдейты одного чата строго по одному
+в порядке поступления (три фото чека подряд не гоняются за одним состоянием FSM),
+а общее число одновременно выполняемых хендлеров ограничивает семафорами
+по классам нагрузки:
+
+    photo — распознавание фото чека (OpenCV, pyzbar) и проверка через API
+    api   — ручной ввод чека с проверкой через API
+    db    — всё остальное (меню, история, статистика)
+
+Если очередь чата или класса переполнена, апдейт не ставится в ожидание:
+пользователь сразу получает ответ «сейчас большая нагрузка». В воркерах
+очереди апдейтов (shed=False) апдейты не отбрасываются: нагрузку там
+сдерживает сама очередь, а отброшенный апдейт был бы удалён из неё
+как обработанный.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import (
+    CHAT_QUEUE_LIMIT,
+    PHOTO_CONCURRENCY,
+    PHOTO_QUEUE_LIMIT,
+    API_CONCURRENCY,
+    API_QUEUE_LIMIT,
+    DB_CONCURRENCY,
+    DB_QUEUE_LIMIT,
+)
+from logger import logger
+
+BUSY_MESSAGE = "⏳ Сейчас очень много запросов. Пожалуйста, попробуйте через минуту."
+
+# Состояния FSM, в которых сообщение уходит на проверку в API
+API_STATES = {"ReceiptStates:waiting_for_fn"}
+
+
+@dataclass
+class _ChatQueue:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    size: int = 0  # Апдейты чата в ожидании и в работе
+
+
+@dataclass
+class _LoadClass:
+    semaphore: asyncio.Semaphore
+    limit: int  # Сколько апдейтов класса выполняется одновременно
+    queue_limit: int  # Сколько апдейтов может ждать свободного слота
+    size: int = 0  # Апдейты класса в ожидании и в работе
+
+
+def classify_update(update: Update, raw_state: Optional[str]) -> str:
+    """
+    Определяет класс нагрузки апдейта
+
+    Args:
+        update: Апдейт Telegram
+        raw_state: Текущее состояние FSM чата
+
+    Returns:
+        str: photo, api или db
+    """
+    message = update.message
+    if message is not None:
+        if message.photo:
+            return "photo"
+        if raw_state in API_STATES:
+            return "api"
+    return "db"
+
+
+class ChatSerializationMiddleware(BaseMiddleware):
+    """Последовательная обработка апдейтов чата и ограничение нагрузки"""
+
+    def __init__(
+        self,
+        chat_queue_limit: int = CHAT_QUEUE_LIMIT,
+        limits: Optional[Dict[str, tuple]] = None,
+        shed: bool = True,
+    ) -> None:
+        """
+        Args:
+            chat_queue_limit: Сколько апдейтов одного чата может быть в очереди
+            limits: Класс нагрузки -> (одновременно в работе, допустимая очередь)
+            shed: Отвечать «большая нагрузка» при переполнении (False — ждать)
+        """
+        limits = limits or {
+            "photo": (PHOTO_CONCURRENCY, PHOTO_QUEUE_LIMIT),
+            "api": (API_CONCURRENCY, API_QUEUE_LIMIT),
+            "db": (DB_CONCURRENCY, DB_QUEUE_LIMIT),
+        }
+        self.chat_queue_limit = chat_queue_limit
+        self.shed = shed
+        self.classes = {
+            name: _LoadClass(
+                semaphore=asyncio.Semaphore(concurrency),
+                limit=concurrency,
+                queue_limit=queue_limit,
+            )
+            for name, (concurrency, queue_limit) in limits.items()
+        }
+        self._chats: Dict[int, _ChatQueue] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        chat_id = chat.id if chat else (user.id if user else None)
+        if chat_id is None:
+            return await self._run(handler, event, data)
+
+        chat_queue = self._chats.get(chat_id)
+        if (
+            self.shed
+            and chat_queue is not None
+            and chat_queue.size >= self.chat_queue_limit
+        ):
+            await self._answer_busy(event)
+            return None
+        if chat_queue is None:
+            chat_queue = self._chats[chat_id] = _ChatQueue()
+
+        chat_queue.size += 1
+        try:
+            # asyncio.Lock будит ожидающих в порядке очереди
+            async with chat_queue.lock:
+                # FSM middleware прочитал состояние до того, как апдейт дождался
+                # своей очереди: предыдущий апдейт чата мог его изменить
+                state = data.get("state")
+                if state is not None:
+                    data["raw_state"] = await state.get_state()
+                return await self._run(handler, event, data)
+        finally:
+            chat_queue.size -= 1
+            if chat_queue.size == 0:
+                self._chats.pop(chat_id, None)
+
+    async def _run(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Выполняет хендлер в слоте своего класса нагрузки"""
+        load = self.classes[classify_update(event, data.get("raw_state"))]
+        if self.shed and load.size >= load.limit + load.queue_limit:
+            await self._answer_busy(event)
+            return None
+
+        load.size += 1
+        try:
+            async with load.semaphore:
+                return await handler(event, data)
+        finally:
+            load.size -= 1
+
+    @staticmethod
+    async def _answer_busy(update: Update) -> None:
+        """Сразу отвечает пользователю, что бот перегружен"""
+        logger.warning(f"Апдейт {update.update_id} отклонён: очередь переполнена")
+        try:
+            if update.callback_query is not None:
+                await update.callback_query.answer(BUSY_MESSAGE, show_alert=True)
+            elif update.message is not None:
+                await update.message.answer(BUSY_MESSAGE)
+        except Exception as e:
+            logger.error(f"Не удалось отправить сообщение о нагрузке: {str(e)}")
@@ -3,6 +3,31 @@ from .receipt_model import Receipt
 from .prize_model import Prize
 from .weekly_lottery_model import WeeklyLottery
 from .promocode_model import Promocode
+from .promocode_counter_model import PromocodeCounter
 from .promo_setting_model import PromoSetting
+from .fsm_state_model import FSMState
+from .update_queue_model import QueuedUpdate
+from .lottery_ticket_model import LotteryTicket, LotteryWeekCounter
+from .lottery_commitment_model import LotteryCommitment
+from .broadcast_model import Broadcast, BroadcastDelivery
+from .media_file_model import MediaFile
+from .scheduler_lock_model import SchedulerLock
 
-__all__ = ["User", "Receipt", "Prize", "WeeklyLottery", "Promocode", "PromoSetting"]
+__all__ = [
+    "User",
+    "Receipt",
+    "Prize",
+    "WeeklyLottery",
+    "Promocode",
+    "PromocodeCounter",
+    "PromoSetting",
+    "FSMState",
+    "QueuedUpdate",
+    "LotteryTicket",
+    "LotteryWeekCounter",
+    "LotteryCommitment",
+    "Broadcast",
+    "BroadcastDelivery",
+    "MediaFile",
+    "SchedulerLock",
+]
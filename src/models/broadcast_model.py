@@ -0,0 +1,72 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    String,
+    DateTime,
+    Boolean,
+    ForeignKey,
+    Text,
+    Index,
+    text,
+)
+from sqlalchemy.sql import func
+from database import Base
+
+
+class Broadcast(Base):
+    """Массовая рассылка"""
+
+    __tablename__ = "broadcasts"
+
+    id = Column(Integer, primary_key=True)  # ID рассылки
+    kind = Column(String(30), nullable=False, default="admin")  # Источник (admin/lottery)
+    status = Column(
+        String(20), nullable=False, default="pending"
+    )  # Статус (pending/running/done/failed)
+    text = Column(Text, nullable=True)  # Текст (HTML)
+    media = Column(Text, nullable=True)  # JSON списка путей к картинкам
+    disable_preview = Column(Boolean, default=False)  # Отключить предпросмотр ссылок
+    total = Column(Integer, nullable=False, default=0)  # Получателей всего
+    sent_count = Column(Integer, nullable=False, default=0)  # Доставлено
+    failed_count = Column(Integer, nullable=False, default=0)  # Ошибок
+    blocked_count = Column(Integer, nullable=False, default=0)  # Бот заблокирован
+    runner_id = Column(String(64), nullable=True)  # Процесс, который ведёт рассылку
+    heartbeat_at = Column(DateTime, nullable=True)  # Последний признак жизни процесса
+    error = Column(Text, nullable=True)  # Ошибка, остановившая рассылку
+    created_at = Column(DateTime, server_default=func.now())  # Дата создания
+    started_at = Column(DateTime, nullable=True)  # Начало отправки
+    finished_at = Column(DateTime, nullable=True)  # Окончание отправки
+
+    def __repr__(self):
+        return f"<Broadcast(id={self.id}, status={self.status}, total={self.total})>"
+
+
+class BroadcastDelivery(Base):
+    """Доставка рассылки одному получателю"""
+
+    __tablename__ = "broadcast_deliveries"
+
+    broadcast_id = Column(
+        Integer, ForeignKey("broadcasts.id", ondelete="CASCADE"), primary_key=True
+    )  # Рассылка
+    user_id = Column(BigInteger, primary_key=True)  # Получатель
+    status = Column(
+        String(20), nullable=False, default="pending"
+    )  # Статус (pending/sent/failed/blocked)
+    attempts = Column(Integer, nullable=False, default=0)  # Количество попыток
+    error = Column(Text, nullable=True)  # Текст последней ошибки
+    sent_at = Column(DateTime, nullable=True)  # Время доставки
+
+    __table_args__ = (
+        # Продолжение рассылки с места остановки
+        Index(
+            "ix_broadcast_deliveries_pending",
+            "broadcast_id",
+            "user_id",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<BroadcastDelivery(broadcast_id={self.broadcast_id}, user_id={self.user_id}, status={self.status})>"
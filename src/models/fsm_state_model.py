@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, DateTime, Text, Index
+from sqlalchemy.sql import func
+from database import Base
+
+
+class FSMState(Base):
+    """Состояние FSM aiogram (одна строка на ключ чата/пользователя)"""
+
+    __tablename__ = "fsm_states"
+
+    key = Column(String(255), primary_key=True)  # Ключ хранилища aiogram
+    state = Column(String(255), nullable=True)  # Текущее состояние
+    data = Column(Text, nullable=False, server_default="{}")  # Данные FSM в JSON
+    expires_at = Column(DateTime, nullable=True)  # Когда запись устаревает (TTL)
+    updated_at = Column(
+        DateTime, server_default=func.now(), onupdate=func.now()
+    )  # Дата последнего изменения
+
+    __table_args__ = (Index("ix_fsm_states_expires_at", "expires_at"),)
+
+    def __repr__(self):
+        return f"<FSMState(key={self.key}, state={self.state})>"
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, DateTime
+from sqlalchemy.sql import func
+from database import Base
+
+
+class LotteryCommitment(Base):
+    """Обязательство розыгрыша недели (публикуется до начала недели)"""
+
+    __tablename__ = "lottery_commitments"
+
+    week_key = Column(String(8), primary_key=True)  # ISO-неделя, например 2026-W42
+    commitment = Column(String(64), nullable=False)  # SHA-256 секрета (публикуется)
+    secret = Column(String(64), nullable=False)  # Секрет (раскрывается при розыгрыше)
+    created_at = Column(DateTime, server_default=func.now())  # Дата публикации
+
+    def __repr__(self):
+        return f"<LotteryCommitment(week_key={self.week_key}, commitment={self.commitment})>"
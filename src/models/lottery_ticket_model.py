@@ -0,0 +1,49 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    String,
+    DateTime,
+    ForeignKey,
+    UniqueConstraint,
+)
+from sqlalchemy.sql import func
+from database import Base
+
+
+class LotteryTicket(Base):
+    """Билет еженедельного розыгрыша (выдаётся при подтверждении чека)"""
+
+    __tablename__ = "lottery_tickets"
+
+    id = Column(BigInteger, primary_key=True)  # ID билета
+    week_key = Column(String(8), nullable=False)  # ISO-неделя чека, например 2026-W42
+    ticket_no = Column(Integer, nullable=False)  # Номер билета в неделе: 1..N без пропусков
+    receipt_id = Column(
+        Integer, ForeignKey("receipts.id"), nullable=False, unique=True
+    )  # Чек
+    user_id = Column(BigInteger, nullable=False)  # Владелец чека
+    weight = Column(Integer, nullable=False, default=1)  # Вес (количество товаров «Айсида»)
+    voided_at = Column(DateTime, nullable=True)  # Когда билет аннулирован (чек отклонён)
+    created_at = Column(DateTime, server_default=func.now())  # Дата выдачи
+
+    __table_args__ = (UniqueConstraint("week_key", "ticket_no"),)
+
+    def __repr__(self):
+        return f"<LotteryTicket(week_key={self.week_key}, ticket_no={self.ticket_no}, receipt_id={self.receipt_id})>"
+
+
+class LotteryWeekCounter(Base):
+    """Счётчики билетов недели"""
+
+    __tablename__ = "lottery_week_counters"
+
+    week_key = Column(String(8), primary_key=True)  # ISO-неделя
+    tickets_count = Column(Integer, nullable=False, default=0)  # Выдано номеров (N)
+    active_count = Column(Integer, nullable=False, default=0)  # Действующих билетов
+    updated_at = Column(
+        DateTime, server_default=func.now(), onupdate=func.now()
+    )  # Дата изменения
+
+    def __repr__(self):
+        return f"<LotteryWeekCounter(week_key={self.week_key}, tickets_count={self.tickets_count}, active_count={self.active_count})>"
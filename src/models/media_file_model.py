@@ -0,0 +1,20 @@
+from sqlalchemy import Column, BigInteger, String, DateTime
+from sqlalchemy.sql import func
+from database import Base
+
+
+class MediaFile(Base):
+    """file_id загруженной в Telegram картинки (чтобы не загружать её повторно)"""
+
+    __tablename__ = "media_files"
+
+    bot_id = Column(BigInteger, primary_key=True)  # file_id действителен только для своего бота
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 содержимого файла
+    file_id = Column(String(255), nullable=False)  # file_id в Telegram
+    file_unique_id = Column(String(64), nullable=True)  # Постоянный ID файла в Telegram
+    path = Column(String(500), nullable=True)  # Путь, с которого файл загружался
+    created_at = Column(DateTime, server_default=func.now())  # Дата загрузки
+    last_used_at = Column(DateTime, nullable=True)  # Последнее использование
+
+    def __repr__(self):
+        return f"<MediaFile(bot_id={self.bot_id}, content_hash={self.content_hash[:12]}, path={self.path})>"
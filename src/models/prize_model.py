@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -29,5 +29,12 @@ class Prize(Base):
     receipt = relationship("Receipt", backref="prizes")
     promocode = relationship("Promocode", backref="prizes")
 
+    __table_args__ = (
+        # Проверка, что зарезервированный код уже выдан (после сбоя процесса)
+        Index("ix_prizes_promocode_id", "promocode_id"),
+        # Не больше одного подарка за чек (ON CONFLICT при выдаче)
+        Index("ux_prizes_receipt_id", "receipt_id", unique=True),
+    )
+
     def __repr__(self):
         return f"<Prize(id={self.id}, type={self.type}, receipt_id={self.receipt_id})>"
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, DateTime
+from sqlalchemy.sql import func
+from database import Base
+
+
+class PromocodeCounter(Base):
+    """Счётчики промокодов одного номинала (обновляются вместе с промокодами)"""
+
+    __tablename__ = "promocode_counters"
+
+    discount_amount = Column(Integer, primary_key=True)  # Размер скидки в рублях
+    total = Column(Integer, nullable=False, default=0)  # Всего промокодов
+    used = Column(Integer, nullable=False, default=0)  # Использованных
+    available = Column(Integer, nullable=False, default=0)  # Свободных и активных
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())  # Дата изменения
+
+    def __repr__(self):
+        return f"<PromocodeCounter(discount_amount={self.discount_amount}, total={self.total}, available={self.available})>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, text
 from sqlalchemy.sql import func
 from database import Base
 
@@ -19,6 +19,24 @@ class Promocode(Base):
     )  # Активен ли промокод (для деактивации админом)
     created_at = Column(DateTime, server_default=func.now())  # Дата создания
     used_at = Column(DateTime, nullable=True)  # Дата использования
+    leased_until = Column(DateTime, nullable=True)  # До какого времени код зарезервирован процессом
+    leased_by = Column(String(128), nullable=True)  # Процесс, зарезервировавший код
+
+    __table_args__ = (
+        # Выдача промокода: первый свободный код нужного номинала
+        Index(
+            "ix_promocodes_available",
+            "discount_amount",
+            "id",
+            postgresql_where=text("is_used = false AND is_active = true"),
+        ),
+        # Поиск по началу промокода в админке (LIKE 'префикс%' при любой collation)
+        Index(
+            "ix_promocodes_code_pattern",
+            "code",
+            postgresql_ops={"code": "text_pattern_ops"},
+        ),
+    )
 
     def __repr__(self):
         return f"<Promocode(id={self.id}, code={self.code}, discount_amount={self.discount_amount}, is_used={self.is_used})>"
@@ -7,6 +7,8 @@ from sqlalchemy import (
     Numeric,
     ForeignKey,
     Text,
+    Index,
+    text,
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -41,5 +43,33 @@ class Receipt(Base):
     # Отношение к пользователю
     user = relationship("User", backref="receipts")
 
+    __table_args__ = (
+        # Чеки пользователя (количество чеков в списке пользователей, сегменты рассылок)
+        Index("ix_receipts_user_id", "user_id"),
+        # Список чеков в админке: страницы по (created_at, id) от новых к старым,
+        # чеки без даты — в конце, в том числе по статусу
+        Index(
+            "ix_receipts_created_at_desc_id",
+            text("created_at DESC NULLS LAST"),
+            text("id DESC"),
+        ),
+        Index(
+            "ix_receipts_status_created_at_desc_id",
+            "status",
+            text("created_at DESC NULLS LAST"),
+            text("id DESC"),
+        ),
+        # Поиск подстроки в админке (расширение pg_trgm)
+        *(
+            Index(
+                f"ix_receipts_{column}_trgm",
+                column,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+            for column in ("pharmacy", "address", "aisida_items")
+        ),
+    )
+
     def __repr__(self):
         return f"<Receipt(id={self.id}, user_id={self.user_id}, status={self.status})>"
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, DateTime
+from database import Base
+
+
+class SchedulerLock(Base):
+    """Аренда задачи планировщика: запуск задачи выполняет только одна реплика"""
+
+    __tablename__ = "scheduler_locks"
+
+    job_id = Column(String(64), primary_key=True)  # ID задачи планировщика
+    last_slot = Column(DateTime, nullable=False)  # Минута последнего взятого запуска
+    owner = Column(String(128), nullable=True)  # Реплика, выполняющая задачу
+    locked_until = Column(DateTime, nullable=False)  # До какого времени действует аренда
+    started_at = Column(DateTime, nullable=True)  # Начало последнего выполнения
+    finished_at = Column(DateTime, nullable=True)  # Окончание последнего выполнения
+
+    def __repr__(self):
+        return f"<SchedulerLock(job_id={self.job_id}, owner={self.owner}, locked_until={self.locked_until})>"
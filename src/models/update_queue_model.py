@@ -0,0 +1,45 @@
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    String,
+    DateTime,
+    Text,
+    Index,
+    text,
+)
+from sqlalchemy.sql import func
+from database import Base
+
+
+class QueuedUpdate(Base):
+    """Сырой апдейт Telegram в очереди на обработку воркерами"""
+
+    __tablename__ = "update_queue"
+
+    id = Column(BigInteger, primary_key=True)  # Порядковый номер в очереди
+    update_id = Column(BigInteger, nullable=False, unique=True)  # update_id Telegram
+    chat_id = Column(BigInteger, nullable=True)  # Чат (для порядка обработки)
+    payload = Column(Text, nullable=False)  # JSON апдейта
+    status = Column(
+        String(20), nullable=False, default="pending"
+    )  # Статус (pending/processing/failed)
+    attempts = Column(Integer, nullable=False, default=0)  # Количество попыток
+    locked_by = Column(String(64), nullable=True)  # Воркер, взявший апдейт
+    locked_at = Column(DateTime, nullable=True)  # Когда апдейт взят в работу
+    last_error = Column(Text, nullable=True)  # Последняя ошибка обработки
+    created_at = Column(DateTime, server_default=func.now())  # Дата поступления
+
+    __table_args__ = (
+        # Поиск более ранних незавершённых апдейтов того же чата
+        Index(
+            "ix_update_queue_chat_active",
+            "chat_id",
+            "id",
+            postgresql_where=text("status IN ('pending', 'processing')"),
+        ),
+        Index("ix_update_queue_status_id", "status", "id"),
+    )
+
+    def __repr__(self):
+        return f"<QueuedUpdate(id={self.id}, update_id={self.update_id}, status={self.status})>"
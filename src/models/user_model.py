@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, String, DateTime
+from sqlalchemy import Column, BigInteger, String, DateTime, Index, text
 from sqlalchemy.sql import func
 from database import Base
 
@@ -17,6 +17,24 @@ class User(Base):
     utm_source = Column(String(200), nullable=True)  # Источник UTM
     utm_medium = Column(String(200), nullable=True)  # Тип UTM
     utm_campaign = Column(String(200), nullable=True)  # Кампания UTM
+    blocked_at = Column(DateTime, nullable=True)  # Когда бот стал недоступен (заблокирован, чат удалён)
+    last_delivery_ok_at = Column(DateTime, nullable=True)  # Последняя успешная доставка сообщения
+
+    __table_args__ = (
+        # Повторная проверка недоступных пользователей
+        Index(
+            "ix_users_blocked_at",
+            "blocked_at",
+            postgresql_where=text("blocked_at IS NOT NULL"),
+        ),
+        # Список пользователей в админке: страницы по (registered_at, id)
+        # от новых к старым, пользователи без даты — в конце
+        Index(
+            "ix_users_registered_at_desc_id",
+            text("registered_at DESC NULLS LAST"),
+            text("id DESC"),
+        ),
+    )
 
     def __repr__(self):
         return f"<User(id={self.id}, username={self.username})>"
@@ -6,6 +6,7 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Boolean,
+    Text,
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -29,6 +30,16 @@ class WeeklyLottery(Base):
     notification_sent = Column(Boolean, default=False)  # Отправлено ли уведомление
     created_at = Column(DateTime, server_default=func.now())  # Дата создания записи
 
+    # Протокол розыгрыша (см. services/lottery_draw_service.py)
+    draw_mode = Column(String(20), nullable=True)  # Режим: receipt/user/items
+    draw_commitment = Column(String(128), nullable=True)  # Опубликованное обязательство (SHA-256 секрета)
+    draw_secret = Column(String(64), nullable=True)  # Раскрытый секрет недели
+    draw_exclusions = Column(Text, nullable=True)  # JSON исключённых чеков и пользователей (переигровки)
+    ticket_set_hash = Column(String(64), nullable=True)  # SHA-256 набора билетов
+    draw_seed = Column(String(64), nullable=True)  # Сид генератора (hex)
+    tickets_count = Column(Integer, nullable=True)  # Количество билетов
+    tickets_weight = Column(BigInteger, nullable=True)  # Суммарный вес билетов
+
     # Отношения
     winner_user = relationship("User", foreign_keys=[winner_user_id])
     winner_receipt = relationship("Receipt", foreign_keys=[winner_receipt_id])
@@ -0,0 +1,164 @@
+"""
+Версионные миграции схемы БД на alembic
+
+Скрипты миграций лежат в migrations/versions, конфигурация — в alembic.ini.
+Накатить миграции вручную: `alembic upgrade head` из корня проекта.
+
+При старте бот не создаёт таблицы, а только быстро проверяет, что схема
+находится на head (один запрос к alembic_version).
+
+Для миграций, затрагивающих большие таблицы (receipts, users), используйте
+онлайн-хелперы из этого модуля: индексы строятся CONCURRENTLY, а колонки
+добавляются без DEFAULT, то есть без переписывания таблицы.
+"""
+
+import asyncio
+import os
+from typing import Sequence
+
+from alembic import command, context, op
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import Column, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import DB_AUTO_MIGRATE
+from logger import logger
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ALEMBIC_INI_PATH = os.path.join(PROJECT_ROOT, "alembic.ini")
+
+
+def get_alembic_config() -> Config:
+    """Возвращает конфигурацию alembic проекта"""
+    return Config(ALEMBIC_INI_PATH)
+
+
+def get_head_revisions() -> set[str]:
+    """Возвращает ревизии head из скриптов миграций (без обращения к БД)"""
+    script = ScriptDirectory.from_config(get_alembic_config())
+    return set(script.get_heads())
+
+
+async def get_current_revisions(engine: AsyncEngine) -> set[str]:
+    """
+    Возвращает ревизии, на которых сейчас находится БД
+
+    Args:
+        engine: Асинхронный движок SQLAlchemy
+
+    Returns:
+        set[str]: Текущие ревизии (пустое множество для неразмеченной БД)
+    """
+    async with engine.connect() as conn:
+        return await conn.run_sync(
+            lambda sync_conn: set(
+                MigrationContext.configure(sync_conn).get_current_heads()
+            )
+        )
+
+
+def upgrade_to_head() -> None:
+    """Накатывает все недостающие миграции (блокирующий вызов)"""
+    command.upgrade(get_alembic_config(), "head")
+
+
+async def ensure_schema_at_head(engine: AsyncEngine) -> None:
+    """
+    Проверяет, что схема БД на head, и при необходимости накатывает миграции
+
+    Args:
+        engine: Асинхронный движок SQLAlchemy
+
+    Raises:
+        RuntimeError: Если схема отстаёт, а автоматические миграции выключены
+    """
+    heads = get_head_revisions()
+    current = await get_current_revisions(engine)
+    if current == heads:
+        logger.info(f"Схема БД актуальна (ревизия {', '.join(sorted(heads))})")
+        return
+
+    logger.warning(
+        f"Схема БД не на head: текущая {sorted(current) or 'нет'}, ожидается {sorted(heads)}"
+    )
+    if not DB_AUTO_MIGRATE:
+        raise RuntimeError(
+            "Схема БД не актуальна. Выполните `alembic upgrade head` "
+            "или запустите бота с DB_AUTO_MIGRATE=true"
+        )
+
+    # env.py миграций запускает собственный event loop, поэтому уходим в поток
+    await asyncio.to_thread(upgrade_to_head)
+    logger.info("Миграции схемы БД применены")
+
+
+# -------------------- Онлайн-операции для скриптов миграций --------------------
+
+
+def create_index_online(
+    index_name: str,
+    table_name: str,
+    columns: Sequence,
+    **kw,
+) -> None:
+    """
+    Создаёт индекс через CREATE INDEX CONCURRENTLY (без блокировки записи)
+
+    Выполняется вне транзакции миграции, поэтому повторный запуск безопасен
+    благодаря IF NOT EXISTS. Если прошлая попытка оборвалась посреди
+    построения, в базе остался INVALID-индекс, который IF NOT EXISTS
+    молча пропустил бы: такой индекс удаляется и строится заново.
+    В режиме --sql базы нет: проверка пропускается, выводится только DDL.
+    """
+    with op.get_context().autocommit_block():
+        invalid = False
+        if not context.is_offline_mode():
+            invalid = op.get_bind().execute(
+                text(
+                    "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"
+                ),
+                {"name": index_name},
+            ).scalar()
+        if invalid:
+            logger.warning(f"Индекс {index_name} невалиден (прерванное построение), пересоздаю")
+            op.drop_index(
+                index_name,
+                table_name=table_name,
+                if_exists=True,
+                postgresql_concurrently=True,
+            )
+        op.create_index(
+            index_name,
+            table_name,
+            columns,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            **kw,
+        )
+
+
+def drop_index_online(index_name: str, table_name: str) -> None:
+    """Удаляет индекс через DROP INDEX CONCURRENTLY"""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            index_name,
+            table_name=table_name,
+            if_exists=True,
+            postgresql_concurrently=True,
+        )
+
+
+def add_column_online(table_name: str, column: Column) -> None:
+    """
+    Добавляет nullable-колонку без DEFAULT
+
+    В Postgres это изменение только каталога: таблица не переписывается,
+    эксклюзивная блокировка берётся на миллисекунды (с lock_timeout из env.py).
+    """
+    if not column.nullable or column.server_default is not None:
+        raise ValueError(
+            f"Колонка {table_name}.{column.name} должна быть nullable и без server_default"
+        )
+    op.add_column(table_name, column, if_not_exists=True)
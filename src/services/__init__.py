@@ -1,27 +1,45 @@
-from .fnc_api_service import verify_receipt
-from .receipt_service import (
-    process_receipt_photo,
-    process_manual_receipt,
-    verify_receipt_with_api,
-)
-from .prize_service import issue_prize
-from .lottery_service import select_winner, notify_winner, notify_participants
-from .weekly_lottery_service import weekly_lottery_service
-from .scheduler_service import lottery_scheduler
-from .check_api_service import verify_check
-from .google_sheets_service import google_sheets_service
-
-__all__ = [
-    "verify_receipt",
-    "process_receipt_photo",
-    "process_manual_receipt",
-    "verify_receipt_with_api",
-    "issue_prize",
-    "select_winner",
-    "notify_winner",
-    "notify_participants",
-    "weekly_lottery_service",
-    "lottery_scheduler",
-    "verify_check",
-    "google_sheets_service",
-]
+"""
+Сервисы приложения
+
+Модули сервисов загружаются лениво, при первом обращении к имени
+(PEP 562): `from services.promocode_service import ...` в админке
+не тянет за собой OpenCV, pyzbar, gspread и APScheduler.
+
+Экземпляры weekly_lottery_service и google_sheets_service называются
+так же, как их модули, поэтому импортируйте их из модулей:
+`from services.weekly_lottery_service import weekly_lottery_service`.
+"""
+
+import importlib
+
+# Экспортируемое имя -> модуль сервиса
+_EXPORTS = {
+    "verify_receipt": ".fnc_api_service",
+    "process_receipt_photo": ".receipt_service",
+    "process_manual_receipt": ".receipt_service",
+    "verify_receipt_with_api": ".receipt_service",
+    "issue_prize": ".prize_service",
+    "select_winner": ".lottery_service",
+    "notify_winner": ".lottery_service",
+    "notify_participants": ".lottery_service",
+    "weekly_lottery_service": ".weekly_lottery_service",
+    "lottery_scheduler": ".scheduler_service",
+    "verify_check": ".check_api_service",
+    "google_sheets_service": ".google_sheets_service",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # Кэшируем, чтобы следующие обращения не проходили через __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
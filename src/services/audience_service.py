@@ -0,0 +1,175 @@
+"""
+Выбор аудитории рассылок
+
+Сегмент описывается AudienceFilter и целиком вычисляется в SQL.
+Получатели читаются только нужными колонками через серверный курсор
+(stream + yield_per) пачками фиксированного размера, поэтому память
+не растёт с числом пользователей. Заблокировавшие бота пользователи
+по умолчанию в сегмент не входят. Рассылки не выбирают получателей
+в Python вовсе: audience_query() подставляется в INSERT ... SELECT.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Sequence
+
+from sqlalchemy import select, func, and_, or_, exists
+from sqlalchemy.sql import Select
+
+from database import async_session
+from models.user_model import User
+from models.receipt_model import Receipt
+
+# Сколько строк читается с сервера за раз
+CHUNK_SIZE = 1000
+
+
+@dataclass
+class AudienceFilter:
+    """Сегмент пользователей (пустой фильтр — все пользователи)"""
+
+    user_ids: Optional[Sequence[int]] = None  # Только эти пользователи
+    exclude_user_ids: Optional[Sequence[int]] = None  # Кроме этих пользователей
+    utm_source: Optional[str] = None  # Источник UTM
+    utm_medium: Optional[str] = None  # Тип UTM
+    utm_campaign: Optional[str] = None  # Кампания UTM
+    has_verified_receipts: bool = False  # Есть подтверждённые чеки
+    active_days: Optional[int] = None  # Регистрировался или присылал чек за N дней
+    include_unreachable: bool = False  # Включать заблокировавших бота
+
+    def conditions(self) -> list:
+        """Условия WHERE для таблицы users"""
+        conditions = []
+        if not self.include_unreachable:
+            conditions.append(User.blocked_at.is_(None))
+        if self.user_ids is not None:
+            conditions.append(User.id.in_(list(self.user_ids)))
+        excluded = [uid for uid in (self.exclude_user_ids or []) if uid]
+        if excluded:
+            conditions.append(User.id.notin_(excluded))
+        for column, value in (
+            (User.utm_source, self.utm_source),
+            (User.utm_medium, self.utm_medium),
+            (User.utm_campaign, self.utm_campaign),
+        ):
+            if value:
+                conditions.append(column == value)
+        if self.has_verified_receipts:
+            conditions.append(
+                exists().where(
+                    and_(Receipt.user_id == User.id, Receipt.status == "verified")
+                )
+            )
+        if self.active_days:
+            since = datetime.now() - timedelta(days=self.active_days)
+            conditions.append(
+                or_(
+                    User.registered_at >= since,
+                    exists().where(
+                        and_(Receipt.user_id == User.id, Receipt.created_at >= since)
+                    ),
+                )
+            )
+        return conditions
+
+
+class AudienceService:
+    """Сервис выбора аудитории"""
+
+    @staticmethod
+    def audience_query(audience: AudienceFilter, *columns) -> Select:
+        """
+        Запрос пользователей сегмента
+
+        Args:
+            audience: Сегмент
+            *columns: Нужные колонки (по умолчанию только User.id)
+
+        Returns:
+            Select: Запрос, упорядоченный по User.id
+        """
+        query = select(*(columns or (User.id,)))
+        conditions = audience.conditions()
+        if conditions:
+            query = query.where(and_(*conditions))
+        return query.order_by(User.id)
+
+    @staticmethod
+    async def count(audience: AudienceFilter) -> int:
+        """Количество пользователей в сегменте"""
+        query = select(func.count()).select_from(User)
+        conditions = audience.conditions()
+        if conditions:
+            query = query.where(and_(*conditions))
+        async with async_session() as session:
+            return (await session.execute(query)).scalar_one()
+
+    @staticmethod
+    async def iter_chunks(
+        audience: AudienceFilter, *columns, chunk_size: int = CHUNK_SIZE
+    ) -> AsyncIterator[List]:
+        """
+        Пачки строк сегмента через серверный курсор
+
+        Args:
+            audience: Сегмент
+            *columns: Нужные колонки (по умолчанию только User.id)
+            chunk_size: Размер пачки
+
+        Yields:
+            List: Строки пачки (для одной колонки — сами значения)
+        """
+        query = AudienceService.audience_query(audience, *columns).execution_options(
+            yield_per=chunk_size
+        )
+        single = len(columns) <= 1
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                yield [row[0] for row in partition] if single else list(partition)
+
+    @staticmethod
+    async def iter_pages(
+        audience: AudienceFilter, *columns, page_size: int = CHUNK_SIZE
+    ) -> AsyncIterator[List]:
+        """
+        Страницы сегмента по User.id > последнего, каждая в своей короткой сессии
+
+        В отличие от iter_chunks, не держит транзакцию между пачками:
+        подходит для долгих обходов (минуты и часы между пачками).
+
+        Args:
+            audience: Сегмент
+            *columns: Нужные колонки, первая — User.id (по умолчанию только User.id)
+            page_size: Размер страницы
+
+        Yields:
+            List: Строки страницы (для одной колонки — сами значения)
+        """
+        single = len(columns) <= 1
+        last_id = None
+        while True:
+            query = AudienceService.audience_query(audience, *columns)
+            if last_id is not None:
+                query = query.where(User.id > last_id)
+            async with async_session() as session:
+                rows = (await session.execute(query.limit(page_size))).all()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[0] for row in rows] if single else [tuple(row) for row in rows]
+            if len(rows) < page_size:
+                return
+
+    @staticmethod
+    async def iter_user_ids(
+        audience: AudienceFilter, chunk_size: int = CHUNK_SIZE
+    ) -> AsyncIterator[int]:
+        """ID пользователей сегмента по одному (читаются пачками)"""
+        async for chunk in AudienceService.iter_chunks(audience, chunk_size=chunk_size):
+            for user_id in chunk:
+                yield user_id
+
+
+# Создаем экземпляр сервиса
+audience_service = AudienceService()
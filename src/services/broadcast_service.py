@@ -0,0 +1,690 @@
+"""
+Движок массовых рассылок
+
+Все массовые отправки (рассылка из админки, итоги розыгрышей) идут через
+BroadcastService:
+
+    1. create() записывает рассылку и по строке broadcast_deliveries
+       на каждого получателя сегмента (INSERT ... SELECT, без выборки в Python);
+    2. run() захватывает рассылку, отправляет ожидающие доставки пачками
+       по возрастанию user_id и сразу отмечает результат каждой доставки,
+       поэтому после падения процесса рассылка продолжается с места остановки;
+    3. start() запускает run() фоновой задачей, а pause()/resume()/cancel()
+       меняют статус рассылки, который run() проверяет каждые
+       HEARTBEAT_INTERVAL секунд.
+
+Скорость ограничивается токен-бакетом под общий лимит Telegram
+(BROADCAST_RATE сообщений в секунду), интервалом не чаще раза в секунду
+на один чат и семафором на BROADCAST_CONCURRENCY одновременных запросов.
+TelegramRetryAfter приостанавливает весь бакет на указанное Telegram время.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update, insert, and_, or_, func, literal
+
+from database import async_session
+from models.broadcast_model import Broadcast, BroadcastDelivery
+from models.user_model import User
+from services.media_cache_service import media_cache_service
+from services.audience_service import audience_service, AudienceFilter
+from services.reachability_service import reachability_service, is_unreachable_error
+from config import (
+    BOT_TOKEN,
+    BROADCAST_RATE,
+    BROADCAST_CONCURRENCY,
+    BROADCAST_MAX_ATTEMPTS,
+    BROADCAST_STALE_TIMEOUT,
+)
+from logger import logger
+
+# Сколько доставок читается из базы за один запрос
+BATCH_SIZE = 500
+# Минимальный интервал между сообщениями в один чат, секунд
+PER_CHAT_INTERVAL = 1.0
+# Сколько раз подряд можно получить RetryAfter по одной доставке
+MAX_RETRY_AFTER = 10
+# Как часто сохраняются счётчики и проверяются пауза и отмена, секунд
+HEARTBEAT_INTERVAL = 2
+
+
+class TokenBucket:
+    """Токен-бакет: не больше rate запросов в секунду с запасом на всплеск capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        # Альбом из 10 фото расходует 10 токенов, поэтому запас не меньше 10
+        self.capacity = capacity or max(rate, 10.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Останавливает выдачу токенов (ответ Telegram RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self, cost: float = 1.0) -> None:
+        """Ждёт, пока в бакете наберётся cost токенов, и списывает их"""
+        cost = min(cost, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= cost:
+                    self._tokens -= cost
+                    return
+                await asyncio.sleep((cost - self._tokens) / self.rate)
+
+
+class _Payload:
+    """Содержимое рассылки, подготовленное к отправке"""
+
+    def __init__(self, broadcast: Broadcast) -> None:
+        self.text = broadcast.text or ""
+        self.disable_preview = bool(broadcast.disable_preview)
+        self.media: List[str] = json.loads(broadcast.media) if broadcast.media else []
+
+    @property
+    def cost(self) -> int:
+        """Сколько сообщений Telegram занимает одна доставка"""
+        return max(1, len(self.media))
+
+
+class BroadcastService:
+    """Сервис массовых рассылок"""
+
+    @staticmethod
+    async def create(
+        text: str,
+        media: Optional[List[str]] = None,
+        disable_preview: bool = False,
+        kind: str = "admin",
+        audience: Optional[AudienceFilter] = None,
+    ) -> Broadcast:
+        """
+        Создаёт рассылку и список её получателей
+
+        Args:
+            text: Текст сообщения (HTML); для фото — подпись
+            media: Пути к картинкам (одна — фото, несколько — альбом)
+            disable_preview: Отключить предпросмотр ссылок
+            kind: Источник рассылки (admin/lottery)
+            audience: Сегмент получателей; None — все пользователи
+
+        Returns:
+            Broadcast: Созданная рассылка
+        """
+        async with async_session() as session:
+            broadcast = Broadcast(
+                kind=kind,
+                text=text,
+                media=json.dumps([str(p) for p in media]) if media else None,
+                disable_preview=disable_preview,
+            )
+            session.add(broadcast)
+            await session.flush()
+
+            # Получатели выбираются в базе, без выгрузки пользователей в Python
+            recipients = audience_service.audience_query(
+                audience or AudienceFilter(), literal(broadcast.id), User.id
+            )
+            result = await session.execute(
+                insert(BroadcastDelivery).from_select(
+                    ["broadcast_id", "user_id"], recipients
+                )
+            )
+            broadcast.total = result.rowcount
+            await session.commit()
+            logger.info(
+                f"Создана рассылка #{broadcast.id} ({kind}), получателей: {broadcast.total}"
+            )
+            return broadcast
+
+    @staticmethod
+    async def _claim(broadcast_id: int, runner_id: str) -> Optional[Broadcast]:
+        """
+        Захватывает рассылку для отправки
+
+        Рассылку можно захватить, если она ещё не начата или процесс,
+        который её вёл, перестал обновлять heartbeat.
+        """
+        stale = datetime.now() - timedelta(seconds=BROADCAST_STALE_TIMEOUT)
+        async with async_session() as session:
+            result = await session.execute(
+                update(Broadcast)
+                .where(
+                    and_(
+                        Broadcast.id == broadcast_id,
+                        or_(
+                            Broadcast.status == "pending",
+                            and_(
+                                Broadcast.status == "running",
+                                or_(
+                                    Broadcast.heartbeat_at.is_(None),
+                                    Broadcast.heartbeat_at < stale,
+                                ),
+                            ),
+                        ),
+                    )
+                )
+                .values(
+                    status="running",
+                    runner_id=runner_id,
+                    heartbeat_at=datetime.now(),
+                    started_at=func.coalesce(Broadcast.started_at, datetime.now()),
+                )
+                .returning(Broadcast)
+            )
+            broadcast = result.scalars().first()
+            await session.commit()
+            return broadcast
+
+    @staticmethod
+    async def _pending_batch(broadcast_id: int, after_user_id: int) -> List[int]:
+        """Следующая пачка неотправленных доставок (по индексу ix_broadcast_deliveries_pending)"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(BroadcastDelivery.user_id)
+                .where(
+                    and_(
+                        BroadcastDelivery.broadcast_id == broadcast_id,
+                        BroadcastDelivery.status == "pending",
+                        BroadcastDelivery.user_id > after_user_id,
+                    )
+                )
+                .order_by(BroadcastDelivery.user_id)
+                .limit(BATCH_SIZE)
+            )
+            return list(result.scalars().all())
+
+    @staticmethod
+    async def _save_delivery(
+        broadcast_id: int,
+        runner_id: str,
+        user_id: int,
+        status: str,
+        attempts: int,
+        error: Optional[str],
+    ) -> bool:
+        """
+        Сохраняет результат доставки, если рассылку всё ещё ведёт этот процесс
+
+        Returns:
+            bool: False — рассылку перехватил другой процесс, запись не сделана
+        """
+        owned = (
+            select(Broadcast.id)
+            .where(and_(Broadcast.id == broadcast_id, Broadcast.runner_id == runner_id))
+            .exists()
+        )
+        async with async_session() as session:
+            result = await session.execute(
+                update(BroadcastDelivery)
+                .where(
+                    and_(
+                        BroadcastDelivery.broadcast_id == broadcast_id,
+                        BroadcastDelivery.user_id == user_id,
+                        owned,
+                    )
+                )
+                .values(
+                    status=status,
+                    attempts=BroadcastDelivery.attempts + attempts,
+                    error=error[:1000] if error else None,
+                    sent_at=datetime.now() if status == "sent" else None,
+                )
+            )
+            # Доступность пользователя — в той же транзакции
+            if status == "sent":
+                await reachability_service.mark_reachable(session, user_id)
+            elif status == "blocked":
+                await reachability_service.mark_blocked(session, [user_id])
+            await session.commit()
+        return result.rowcount > 0
+
+    @staticmethod
+    async def _count(broadcast_id: int) -> Dict[str, int]:
+        """Точные счётчики по журналу доставок"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(BroadcastDelivery.status, func.count())
+                .where(BroadcastDelivery.broadcast_id == broadcast_id)
+                .group_by(BroadcastDelivery.status)
+            )
+            counts = dict(result.all())
+        return {status: counts.get(status, 0) for status in ("sent", "failed", "blocked")}
+
+    @staticmethod
+    def _counters(counts: Dict[str, int]) -> dict:
+        return {
+            "sent_count": counts["sent"],
+            "failed_count": counts["failed"],
+            "blocked_count": counts["blocked"],
+        }
+
+    @staticmethod
+    async def _heartbeat(
+        broadcast_id: int, runner_id: str, counts: Dict[str, int]
+    ) -> Optional[str]:
+        """
+        Сохраняет счётчики и отмечает, что процесс жив
+
+        Returns:
+            Optional[str]: Текущий статус рассылки; None — рассылку
+                перехватил другой процесс
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                update(Broadcast)
+                .where(
+                    and_(Broadcast.id == broadcast_id, Broadcast.runner_id == runner_id)
+                )
+                .values(heartbeat_at=datetime.now(), **BroadcastService._counters(counts))
+                .returning(Broadcast.status)
+            )
+            status = result.scalar()
+            await session.commit()
+            return status
+
+    @staticmethod
+    async def _release(broadcast_id: int, runner_id: str, counts: Dict[str, int]) -> None:
+        """Отпускает рассылку (пауза, отмена или остановка процесса)"""
+        async with async_session() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(
+                    and_(Broadcast.id == broadcast_id, Broadcast.runner_id == runner_id)
+                )
+                .values(
+                    runner_id=None,
+                    heartbeat_at=None,
+                    **BroadcastService._counters(counts),
+                )
+            )
+            await session.commit()
+
+    @staticmethod
+    async def _finish(broadcast_id: int, runner_id: str) -> None:
+        counts = await BroadcastService._count(broadcast_id)
+        async with async_session() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(
+                    and_(
+                        Broadcast.id == broadcast_id,
+                        Broadcast.runner_id == runner_id,
+                        Broadcast.status == "running",
+                    )
+                )
+                .values(
+                    status="done",
+                    runner_id=None,
+                    finished_at=datetime.now(),
+                    **BroadcastService._counters(counts),
+                )
+            )
+            await session.commit()
+
+    @staticmethod
+    async def _fail(broadcast_id: int, runner_id: str, error: str) -> None:
+        async with async_session() as session:
+            await session.execute(
+                update(Broadcast)
+                .where(
+                    and_(Broadcast.id == broadcast_id, Broadcast.runner_id == runner_id)
+                )
+                .values(status="failed", error=error[:1000], finished_at=datetime.now())
+            )
+            await session.commit()
+
+    @staticmethod
+    async def _send(bot, user_id: int, payload: _Payload):
+        """Отправляет содержимое рассылки одному получателю"""
+        from aiogram.types import LinkPreviewOptions
+
+        # Картинки загружаются один раз, дальше отправляются по file_id
+        if len(payload.media) == 1:
+            return await media_cache_service.send_photo(
+                bot, user_id, payload.media[0], caption=payload.text or None
+            )
+        if payload.media:
+            return await media_cache_service.send_media_group(
+                bot, user_id, payload.media, caption=payload.text
+            )
+        return await bot.send_message(
+            user_id,
+            payload.text,
+            link_preview_options=(
+                LinkPreviewOptions(is_disabled=True) if payload.disable_preview else None
+            ),
+        )
+
+    @staticmethod
+    async def _deliver(
+        bot,
+        broadcast_id: int,
+        runner_id: str,
+        user_id: int,
+        payload: _Payload,
+        bucket: TokenBucket,
+        last_sent: Dict[int, float],
+    ) -> Optional[str]:
+        """
+        Доставляет рассылку одному получателю с повторами и сохраняет результат
+
+        Returns:
+            Optional[str]: Итоговый статус доставки (sent/failed/blocked);
+                None — рассылку перехватил другой процесс
+        """
+        from aiogram.exceptions import (
+            TelegramRetryAfter,
+            TelegramForbiddenError,
+            TelegramBadRequest,
+        )
+
+        attempts = 0
+        retry_after_count = 0
+        status, error = "failed", None
+        while True:
+            # Не чаще раза в секунду в один чат
+            wait = last_sent.get(user_id, 0.0) + PER_CHAT_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await bucket.acquire(payload.cost)
+            last_sent[user_id] = time.monotonic()
+            attempts += 1
+            try:
+                await BroadcastService._send(bot, user_id, payload)
+                status, error = "sent", None
+                break
+            except TelegramRetryAfter as e:
+                # Флуд-контроль: останавливаем весь поток, а не только этот чат
+                logger.warning(
+                    f"Рассылка #{broadcast_id}: RetryAfter {e.retry_after} с, пауза"
+                )
+                bucket.pause(e.retry_after)
+                retry_after_count += 1
+                attempts -= 1
+                error = str(e)
+                if retry_after_count >= MAX_RETRY_AFTER:
+                    break
+            except TelegramForbiddenError as e:
+                status, error = "blocked", str(e)
+                break
+            except TelegramBadRequest as e:
+                # Чат не найден, неверная разметка — повтор не поможет
+                error = str(e)
+                if is_unreachable_error(e):
+                    status = "blocked"
+                break
+            except Exception as e:
+                error = f"{e.__class__.__name__}: {e}"
+                if attempts >= BROADCAST_MAX_ATTEMPTS:
+                    break
+                await asyncio.sleep(2**attempts)
+
+        if status == "failed":
+            logger.error(f"Рассылка #{broadcast_id}: не доставлено {user_id}: {error}")
+        saved = await BroadcastService._save_delivery(
+            broadcast_id, runner_id, user_id, status, attempts, error
+        )
+        return status if saved else None
+
+    @staticmethod
+    async def run(broadcast_id: int, bot=None) -> dict:
+        """
+        Отправляет рассылку (или продолжает прерванную)
+
+        Args:
+            broadcast_id: ID рассылки
+            bot: Экземпляр бота; None — бот создаётся на время рассылки
+
+        Returns:
+            dict: Статистика рассылки
+        """
+        runner_id = f"{socket.gethostname()}:{os.getpid()}"
+        broadcast = await BroadcastService._claim(broadcast_id, runner_id)
+        if broadcast is None:
+            logger.info(f"Рассылка #{broadcast_id} уже выполняется или завершена")
+            return {"success": False, "error": "Рассылка уже выполняется или завершена"}
+
+        own_bot = bot is None
+        if own_bot:
+            from aiogram import Bot
+            from aiogram.client.default import DefaultBotProperties
+            from aiogram.enums import ParseMode
+
+            bot = Bot(
+                token=str(BOT_TOKEN),
+                default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+            )
+
+        payload = _Payload(broadcast)
+        bucket = TokenBucket(BROADCAST_RATE)
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        last_sent: Dict[int, float] = {}
+        counts = await BroadcastService._count(broadcast_id)
+        # Устанавливается, когда рассылку поставили на паузу, отменили или перехватили
+        stop = asyncio.Event()
+        started = time.monotonic()
+        logger.info(f"Рассылка #{broadcast_id} запущена ({runner_id})")
+
+        async def heartbeat():
+            last_beat = time.monotonic()
+            while True:
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                try:
+                    status = await BroadcastService._heartbeat(
+                        broadcast_id, runner_id, counts
+                    )
+                except Exception as e:
+                    logger.error(f"Рассылка #{broadcast_id}: heartbeat не сохранён: {str(e)}")
+                    # Пока аренда не устарела, пробуем ещё; ближе к порогу
+                    # останавливаемся, чтобы не слать параллельно с перехватчиком
+                    if time.monotonic() - last_beat >= BROADCAST_STALE_TIMEOUT / 2:
+                        logger.error(
+                            f"Рассылка #{broadcast_id}: аренда близка к устареванию, остановка"
+                        )
+                        stop.set()
+                        return
+                    continue
+                last_beat = time.monotonic()
+                if status != "running":
+                    stop.set()
+                    return
+
+        async def deliver(user_id: int):
+            async with semaphore:
+                if stop.is_set():
+                    return
+                status = await BroadcastService._deliver(
+                    bot, broadcast_id, runner_id, user_id, payload, bucket, last_sent
+                )
+                if status is None:
+                    stop.set()
+                    return
+                counts[status] += 1
+
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            last_user_id = -1
+            while not stop.is_set():
+                batch = await BroadcastService._pending_batch(broadcast_id, last_user_id)
+                if not batch:
+                    break
+                last_user_id = batch[-1]
+                await asyncio.gather(*(deliver(uid) for uid in batch))
+        except asyncio.CancelledError:
+            # Процесс останавливается: следующий запуск продолжит рассылку сразу
+            await BroadcastService._release(broadcast_id, runner_id, counts)
+            raise
+        except Exception as e:
+            logger.error(f"Рассылка #{broadcast_id} прервана: {str(e)}")
+            await BroadcastService._fail(broadcast_id, runner_id, str(e))
+            return {"success": False, "error": str(e)}
+        finally:
+            heartbeat_task.cancel()
+            if own_bot:
+                await bot.session.close()
+
+        if stop.is_set():
+            await BroadcastService._release(broadcast_id, runner_id, counts)
+            logger.info(f"Рассылка #{broadcast_id} остановлена")
+        else:
+            await BroadcastService._finish(broadcast_id, runner_id)
+
+        async with async_session() as session:
+            broadcast = await session.get(Broadcast, broadcast_id)
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Рассылка #{broadcast_id} ({broadcast.status}) за {elapsed:.0f} с: "
+            f"доставлено {broadcast.sent_count}, ошибок {broadcast.failed_count}, "
+            f"заблокировали бота {broadcast.blocked_count}"
+        )
+        return {
+            "success": True,
+            "broadcast_id": broadcast_id,
+            "status": broadcast.status,
+            "sent_count": broadcast.sent_count,
+            "error_count": broadcast.failed_count + broadcast.blocked_count,
+            "blocked_count": broadcast.blocked_count,
+        }
+
+    @staticmethod
+    async def send(bot=None, **kwargs) -> dict:
+        """Создаёт рассылку (аргументы как у create) и сразу отправляет её"""
+        broadcast = await BroadcastService.create(**kwargs)
+        return await BroadcastService.run(broadcast.id, bot)
+
+    @staticmethod
+    async def resume_unfinished() -> List[int]:
+        """
+        Продолжает рассылки, прерванные падением процесса
+
+        Returns:
+            List[int]: ID рассылок, которые были возобновлены
+        """
+        stale = datetime.now() - timedelta(seconds=BROADCAST_STALE_TIMEOUT)
+        async with async_session() as session:
+            result = await session.execute(
+                select(Broadcast.id).where(
+                    or_(
+                        Broadcast.status == "pending",
+                        and_(
+                            Broadcast.status == "running",
+                            or_(
+                                Broadcast.heartbeat_at.is_(None),
+                                Broadcast.heartbeat_at < stale,
+                            ),
+                        ),
+                    )
+                )
+            )
+            ids = list(result.scalars().all())
+
+        for broadcast_id in ids:
+            logger.info(f"Возобновляю рассылку #{broadcast_id}")
+            BroadcastService.start(broadcast_id)
+        return ids
+
+    @staticmethod
+    def start(broadcast_id: int) -> None:
+        """Запускает рассылку фоновой задачей текущего процесса"""
+        task = asyncio.create_task(BroadcastService.run(broadcast_id))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    @staticmethod
+    async def stop_all() -> None:
+        """Останавливает фоновые рассылки процесса (при завершении приложения)"""
+        tasks = list(_background_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    async def pause(broadcast_id: int) -> bool:
+        """Ставит рассылку на паузу; отправка остановится в течение пары секунд"""
+        return await BroadcastService._set_status(
+            broadcast_id, ("pending", "running"), status="paused"
+        )
+
+    @staticmethod
+    async def resume(broadcast_id: int) -> bool:
+        """
+        Продолжает рассылку после паузы
+
+        Returns:
+            bool: False, если рассылка не на паузе или ещё не остановилась
+        """
+        resumed = await BroadcastService._set_status(
+            broadcast_id, ("paused",), status="pending", require_released=True
+        )
+        if resumed:
+            BroadcastService.start(broadcast_id)
+        return resumed
+
+    @staticmethod
+    async def cancel(broadcast_id: int) -> bool:
+        """Отменяет рассылку; неотправленные доставки остаются в журнале"""
+        return await BroadcastService._set_status(
+            broadcast_id,
+            ("pending", "running", "paused"),
+            status="cancelled",
+            finished_at=datetime.now(),
+        )
+
+    @staticmethod
+    async def _set_status(
+        broadcast_id: int,
+        allowed: tuple,
+        require_released: bool = False,
+        **values,
+    ) -> bool:
+        conditions = [Broadcast.id == broadcast_id, Broadcast.status.in_(allowed)]
+        if require_released:
+            # Процесс, который вёл рассылку, ещё дожидается отправок в работе
+            conditions.append(Broadcast.runner_id.is_(None))
+        async with async_session() as session:
+            result = await session.execute(
+                update(Broadcast).where(and_(*conditions)).values(**values)
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+    @staticmethod
+    async def get_broadcast(broadcast_id: int) -> Optional[Broadcast]:
+        """Рассылка по ID"""
+        async with async_session() as session:
+            return await session.get(Broadcast, broadcast_id)
+
+    @staticmethod
+    async def get_recent(limit: int = 20) -> List[Broadcast]:
+        """Последние рассылки (для админки)"""
+        async with async_session() as session:
+            result = await session.execute(
+                select(Broadcast).order_by(Broadcast.id.desc()).limit(limit)
+            )
+            return result.scalars().all()
+
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+
+# Создаем экземпляр сервиса
+broadcast_service = BroadcastService()
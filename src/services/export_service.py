@@ -0,0 +1,404 @@
+"""
+Выгрузки пользователей, чеков, подарков и розыгрышей в CSV и XLSX
+
+Строки читаются через серверный курсор (stream + yield_per) пачками
+фиксированного размера и сразу пишутся в ответ: память не растёт
+с размером выгрузки, а первые байты уходят клиенту сразу после первой
+пачки. XLSX собирается потоком стандартным zipfile (лист с inline-строками,
+без общей таблицы строк), поэтому отдельная библиотека не нужна.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from sqlalchemy import select, func, and_
+
+from database import async_session
+from models.user_model import User
+from models.receipt_model import Receipt
+from models.prize_model import Prize
+from models.weekly_lottery_model import WeeklyLottery
+from services.audience_service import AudienceFilter
+from services.receipt_list_service import ReceiptFilter
+
+# Сколько строк читается с сервера за раз
+CHUNK_SIZE = 2000
+
+FORMATS = ("csv", "xlsx")
+
+
+@dataclass
+class ExportEntity:
+    """Выгружаемая сущность: колонки (ключ -> выражение) и колонки по умолчанию"""
+
+    title: str
+    columns: Dict[str, object]
+    default_columns: Sequence[str]
+    order_by: Sequence
+    date_column: object  # Колонка фильтра по датам
+
+
+def _receipts_count():
+    return (
+        select(func.count())
+        .where(Receipt.user_id == User.id)
+        .scalar_subquery()
+    )
+
+
+ENTITIES: Dict[str, ExportEntity] = {
+    "users": ExportEntity(
+        title="Пользователи",
+        columns={
+            "id": User.id,
+            "username": User.username,
+            "full_name": User.full_name,
+            "registered_at": User.registered_at,
+            "utm": User.utm,
+            "utm_source": User.utm_source,
+            "utm_medium": User.utm_medium,
+            "utm_campaign": User.utm_campaign,
+            "blocked_at": User.blocked_at,
+            "receipts": _receipts_count(),
+        },
+        default_columns=(
+            "id", "username", "full_name", "registered_at",
+            "utm_source", "utm_medium", "utm_campaign", "receipts",
+        ),
+        order_by=(User.registered_at, User.id),
+        date_column=User.registered_at,
+    ),
+    "receipts": ExportEntity(
+        title="Чеки",
+        columns={
+            "id": Receipt.id,
+            "user_id": Receipt.user_id,
+            "fn": Receipt.fn,
+            "fd": Receipt.fd,
+            "fpd": Receipt.fpd,
+            "amount": Receipt.amount,
+            "status": Receipt.status,
+            "items_count": Receipt.items_count,
+            "pharmacy": Receipt.pharmacy,
+            "address": Receipt.address,
+            "aisida_items": Receipt.aisida_items,
+            "verification_date": Receipt.verification_date,
+            "created_at": Receipt.created_at,
+        },
+        default_columns=(
+            "id", "user_id", "amount", "status", "items_count",
+            "pharmacy", "address", "created_at",
+        ),
+        order_by=(Receipt.created_at, Receipt.id),
+        date_column=Receipt.created_at,
+    ),
+    "prizes": ExportEntity(
+        title="Подарки",
+        columns={
+            "id": Prize.id,
+            "receipt_id": Prize.receipt_id,
+            "user_id": Receipt.user_id,
+            "type": Prize.type,
+            "code": Prize.code,
+            "discount_amount": Prize.discount_amount,
+            "used": Prize.used,
+            "issued_at": Prize.issued_at,
+        },
+        default_columns=(
+            "id", "receipt_id", "user_id", "type", "code", "discount_amount", "issued_at",
+        ),
+        order_by=(Prize.id,),
+        date_column=Prize.issued_at,
+    ),
+    "lotteries": ExportEntity(
+        title="Розыгрыши",
+        columns={
+            "id": WeeklyLottery.id,
+            "week_start": WeeklyLottery.week_start,
+            "week_end": WeeklyLottery.week_end,
+            "winner_user_id": WeeklyLottery.winner_user_id,
+            "winner_receipt_id": WeeklyLottery.winner_receipt_id,
+            "prize_amount": WeeklyLottery.prize_amount,
+            "contact_info": WeeklyLottery.contact_info,
+            "contact_sent": WeeklyLottery.contact_sent,
+            "conducted_at": WeeklyLottery.conducted_at,
+            "draw_mode": WeeklyLottery.draw_mode,
+            "tickets_count": WeeklyLottery.tickets_count,
+            "draw_commitment": WeeklyLottery.draw_commitment,
+            "draw_seed": WeeklyLottery.draw_seed,
+        },
+        default_columns=(
+            "id", "week_start", "week_end", "winner_user_id", "winner_receipt_id",
+            "prize_amount", "contact_info", "conducted_at",
+        ),
+        order_by=(WeeklyLottery.week_start, WeeklyLottery.id),
+        date_column=WeeklyLottery.week_start,
+    ),
+}
+
+
+@dataclass
+class ExportFilter:
+    """Фильтры выгрузки (поля, не относящиеся к сущности, не используются)"""
+
+    start_date: Optional[datetime] = None  # Не раньше (дата сущности)
+    end_date: Optional[datetime] = None  # Не позже (дата сущности)
+    utm_source: Optional[str] = None  # Пользователи: источник UTM
+    utm_medium: Optional[str] = None  # Пользователи: тип UTM
+    utm_campaign: Optional[str] = None  # Пользователи: кампания UTM
+    status: Optional[str] = None  # Чеки: статус
+    pharmacy: Optional[str] = None  # Чеки: часть названия аптеки
+    search: Optional[str] = None  # Чеки: часть аптеки, адреса или товара
+    prize_type: Optional[str] = None  # Подарки: тип
+
+    def conditions(self, entity: str) -> list:
+        """Условия WHERE для сущности"""
+        conditions = []
+        if entity == "users":
+            # В выгрузку попадают и пользователи, заблокировавшие бота
+            conditions += AudienceFilter(
+                utm_source=self.utm_source,
+                utm_medium=self.utm_medium,
+                utm_campaign=self.utm_campaign,
+                include_unreachable=True,
+            ).conditions()
+        elif entity == "receipts":
+            conditions += ReceiptFilter(
+                status=self.status, pharmacy=self.pharmacy, search=self.search
+            ).conditions()
+        elif entity == "prizes" and self.prize_type:
+            conditions.append(Prize.type == self.prize_type)
+
+        date_column = ENTITIES[entity].date_column
+        if self.start_date:
+            conditions.append(date_column >= self.start_date)
+        if self.end_date:
+            conditions.append(date_column <= self.end_date)
+        return conditions
+
+
+def _cell(value):
+    """Значение ячейки CSV"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "да" if value else "нет"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+async def iter_csv(header: Sequence[str], chunks: AsyncIterator[List]) -> AsyncIterator[bytes]:
+    """CSV по пачкам строк (с BOM и «;» для Excel)"""
+    output = io.StringIO()
+    output.write("\ufeff")
+    writer = csv.writer(output, delimiter=";")
+    writer.writerow(header)
+    async for chunk in chunks:
+        writer.writerows([_cell(v) for v in row] for row in chunk)
+        yield output.getvalue().encode("utf-8")
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        yield output.getvalue().encode("utf-8")
+
+
+class _Sink:
+    """Поток без seek для zipfile: записанные байты забираются drain()"""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+
+# Символы вне диапазона Char XML 1.0 (управляющие, суррогаты): Excel не откроет файл
+_XML_ILLEGAL = re.compile("[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+
+def _xml_text(value: str) -> str:
+    """Текст для XML: недопустимые символы заменяются на U+FFFD, остальное экранируется"""
+    return escape(_XML_ILLEGAL.sub("\ufffd", value))
+
+
+def _xlsx_row(values) -> str:
+    """Строка листа XLSX: числа — числами, остальное — inline-строками"""
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append("<c/>")
+        elif isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            if isinstance(value, bool):
+                value = "да" if value else "нет"
+            elif isinstance(value, datetime):
+                value = value.strftime("%Y-%m-%d %H:%M:%S")
+            elif isinstance(value, date):
+                value = value.isoformat()
+            cells.append(
+                f'<c t="inlineStr"><is><t xml:space="preserve">{_xml_text(str(value))}</t></is></c>'
+            )
+    return "<row>" + "".join(cells) + "</row>"
+
+
+async def iter_xlsx(
+    header: Sequence[str], chunks: AsyncIterator[List], title: str = "Выгрузка"
+) -> AsyncIterator[bytes]:
+    """XLSX по пачкам строк, собираемый потоком"""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content.format(title=_xml_text(title[:31])))
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                (
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    "<sheetData>" + _xlsx_row(header)
+                ).encode("utf-8")
+            )
+            async for chunk in chunks:
+                sheet.write("".join(_xlsx_row(row) for row in chunk).encode("utf-8"))
+                data = sink.drain()
+                if data:
+                    yield data
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+class ExportService:
+    """Сервис выгрузок"""
+
+    @staticmethod
+    def resolve_columns(entity: str, columns: Optional[Sequence[str]]) -> List[str]:
+        """
+        Колонки выгрузки: запрошенные и известные, в порядке запроса
+
+        Args:
+            entity: Сущность (users/receipts/prizes/lotteries)
+            columns: Запрошенные колонки; пусто — колонки по умолчанию
+
+        Returns:
+            List[str]: Ключи колонок
+        """
+        known = ENTITIES[entity].columns
+        selected = [c for c in (columns or []) if c in known]
+        return selected or list(ENTITIES[entity].default_columns)
+
+    @staticmethod
+    async def iter_rows(
+        entity: str,
+        columns: Sequence[str],
+        export_filter: ExportFilter,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> AsyncIterator[List[Tuple]]:
+        """
+        Пачки строк выгрузки через серверный курсор
+
+        Args:
+            entity: Сущность
+            columns: Ключи колонок (см. resolve_columns)
+            export_filter: Фильтры
+            chunk_size: Размер пачки
+
+        Yields:
+            List[Tuple]: Строки пачки
+        """
+        spec = ENTITIES[entity]
+        query = select(*(spec.columns[c].label(c) for c in columns))
+        if entity == "prizes":
+            # user_id подарка — из чека
+            query = query.select_from(Prize).outerjoin(Receipt, Receipt.id == Prize.receipt_id)
+        conditions = export_filter.conditions(entity)
+        if conditions:
+            query = query.where(and_(*conditions))
+        query = query.order_by(*spec.order_by).execution_options(yield_per=chunk_size)
+
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    @staticmethod
+    def stream(
+        entity: str,
+        export_format: str,
+        columns: Optional[Sequence[str]],
+        export_filter: ExportFilter,
+    ) -> AsyncIterator[bytes]:
+        """
+        Содержимое файла выгрузки потоком
+
+        Args:
+            entity: Сущность
+            export_format: csv или xlsx
+            columns: Запрошенные колонки
+            export_filter: Фильтры
+
+        Returns:
+            AsyncIterator[bytes]: Части файла
+        """
+        columns = ExportService.resolve_columns(entity, columns)
+        chunks = ExportService.iter_rows(entity, columns, export_filter)
+        if export_format == "xlsx":
+            return iter_xlsx(columns, chunks, title=ENTITIES[entity].title)
+        return iter_csv(columns, chunks)
+
+
+# Создаем экземпляр сервиса
+export_service = ExportService()
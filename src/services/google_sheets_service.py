@@ -1,8 +1,5 @@
 import asyncio
-from typing import List, Optional, Any
-
-import gspread  # type: ignore
-from google.oauth2.service_account import Credentials  # type: ignore
+from typing import List, Optional, Any, TYPE_CHECKING
 
 from database import async_session
 from sqlalchemy import select
@@ -10,6 +7,10 @@ from models.user_model import User
 from logger import logger
 from config import load_google_sheets_settings
 
+# gspread и google-auth импортируются при первом обращении к Google Sheets
+if TYPE_CHECKING:
+    import gspread  # type: ignore
+
 
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
@@ -19,10 +20,13 @@ SCOPES = [
 
 class GoogleSheetsService:
     def __init__(self) -> None:
-        self._client: Optional[gspread.Client] = None
+        self._client: Optional["gspread.Client"] = None
 
-    def _build_client(self) -> Optional[gspread.Client]:
+    def _build_client(self) -> Optional["gspread.Client"]:
         try:
+            import gspread  # type: ignore
+            from google.oauth2.service_account import Credentials  # type: ignore
+
             credentials_dict, _ = load_google_sheets_settings()
             if not credentials_dict:
                 logger.warning(
@@ -37,7 +41,7 @@ class GoogleSheetsService:
             logger.error(f"Ошибка инициализации Google Sheets: {e}")
             return None
 
-    def get_client(self) -> Optional[gspread.Client]:
+    def get_client(self) -> Optional["gspread.Client"]:
         if self._client is None:
             self._client = self._build_client()
         return self._client
@@ -107,6 +111,8 @@ class GoogleSheetsService:
             loop = asyncio.get_running_loop()
 
             def _export_sync(data: List[List[str]]) -> dict:
+                import gspread  # type: ignore
+
                 _, spreadsheet_id = load_google_sheets_settings()
                 if not spreadsheet_id:
                     return {"success": False, "error": "Не задан Spreadsheet ID"}
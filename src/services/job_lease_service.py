@@ -0,0 +1,165 @@
+"""
+Аренда задач планировщика в Postgres
+
+Планировщик запущен в каждой реплике бота, но каждый запуск задачи
+выполняет только одна из них. Перед выполнением реплика одним запросом
+берёт строку задачи в scheduler_locks: INSERT ... ON CONFLICT DO UPDATE
+проходит, только если этот запуск (минута срабатывания) ещё никем
+не взят и предыдущее выполнение не держит аренду. Пока задача идёт,
+аренда продлевается каждые SCHEDULER_LEASE_TTL / 3 секунд; если реплика
+упала, аренда истекает через SCHEDULER_LEASE_TTL секунд, и следующий
+запуск выполнит живая реплика. Время аренды считается по часам Postgres.
+"""
+
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import update, and_, func
+from sqlalchemy.dialects.postgresql import insert
+
+from database import async_session
+from models.scheduler_lock_model import SchedulerLock
+from config import SCHEDULER_LEASE_TTL
+from logger import logger
+
+
+def current_slot(moment: Optional[datetime] = None) -> datetime:
+    """
+    Запуск задачи, к которому относится момент
+
+    Задачи планировщика срабатывают по cron с точностью до минуты,
+    поэтому реплики с разбросом часов в несколько секунд попадают
+    в один и тот же запуск.
+    """
+    return (moment or datetime.now()).replace(second=0, microsecond=0)
+
+
+class JobLeaseService:
+    """Сервис аренды задач планировщика"""
+
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def _lease_until():
+        return func.now() + timedelta(seconds=SCHEDULER_LEASE_TTL)
+
+    @staticmethod
+    async def acquire(job_id: str, slot: datetime) -> bool:
+        """
+        Берёт запуск задачи
+
+        Args:
+            job_id: ID задачи
+            slot: Запуск (минута срабатывания)
+
+        Returns:
+            bool: True, если запуск достался этой реплике
+        """
+        values = {
+            "last_slot": slot,
+            "owner": JobLeaseService.owner,
+            "locked_until": JobLeaseService._lease_until(),
+            "started_at": func.now(),
+            "finished_at": None,
+        }
+        stmt = insert(SchedulerLock).values(job_id=job_id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SchedulerLock.job_id],
+            set_=values,
+            where=and_(
+                SchedulerLock.last_slot < slot,
+                SchedulerLock.locked_until < func.now(),
+            ),
+        ).returning(SchedulerLock.job_id)
+        async with async_session() as session:
+            result = await session.execute(stmt)
+            acquired = result.scalar() is not None
+            await session.commit()
+            return acquired
+
+    @staticmethod
+    async def renew(job_id: str) -> bool:
+        """Продлевает аренду; False — аренду потеряли"""
+        async with async_session() as session:
+            result = await session.execute(
+                update(SchedulerLock)
+                .where(
+                    and_(
+                        SchedulerLock.job_id == job_id,
+                        SchedulerLock.owner == JobLeaseService.owner,
+                    )
+                )
+                .values(locked_until=JobLeaseService._lease_until())
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+    @staticmethod
+    async def release(job_id: str) -> None:
+        """Освобождает аренду после выполнения задачи"""
+        async with async_session() as session:
+            await session.execute(
+                update(SchedulerLock)
+                .where(
+                    and_(
+                        SchedulerLock.job_id == job_id,
+                        SchedulerLock.owner == JobLeaseService.owner,
+                    )
+                )
+                .values(locked_until=func.now(), finished_at=func.now())
+            )
+            await session.commit()
+
+    @staticmethod
+    async def run_exclusive(
+        job_id: str, job: Callable[[], Awaitable], slot: Optional[datetime] = None
+    ) -> bool:
+        """
+        Выполняет задачу, если этот запуск достался текущей реплике
+
+        Args:
+            job_id: ID задачи
+            job: Корутинная функция задачи
+            slot: Запуск; по умолчанию — текущая минута
+
+        Returns:
+            bool: True, если задача выполнялась в этой реплике
+        """
+        slot = slot or current_slot()
+        try:
+            acquired = await JobLeaseService.acquire(job_id, slot)
+        except Exception as e:
+            logger.error(f"Не удалось взять аренду задачи {job_id}: {str(e)}")
+            return False
+        if not acquired:
+            logger.info(f"Задача {job_id} ({slot:%d.%m %H:%M}) выполняется другой репликой")
+            return False
+
+        async def keep_alive():
+            while True:
+                await asyncio.sleep(SCHEDULER_LEASE_TTL / 3)
+                try:
+                    if not await JobLeaseService.renew(job_id):
+                        logger.warning(f"Аренда задачи {job_id} потеряна")
+                        return
+                except Exception as e:
+                    logger.error(f"Не удалось продлить аренду задачи {job_id}: {str(e)}")
+
+        renewal = asyncio.create_task(keep_alive())
+        try:
+            await job()
+        finally:
+            renewal.cancel()
+            try:
+                await JobLeaseService.release(job_id)
+            except Exception as e:
+                # Аренда истечёт сама через SCHEDULER_LEASE_TTL секунд
+                logger.error(f"Не удалось освободить аренду задачи {job_id}: {str(e)}")
+        return True
+
+
+# Создаем экземпляр сервиса
+job_lease_service = JobLeaseService()
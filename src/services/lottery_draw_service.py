@@ -0,0 +1,526 @@
+"""
+Движок проведения розыгрыша с воспроизводимым результатом
+
+Билеты недели берутся из таблицы lottery_tickets (её ведёт
+services/lottery_ticket_service.py), чеки за неделю не пересканируются.
+
+Режим receipt (один билет на чек) — номера билетов недели идут подряд
+от 1 до N, поэтому победитель выбирается без выгрузки билетов: хэш
+номеров действующих билетов считает база, генератор выдаёт номер
+в [1, N], читается одна строка; аннулированный или исключённый билет
+пропускается, и номер тянется заново.
+
+Режимы user (один билет на пользователя) и items (вес чека — число товаров
+«Айсида») выгружают (receipt_id, user_id, weight) в массивы NumPy
+и выбирают победителя по накопленным суммам весов через searchsorted.
+
+Протокол розыгрыша (его можно повторить по данным БД):
+
+    1. ticket_set_hash — для receipt SHA-256 от строки
+       "receipt:{неделя}:{номера действующих билетов через запятую по возрастанию}"
+       (считается в Postgres: sha256 от string_agg), для остальных режимов SHA-256 от режима и массивов receipt_id,
+       user_id, weight (int64, little-endian) в порядке receipt_id.
+       Аннулирование билета меняет хэш в обоих случаях.
+    2. seed = SHA-256(f"{secret}:{ticket_set_hash}") как 256-битное число,
+       где secret — секрет недели. Его SHA-256 (обязательство) сохраняется
+       в lottery_commitments и публикуется до начала недели (commit_week),
+       сам секрет раскрывается в протоколе розыгрыша. Без обязательства,
+       опубликованного до начала недели, розыгрыш не проводится.
+    3. Генератор numpy.random.Generator(PCG64(seed)) выдаёт номер билета
+       (receipt) или r в [0, сумма весов) — победитель тот, на чей отрезок
+       весов попало r (user, items).
+
+Переигровка использует тот же секрет и исключает всех прежних победителей;
+исключения сохраняются в протоколе (draw_exclusions), поэтому verify
+повторяет и переигранный розыгрыш.
+"""
+
+import hashlib
+import json
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, and_, cast, func, literal, literal_column, Text
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import LOTTERY_DRAW_MODE
+from models.lottery_commitment_model import LotteryCommitment
+from models.lottery_ticket_model import LotteryTicket
+from services.lottery_ticket_service import lottery_ticket_service, week_key_for
+from logger import logger
+
+DRAW_MODES = ("receipt", "user", "items")
+
+# Сколько номеров тянуть в режиме receipt, прежде чем перейти к выгрузке билетов
+MAX_NUMBER_ATTEMPTS = 64
+
+
+class LotteryDrawService:
+    """Сервис проведения взвешенного розыгрыша"""
+
+    @staticmethod
+    def _tickets_query(
+        week_key: str,
+        mode: str,
+        exclude_receipt_ids: Sequence[int] = (),
+        exclude_user_ids: Sequence[int] = (),
+    ):
+        conditions = [
+            LotteryTicket.week_key == week_key,
+            LotteryTicket.voided_at.is_(None),
+        ]
+        if exclude_receipt_ids:
+            conditions.append(LotteryTicket.receipt_id.notin_(exclude_receipt_ids))
+        if exclude_user_ids:
+            conditions.append(LotteryTicket.user_id.notin_(exclude_user_ids))
+
+        if mode == "user":
+            receipt_id = func.min(LotteryTicket.receipt_id)
+            return (
+                select(receipt_id, LotteryTicket.user_id, literal(1))
+                .where(and_(*conditions))
+                .group_by(LotteryTicket.user_id)
+                .order_by(receipt_id)
+            )
+        weight = LotteryTicket.weight if mode == "items" else literal(1)
+        return (
+            select(LotteryTicket.receipt_id, LotteryTicket.user_id, weight)
+            .where(and_(*conditions))
+            .order_by(LotteryTicket.receipt_id)
+        )
+
+    @staticmethod
+    async def load_tickets(
+        session: AsyncSession,
+        week_key: str,
+        mode: str = "receipt",
+        exclude_receipt_ids: Sequence[int] = (),
+        exclude_user_ids: Sequence[int] = (),
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Выгружает действующие билеты недели в массивы NumPy
+
+        Args:
+            session: Сессия базы данных
+            week_key: ISO-неделя (например, 2026-W42)
+            mode: Режим розыгрыша (receipt, user, items)
+            exclude_receipt_ids: Чеки, которые не участвуют
+            exclude_user_ids: Пользователи, которые не участвуют
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: receipt_id, user_id, weight (int64)
+        """
+        if mode not in DRAW_MODES:
+            raise ValueError(f"Неизвестный режим розыгрыша: {mode}")
+
+        stmt = LotteryDrawService._tickets_query(
+            week_key, mode, exclude_receipt_ids, exclude_user_ids
+        )
+        chunks = []
+        result = await session.stream(stmt.execution_options(yield_per=50000))
+        async for partition in result.partitions():
+            chunks.append(np.array(partition, dtype=np.int64).reshape(-1, 3))
+
+        if not chunks:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        tickets = np.concatenate(chunks)
+        return tickets[:, 0].copy(), tickets[:, 1].copy(), tickets[:, 2].copy()
+
+    @staticmethod
+    async def number_set_hash(session: AsyncSession, week_key: str) -> str:
+        """
+        Хэш номеров действующих билетов для режима receipt (SHA-256, hex)
+
+        Считается в базе одним агрегатом: номера в Python не выгружаются.
+        """
+        numbers = func.coalesce(
+            func.string_agg(
+                cast(LotteryTicket.ticket_no, Text),
+                aggregate_order_by(literal(","), LotteryTicket.ticket_no),
+            ),
+            "",
+        )
+        payload = literal(f"receipt:{week_key}:") + numbers
+        result = await session.execute(
+            select(
+                func.encode(
+                    func.sha256(func.convert_to(payload, literal_column("'UTF8'"))),
+                    literal_column("'hex'"),
+                )
+            ).where(
+                and_(
+                    LotteryTicket.week_key == week_key,
+                    LotteryTicket.voided_at.is_(None),
+                )
+            )
+        )
+        return result.scalar_one()
+
+    @staticmethod
+    def ticket_set_hash(
+        mode: str, receipt_ids: np.ndarray, user_ids: np.ndarray, weights: np.ndarray
+    ) -> str:
+        """Хэш набора билетов (SHA-256, hex)"""
+        digest = hashlib.sha256(mode.encode())
+        for array in (receipt_ids, user_ids, weights):
+            digest.update(np.ascontiguousarray(array, dtype="<i8").tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def commitment_for(secret: str) -> str:
+        """Обязательство — SHA-256 секрета недели (hex)"""
+        return hashlib.sha256(secret.encode()).hexdigest()
+
+    @staticmethod
+    def derive_seed(secret: str, ticket_hash: str) -> str:
+        """Сид генератора из секрета недели и хэша билетов (SHA-256, hex)"""
+        return hashlib.sha256(f"{secret}:{ticket_hash}".encode()).hexdigest()
+
+    @staticmethod
+    def pick_index(weights: np.ndarray, seed: str) -> int:
+        """
+        Выбирает номер билета пропорционально весам
+
+        Args:
+            weights: Веса билетов (положительные целые)
+            seed: Сид в виде hex-строки
+
+        Returns:
+            int: Номер выигравшего билета в массиве
+        """
+        cumulative = np.cumsum(weights, dtype=np.int64)
+        rng = np.random.Generator(np.random.PCG64(int(seed, 16)))
+        r = rng.integers(0, cumulative[-1])
+        return int(np.searchsorted(cumulative, r, side="right"))
+
+    @staticmethod
+    async def _draw_by_number(
+        session: AsyncSession,
+        week_key: str,
+        secret: str,
+        exclude_receipt_ids: Sequence[int] = (),
+        exclude_user_ids: Sequence[int] = (),
+    ) -> Optional[Dict[str, Any]]:
+        """Режим receipt: номер билета в [1, N] и чтение одной строки"""
+        counter = await lottery_ticket_service.get_week_counter(session, week_key)
+        if counter is None or counter.active_count <= 0:
+            return None
+
+        ticket_hash = await LotteryDrawService.number_set_hash(session, week_key)
+        seed = LotteryDrawService.derive_seed(secret, ticket_hash)
+        rng = np.random.Generator(np.random.PCG64(int(seed, 16)))
+
+        for _ in range(MAX_NUMBER_ATTEMPTS):
+            ticket_no = int(rng.integers(1, counter.tickets_count + 1))
+            ticket = await lottery_ticket_service.get_ticket(
+                session, week_key, ticket_no
+            )
+            if (
+                ticket is None
+                or ticket.voided_at is not None
+                or ticket.receipt_id in exclude_receipt_ids
+                or ticket.user_id in exclude_user_ids
+            ):
+                continue
+            return {
+                "receipt_id": ticket.receipt_id,
+                "user_id": ticket.user_id,
+                "ticket_no": ticket_no,
+                "mode": "receipt",
+                "ticket_set_hash": ticket_hash,
+                "seed": seed,
+                "tickets_count": counter.active_count,
+                "total_weight": counter.active_count,
+            }
+        return None
+
+    @staticmethod
+    async def _draw_by_weight(
+        session: AsyncSession,
+        week_key: str,
+        mode: str,
+        secret: str,
+        exclude_receipt_ids: Sequence[int] = (),
+        exclude_user_ids: Sequence[int] = (),
+    ) -> Optional[Dict[str, Any]]:
+        """Режимы user и items (и запасной путь для receipt): выгрузка билетов"""
+        receipt_ids, user_ids, weights = await LotteryDrawService.load_tickets(
+            session, week_key, mode, exclude_receipt_ids, exclude_user_ids
+        )
+        if len(receipt_ids) == 0:
+            return None
+
+        ticket_hash = LotteryDrawService.ticket_set_hash(
+            mode, receipt_ids, user_ids, weights
+        )
+        seed = LotteryDrawService.derive_seed(secret, ticket_hash)
+        index = LotteryDrawService.pick_index(weights, seed)
+        return {
+            "receipt_id": int(receipt_ids[index]),
+            "user_id": int(user_ids[index]),
+            "mode": mode,
+            "ticket_set_hash": ticket_hash,
+            "seed": seed,
+            "tickets_count": len(receipt_ids),
+            "total_weight": int(weights.sum()),
+        }
+
+    @staticmethod
+    async def commit_week(session: AsyncSession, week_start: datetime) -> LotteryCommitment:
+        """
+        Публикует обязательство розыгрыша недели (если его ещё нет)
+
+        Секрет генерируется один раз: повторный вызов возвращает
+        уже опубликованное обязательство.
+
+        Args:
+            session: Сессия базы данных
+            week_start: Любой момент недели
+
+        Returns:
+            LotteryCommitment: Обязательство недели
+        """
+        week_key = week_key_for(week_start)
+        secret = secrets.token_hex(32)
+        await session.execute(
+            insert(LotteryCommitment)
+            .values(
+                week_key=week_key,
+                commitment=LotteryDrawService.commitment_for(secret),
+                secret=secret,
+            )
+            .on_conflict_do_nothing(index_elements=[LotteryCommitment.week_key])
+        )
+        await session.commit()
+        commitment = await session.get(LotteryCommitment, week_key)
+        logger.info(f"Обязательство розыгрыша {week_key}: {commitment.commitment}")
+        return commitment
+
+    @staticmethod
+    async def commit_next_week(session: AsyncSession) -> LotteryCommitment:
+        """Публикует обязательство следующей недели (задача планировщика)"""
+        return await LotteryDrawService.commit_week(
+            session, datetime.now() + timedelta(weeks=1)
+        )
+
+    @staticmethod
+    async def get_recent_commitments(
+        session: AsyncSession, limit: int = 4
+    ) -> List[LotteryCommitment]:
+        """Последние опубликованные обязательства"""
+        result = await session.execute(
+            select(LotteryCommitment)
+            .order_by(LotteryCommitment.week_key.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def get_week_secret(
+        session: AsyncSession, week_start: datetime
+    ) -> Optional[str]:
+        """
+        Секрет недели, если обязательство опубликовано до её начала
+
+        Args:
+            session: Сессия базы данных
+            week_start: Начало недели
+
+        Returns:
+            Optional[str]: Секрет или None
+        """
+        commitment = await session.get(LotteryCommitment, week_key_for(week_start))
+        if commitment is None or commitment.created_at is None:
+            return None
+        if commitment.created_at >= week_start:
+            logger.warning(
+                f"Обязательство {commitment.week_key} опубликовано после начала недели"
+            )
+            return None
+        return commitment.secret
+
+    @staticmethod
+    def parse_exclusions(lottery) -> Tuple[List[int], List[int]]:
+        """Исключённые чеки и пользователи из протокола WeeklyLottery"""
+        if not lottery.draw_exclusions:
+            return [], []
+        exclusions = json.loads(lottery.draw_exclusions)
+        return exclusions.get("receipt_ids", []), exclusions.get("user_ids", [])
+
+    @staticmethod
+    async def draw(
+        session: AsyncSession,
+        week_start: datetime,
+        week_end: datetime,
+        mode: str = "receipt",
+        secret: Optional[str] = None,
+        exclude_receipt_ids: Sequence[int] = (),
+        exclude_user_ids: Sequence[int] = (),
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Проводит розыгрыш среди билетов недели
+
+        Args:
+            session: Сессия базы данных
+            week_start: Начало недели
+            week_end: Конец недели
+            mode: Режим розыгрыша (receipt, user, items)
+            secret: Раскрытый секрет недели (по умолчанию — из обязательства,
+                опубликованного до начала недели)
+            exclude_receipt_ids: Чеки, которые не участвуют
+            exclude_user_ids: Пользователи, которые не участвуют
+
+        Returns:
+            Optional[Dict[str, Any]]: Победитель и протокол розыгрыша
+                или None, если билетов нет
+
+        Raises:
+            ValueError: Неизвестный режим или нет обязательства недели
+        """
+        if mode not in DRAW_MODES:
+            raise ValueError(f"Неизвестный режим розыгрыша: {mode}")
+
+        week_key = week_key_for(week_start)
+        if secret is None:
+            secret = await LotteryDrawService.get_week_secret(session, week_start)
+        if secret is None:
+            raise ValueError(
+                f"Нет обязательства розыгрыша {week_key}, опубликованного до начала недели"
+            )
+
+        result = None
+        if mode == "receipt":
+            result = await LotteryDrawService._draw_by_number(
+                session, week_key, secret, exclude_receipt_ids, exclude_user_ids
+            )
+        if result is None:
+            # Для receipt — если почти все номера аннулированы или исключены
+            result = await LotteryDrawService._draw_by_weight(
+                session, week_key, mode, secret, exclude_receipt_ids, exclude_user_ids
+            )
+        if result is None:
+            return None
+
+        result["commitment"] = LotteryDrawService.commitment_for(secret)
+        result["secret"] = secret
+        result["exclude_receipt_ids"] = list(exclude_receipt_ids)
+        result["exclude_user_ids"] = list(exclude_user_ids)
+        logger.info(
+            f"Розыгрыш {week_key} ({mode}): {result['tickets_count']} билетов, "
+            f"вес {result['total_weight']}, хэш {result['ticket_set_hash'][:16]}…, "
+            f"победитель — чек {result['receipt_id']}"
+        )
+        return result
+
+    @staticmethod
+    def apply_to_lottery(lottery, result: Dict[str, Any]) -> None:
+        """Записывает победителя и протокол розыгрыша в WeeklyLottery"""
+        lottery.winner_receipt_id = result["receipt_id"]
+        lottery.winner_user_id = result["user_id"]
+        lottery.draw_mode = result["mode"]
+        lottery.draw_commitment = result["commitment"]
+        lottery.draw_secret = result["secret"]
+        lottery.ticket_set_hash = result["ticket_set_hash"]
+        lottery.draw_seed = result["seed"]
+        lottery.tickets_count = result["tickets_count"]
+        lottery.tickets_weight = result["total_weight"]
+        if result["exclude_receipt_ids"] or result["exclude_user_ids"]:
+            lottery.draw_exclusions = json.dumps(
+                {
+                    "receipt_ids": result["exclude_receipt_ids"],
+                    "user_ids": result["exclude_user_ids"],
+                }
+            )
+        else:
+            lottery.draw_exclusions = None
+
+    @staticmethod
+    async def reroll(session: AsyncSession, lottery) -> Optional[Dict[str, Any]]:
+        """
+        Переигрывает розыгрыш с тем же секретом, исключая прежних победителей
+
+        Args:
+            session: Сессия базы данных
+            lottery: Запись WeeklyLottery
+
+        Returns:
+            Optional[Dict[str, Any]]: Новый победитель и протокол
+                или None, если больше некого выбрать
+        """
+        mode = lottery.draw_mode or LOTTERY_DRAW_MODE
+        receipt_ids, user_ids = LotteryDrawService.parse_exclusions(lottery)
+        if mode == "user":
+            if lottery.winner_user_id is not None and lottery.winner_user_id not in user_ids:
+                user_ids.append(lottery.winner_user_id)
+        elif lottery.winner_receipt_id is not None and lottery.winner_receipt_id not in receipt_ids:
+            receipt_ids.append(lottery.winner_receipt_id)
+
+        return await LotteryDrawService.draw(
+            session,
+            lottery.week_start,
+            lottery.week_end,
+            mode,
+            lottery.draw_secret,
+            receipt_ids,
+            user_ids,
+        )
+
+    @staticmethod
+    async def verify(session: AsyncSession, lottery) -> Dict[str, Any]:
+        """
+        Повторяет розыгрыш по сохранённому протоколу
+
+        Проверяет, что раскрытый секрет соответствует обязательству,
+        опубликованному до начала недели, и что повтор с сохранёнными
+        исключениями даёт тот же набор билетов и того же победителя.
+
+        Args:
+            session: Сессия базы данных
+            lottery: Запись WeeklyLottery
+
+        Returns:
+            Dict[str, Any]: Совпадают ли обязательство, набор билетов и победитель
+        """
+        if not lottery.draw_secret or not lottery.draw_commitment or not lottery.draw_mode:
+            return {"success": False, "error": "Розыгрыш проведён без протокола"}
+
+        published = await session.get(LotteryCommitment, week_key_for(lottery.week_start))
+        commitment_match = (
+            LotteryDrawService.commitment_for(lottery.draw_secret) == lottery.draw_commitment
+            and published is not None
+            and published.commitment == lottery.draw_commitment
+            and published.created_at is not None
+            and published.created_at < lottery.week_start
+        )
+
+        receipt_ids, user_ids = LotteryDrawService.parse_exclusions(lottery)
+        result = await LotteryDrawService.draw(
+            session,
+            lottery.week_start,
+            lottery.week_end,
+            lottery.draw_mode,
+            lottery.draw_secret,
+            receipt_ids,
+            user_ids,
+        )
+        if result is None:
+            return {"success": False, "error": "Нет билетов для проверки"}
+
+        tickets_match = result["ticket_set_hash"] == lottery.ticket_set_hash
+        return {
+            "success": True,
+            "commitment_match": commitment_match,
+            "tickets_match": tickets_match,
+            "winner_match": commitment_match
+            and tickets_match
+            and result["receipt_id"] == lottery.winner_receipt_id,
+            "receipt_id": result["receipt_id"],
+        }
+
+
+# Создаем экземпляр сервиса
+lottery_draw_service = LotteryDrawService()
@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.receipt_model import Receipt
 from models.user_model import User
+from services.reachability_service import reachability_service
 from logger import logger
 
 
@@ -77,11 +78,13 @@ async def notify_winner(session: AsyncSession, bot, user_id: int) -> bool:
         )
 
         logger.info(f"Отправлено уведомление о победе пользователю {user_id}")
+        await reachability_service.record(user_id)
 
         return True
 
     except Exception as e:
         logger.error(f"Ошибка при отправке уведомления победителю: {str(e)}")
+        await reachability_service.record(user_id, e)
         return False
 
 
@@ -91,41 +94,31 @@ async def notify_participants(session: AsyncSession, bot, winner_id: int) -> dic
 
     Args:
         session: Сессия базы данных
-        bot: Экземпляр бота для отправки сообщений
+        bot: Экземпляр бота для отправки сообщений (None — бот создаётся на время рассылки)
         winner_id: ID пользователя-победителя
 
     Returns:
         dict: Статистика рассылки
     """
     try:
-        # Получаем всех пользователей, кроме победителя
-        users_query = await session.execute(select(User).where(User.id != winner_id))
-        users = users_query.scalars().all()
-
-        sent_count = 0
-        error_count = 0
-
-        # Отправляем сообщения всем участникам
-        for user in users:
-            try:
-                await bot.send_message(
-                    user.id,
-                    "Розыгрыш главного приза завершен! К сожалению, в этот раз вы не стали победителем. "
-                    "Но не расстраивайтесь, впереди еще много розыгрышей! "
-                    "Продолжайте регистрировать чеки и участвовать в акции.",
-                )
-                sent_count += 1
-            except Exception as e:
-                logger.error(
-                    f"Ошибка при отправке уведомления пользователю {user.id}: {str(e)}"
-                )
-                error_count += 1
-
-        logger.info(
-            f"Отправлено {sent_count} уведомлений участникам розыгрыша, ошибок: {error_count}"
+        # Рассылка через общий движок: лимиты Telegram, повторы, продолжение после сбоя
+        from services.broadcast_service import broadcast_service
+        from services.audience_service import AudienceFilter
+
+        result = await broadcast_service.send(
+            bot,
+            text="Розыгрыш главного приза завершен! К сожалению, в этот раз вы не стали победителем. "
+            "Но не расстраивайтесь, впереди еще много розыгрышей! "
+            "Продолжайте регистрировать чеки и участвовать в акции.",
+            kind="lottery",
+            audience=AudienceFilter(exclude_user_ids=[winner_id]),
         )
-
-        return {"success": True, "sent_count": sent_count, "error_count": error_count}
+        if result["success"]:
+            logger.info(
+                f"Отправлено {result['sent_count']} уведомлений участникам розыгрыша, "
+                f"ошибок: {result['error_count']}"
+            )
+        return result
 
     except Exception as e:
         logger.error(f"Ошибка при рассылке уведомлений участникам: {str(e)}")
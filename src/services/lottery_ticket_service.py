@@ -0,0 +1,159 @@
+from datetime import datetime
+from typing import Optional, List
+from sqlalchemy import select, update, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.receipt_model import Receipt
+from models.lottery_ticket_model import LotteryTicket, LotteryWeekCounter
+from logger import logger
+
+
+def week_key_for(moment: datetime) -> str:
+    """
+    Ключ ISO-недели (совпадает с to_char(..., 'IYYY-"W"IW') в Postgres)
+
+    Args:
+        moment: Дата и время
+
+    Returns:
+        str: Например, 2026-W42
+    """
+    iso = moment.isocalendar()
+    return f"{iso[0]}-W{iso[1]:02d}"
+
+
+class LotteryTicketService:
+    """Сервис билетов еженедельного розыгрыша"""
+
+    @staticmethod
+    async def sync_receipt(session: AsyncSession, receipt: Receipt) -> None:
+        """
+        Приводит билет чека в соответствие с его статусом
+
+        Вызывается в той же транзакции, что и изменение статуса чека, до commit.
+        Подтверждённый чек с товарами «Айсида» получает следующий номер недели,
+        отклонённый — аннулирует билет (номер сохраняется, чтобы нумерация
+        оставалась без пропусков).
+
+        Args:
+            session: Сессия базы данных
+            receipt: Чек
+        """
+        eligible = receipt.status == "verified" and (receipt.items_count or 0) > 0
+
+        if not eligible:
+            voided = await session.execute(
+                update(LotteryTicket)
+                .where(
+                    and_(
+                        LotteryTicket.receipt_id == receipt.id,
+                        LotteryTicket.voided_at.is_(None),
+                    )
+                )
+                .values(voided_at=datetime.now())
+                .returning(LotteryTicket.week_key)
+            )
+            week_key = voided.scalar()
+            if week_key is not None:
+                await LotteryTicketService._bump_active(session, week_key, -1)
+                logger.info(f"Билет чека {receipt.id} аннулирован ({week_key})")
+            return
+
+        # Блокируем строку чека: SELECT ... FOR UPDATE по ещё не выданному билету
+        # ничего не блокирует, и две синхронизации одного чека взяли бы
+        # по номеру. Вторая дождётся commit первой и увидит её билет
+        await session.flush()
+        await session.execute(
+            select(Receipt.id).where(Receipt.id == receipt.id).with_for_update()
+        )
+        existing = await session.execute(
+            select(LotteryTicket)
+            .where(LotteryTicket.receipt_id == receipt.id)
+            .with_for_update()
+        )
+        ticket = existing.scalars().first()
+        if ticket is not None:
+            ticket.weight = receipt.items_count
+            if ticket.voided_at is not None:
+                ticket.voided_at = None
+                await LotteryTicketService._bump_active(session, ticket.week_key, 1)
+                logger.info(f"Билет чека {receipt.id} восстановлен ({ticket.week_key})")
+            return
+
+        # Следующий номер недели: строка счётчика блокируется до commit,
+        # поэтому номера выдаются по порядку и без пропусков
+        week_key = week_key_for(receipt.created_at or datetime.now())
+        counter = await session.execute(
+            insert(LotteryWeekCounter)
+            .values(week_key=week_key, tickets_count=1, active_count=1)
+            .on_conflict_do_update(
+                index_elements=[LotteryWeekCounter.week_key],
+                set_={
+                    "tickets_count": LotteryWeekCounter.tickets_count + 1,
+                    "active_count": LotteryWeekCounter.active_count + 1,
+                    "updated_at": datetime.now(),
+                },
+            )
+            .returning(LotteryWeekCounter.tickets_count)
+        )
+        ticket_no = counter.scalar_one()
+        session.add(
+            LotteryTicket(
+                week_key=week_key,
+                ticket_no=ticket_no,
+                receipt_id=receipt.id,
+                user_id=receipt.user_id,
+                weight=receipt.items_count,
+            )
+        )
+        logger.info(f"Чеку {receipt.id} выдан билет №{ticket_no} ({week_key})")
+
+    @staticmethod
+    async def _bump_active(session: AsyncSession, week_key: str, delta: int) -> None:
+        await session.execute(
+            update(LotteryWeekCounter)
+            .where(LotteryWeekCounter.week_key == week_key)
+            .values(
+                active_count=LotteryWeekCounter.active_count + delta,
+                updated_at=datetime.now(),
+            )
+        )
+
+    @staticmethod
+    async def get_week_counter(
+        session: AsyncSession, week_key: str
+    ) -> Optional[LotteryWeekCounter]:
+        """Счётчики недели (None, если билетов не было)"""
+        return await session.get(LotteryWeekCounter, week_key)
+
+    @staticmethod
+    async def get_ticket(
+        session: AsyncSession, week_key: str, ticket_no: int
+    ) -> Optional[LotteryTicket]:
+        """Билет по номеру в неделе"""
+        result = await session.execute(
+            select(LotteryTicket).where(
+                and_(
+                    LotteryTicket.week_key == week_key,
+                    LotteryTicket.ticket_no == ticket_no,
+                )
+            )
+        )
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_recent_weeks(
+        session: AsyncSession, limit: int = 8
+    ) -> List[LotteryWeekCounter]:
+        """Счётчики последних недель (для админки)"""
+        result = await session.execute(
+            select(LotteryWeekCounter)
+            .order_by(LotteryWeekCounter.week_key.desc())
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+
+# Создаем экземпляр сервиса
+lottery_ticket_service = LotteryTicketService()
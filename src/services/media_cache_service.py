@@ -0,0 +1,214 @@
+"""
+Кэш file_id картинок Telegram
+
+Картинка загружается в Telegram один раз: file_id из ответа сохраняется
+в таблице media_files по SHA-256 содержимого и ID бота, и все следующие
+отправки идут по file_id. Если Telegram отвечает, что file_id больше
+недействителен, запись удаляется и файл загружается заново.
+
+Одновременные отправки одной ещё не загруженной картинки (начало рассылки)
+ждут первую загрузку, а не загружают файл каждая сама.
+"""
+
+import asyncio
+import hashlib
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+
+from database import async_session
+from models.media_file_model import MediaFile
+from logger import logger
+
+# Фрагменты ошибок Telegram, означающие недействительный file_id
+STALE_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file_id",
+    "file reference",
+    "media_empty",
+)
+
+# (bot_id, content_hash) -> file_id
+_file_ids: Dict[Tuple[int, str], str] = {}
+# (путь, mtime, размер) -> content_hash, чтобы не читать файл при каждой отправке
+_hashes: Dict[Tuple[str, int, int], str] = {}
+# Блокировки первой загрузки
+_upload_locks: Dict[tuple, asyncio.Lock] = {}
+
+
+def is_stale_file_id(error: Exception) -> bool:
+    """Проверяет, что Telegram отклонил отправку из-за недействительного file_id"""
+    text = str(error).lower()
+    return any(fragment in text for fragment in STALE_FILE_ID_ERRORS)
+
+
+class MediaCacheService:
+    """Сервис кэша file_id картинок"""
+
+    @staticmethod
+    def content_hash(path: str) -> str:
+        """
+        SHA-256 содержимого файла (пересчитывается, только если файл изменился)
+
+        Args:
+            path: Путь к файлу
+
+        Returns:
+            str: Хэш в шестнадцатеричном виде
+        """
+        path = os.path.abspath(str(path))
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        content_hash = _hashes.get(key)
+        if content_hash is None:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            content_hash = _hashes[key] = digest.hexdigest()
+        return content_hash
+
+    @staticmethod
+    async def get_file_id(bot_id: int, content_hash: str) -> Optional[str]:
+        """file_id из памяти процесса или из базы"""
+        key = (bot_id, content_hash)
+        file_id = _file_ids.get(key)
+        if file_id is not None:
+            return file_id
+
+        async with async_session() as session:
+            media = await session.get(MediaFile, key)
+            if media is None:
+                return None
+            media.last_used_at = datetime.now()
+            await session.commit()
+            _file_ids[key] = media.file_id
+            return media.file_id
+
+    @staticmethod
+    async def _store(bot_id: int, content_hash: str, photo, path: str) -> None:
+        """Сохраняет file_id самой крупной копии фото из ответа Telegram"""
+        _file_ids[(bot_id, content_hash)] = photo.file_id
+        values = {
+            "file_id": photo.file_id,
+            "file_unique_id": photo.file_unique_id,
+            "path": str(path)[:500],
+            "last_used_at": datetime.now(),
+        }
+        try:
+            async with async_session() as session:
+                await session.execute(
+                    insert(MediaFile)
+                    .values(bot_id=bot_id, content_hash=content_hash, **values)
+                    .on_conflict_do_update(
+                        index_elements=[MediaFile.bot_id, MediaFile.content_hash],
+                        set_=values,
+                    )
+                )
+                await session.commit()
+            logger.info(f"Картинка {path} загружена в Telegram, file_id сохранён")
+        except Exception as e:
+            # Без записи в базе следующий процесс просто загрузит файл ещё раз
+            logger.error(f"Не удалось сохранить file_id для {path}: {str(e)}")
+
+    @staticmethod
+    async def _forget(bot_id: int, content_hash: str) -> None:
+        """Удаляет недействительный file_id"""
+        _file_ids.pop((bot_id, content_hash), None)
+        async with async_session() as session:
+            await session.execute(
+                delete(MediaFile).where(
+                    MediaFile.bot_id == bot_id, MediaFile.content_hash == content_hash
+                )
+            )
+            await session.commit()
+
+    @staticmethod
+    async def send_photo(bot, chat_id: int, path: str, **kwargs):
+        """
+        Отправляет картинку, загружая файл в Telegram только при первой отправке
+
+        Args:
+            bot: Экземпляр бота
+            chat_id: ID чата
+            path: Путь к файлу картинки
+            **kwargs: Остальные параметры bot.send_photo (caption, reply_markup...)
+
+        Returns:
+            Message: Отправленное сообщение
+        """
+        from aiogram.exceptions import TelegramBadRequest
+        from aiogram.types import FSInputFile
+
+        content_hash = MediaCacheService.content_hash(path)
+        file_id = await MediaCacheService.get_file_id(bot.id, content_hash)
+        if file_id is not None:
+            try:
+                return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if not is_stale_file_id(e):
+                    raise
+                logger.warning(f"file_id для {path} недействителен, загружаю заново: {str(e)}")
+                await MediaCacheService._forget(bot.id, content_hash)
+
+        lock = _upload_locks.setdefault((bot.id, content_hash), asyncio.Lock())
+        async with lock:
+            # Пока ждали, файл мог загрузить другой получатель
+            file_id = _file_ids.get((bot.id, content_hash))
+            if file_id is not None:
+                return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+            message = await bot.send_photo(chat_id, photo=FSInputFile(str(path)), **kwargs)
+            await MediaCacheService._store(bot.id, content_hash, message.photo[-1], path)
+            return message
+
+    @staticmethod
+    async def send_media_group(
+        bot, chat_id: int, paths: Sequence[str], caption: Optional[str] = None
+    ) -> List:
+        """
+        Отправляет альбом картинок с подписью у первой, используя кэш file_id
+
+        Returns:
+            List[Message]: Сообщения альбома
+        """
+        from aiogram.exceptions import TelegramBadRequest
+        from aiogram.types import FSInputFile, InputMediaPhoto
+
+        hashes = [MediaCacheService.content_hash(p) for p in paths]
+
+        def album(file_ids):
+            return [
+                InputMediaPhoto(
+                    media=file_id or FSInputFile(str(path)),
+                    caption=caption if idx == 0 and caption else None,
+                )
+                for idx, (path, file_id) in enumerate(zip(paths, file_ids))
+            ]
+
+        file_ids = [await MediaCacheService.get_file_id(bot.id, h) for h in hashes]
+        if all(file_ids):
+            try:
+                return await bot.send_media_group(chat_id, media=album(file_ids))
+            except TelegramBadRequest as e:
+                if not is_stale_file_id(e):
+                    raise
+                logger.warning(f"file_id альбома недействителен, загружаю заново: {str(e)}")
+                for h in hashes:
+                    await MediaCacheService._forget(bot.id, h)
+
+        lock = _upload_locks.setdefault((bot.id, *hashes), asyncio.Lock())
+        async with lock:
+            file_ids = [_file_ids.get((bot.id, h)) for h in hashes]
+            messages = await bot.send_media_group(chat_id, media=album(file_ids))
+            for path, h, file_id, message in zip(paths, hashes, file_ids, messages):
+                if file_id is None and message.photo:
+                    await MediaCacheService._store(bot.id, h, message.photo[-1], path)
+            return messages
+
+
+# Создаем экземпляр сервиса
+media_cache_service = MediaCacheService()
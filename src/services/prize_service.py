@@ -1,13 +1,17 @@
 import os
 import random
 from typing import Optional, List
-from sqlalchemy import select
+from sqlalchemy import select, exists, literal, false, true, union_all
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
 from models.prize_model import Prize
 from models.receipt_model import Receipt
+from models.promocode_model import Promocode
 from services.promocode_service import promocode_service
+from services.promocode_pool_service import promocode_pool
+from config import PROMOCODE_COUNTERS
 from logger import logger
 
 
@@ -77,34 +81,22 @@ async def issue_prize(session: AsyncSession, receipt_id: int, items_count: int)
     """
     Выдает подарок за чек в зависимости от количества товаров Айсида
 
+    Выдача — одна транзакция из одного запроса и commit: в WITH код
+    помечается использованным (FOR UPDATE SKIP LOCKED), подарок вставляется
+    с ON CONFLICT (receipt_id) DO NOTHING, и тем же запросом читается уже
+    выданный за чек подарок. Повторный вызов для того же чека возвращает
+    ранее выданный подарок и не тратит новый код.
+
     Args:
         session: Сессия базы данных
         receipt_id: ID чека
         items_count: Количество товаров Айсида в чеке
 
     Returns:
-        dict: Данные выданного подарка
+        dict: Данные выданного подарка (already_issued=True — выдан ранее)
     """
+    pooled = None
     try:
-        # Проверяем существование чека
-        receipt_query = await session.execute(
-            select(Receipt).where(Receipt.id == receipt_id)
-        )
-        receipt = receipt_query.scalars().first()
-
-        if not receipt:
-            logger.error(f"Чек с ID {receipt_id} не найден")
-            return {"success": False, "error": "Чек не найден"}
-
-        # Проверяем, был ли уже выдан подарок за этот чек
-        existing_prize = await session.execute(
-            select(Prize).where(Prize.receipt_id == receipt_id)
-        )
-
-        if existing_prize.scalars().first():
-            logger.error(f"Подарок за чек с ID {receipt_id} уже был выдан")
-            return {"success": False, "error": "Подарок за этот чек уже был выдан"}
-
         # Определяем размер скидки в зависимости от количества товаров
         if items_count == 1:
             discount_amount = 200
@@ -116,57 +108,144 @@ async def issue_prize(session: AsyncSession, receipt_id: int, items_count: int)
             logger.error(f"Некорректное количество товаров Айсида: {items_count}")
             return {"success": False, "error": "В чеке не найдены товары Айсида"}
 
-        # Получаем доступный промокод из базы данных
-        promocode = await promocode_service.get_available_promocode(
-            session, discount_amount
-        )
+        receipt_found = exists().where(Receipt.id == receipt_id)
+        not_issued = ~exists().where(Prize.receipt_id == receipt_id)
+        out_of_codes = {
+            "success": False,
+            "error": f"К сожалению, промокоды на скидку {discount_amount} руб. временно закончились",
+        }
 
-        if not promocode:
-            logger.error(f"Промокоды на {discount_amount} руб. закончились")
-            return {
-                "success": False,
-                "error": f"К сожалению, промокоды на скидку {discount_amount} руб. временно закончились",
-            }
-
-        # Создаем новый подарок с привязкой к промокоду в БД
-        new_prize = Prize(
-            receipt_id=receipt_id,
-            type=prize_type,
-            code=promocode.code,  # Дублируем код для обратной совместимости
-            promocode_id=promocode.id,  # Новая связь с таблицей промокодов
-            discount_amount=discount_amount,
-            used=False,
+        # Код: из локального пула процесса или первый свободный в базе
+        if promocode_pool.enabled:
+            pooled = await promocode_pool.take(discount_amount)
+            if pooled is None:
+                logger.error(f"Промокоды на {discount_amount} руб. закончились")
+                return out_of_codes
+            # Код могли отключить, пока он лежал в пуле
+            code_active = exists().where(
+                Promocode.id == pooled.id, Promocode.is_active == True
+            )
+            claimed = (
+                select(literal(pooled.id).label("id"), literal(pooled.code).label("code"))
+                .where(receipt_found, not_issued, code_active)
+                .cte("claimed")
+            )
+            left = literal(None)
+        else:
+            code_active = true()
+            claimed = (
+                promocode_service.claim_statement(discount_amount, receipt_found, not_issued)
+                .returning(Promocode.id, Promocode.code)
+                .cte("claimed")
+            )
+            left = literal(None)
+            if PROMOCODE_COUNTERS:
+                counted = promocode_service.count_claimed(discount_amount, claimed).cte("counted")
+                left = select(counted.c.available).scalar_subquery()
+
+        inserted = (
+            insert(Prize)
+            .from_select(
+                ["receipt_id", "type", "code", "promocode_id", "discount_amount", "used"],
+                select(
+                    literal(receipt_id),
+                    literal(prize_type),
+                    claimed.c.code,  # Дублируем код для обратной совместимости
+                    claimed.c.id,
+                    literal(discount_amount),
+                    false(),
+                ),
+            )
+            .on_conflict_do_nothing(index_elements=[Prize.receipt_id])
+            .returning(Prize.id, Prize.code, Prize.promocode_id, Prize.type, Prize.discount_amount)
+            .cte("inserted")
         )
+        prize_columns = (Prize.id, Prize.code, Prize.promocode_id, Prize.type, Prize.discount_amount)
+        prize = union_all(
+            select(*inserted.c, true().label("is_new")),
+            select(*prize_columns, false().label("is_new")).where(Prize.receipt_id == receipt_id),
+        ).subquery("prize")
+        one = select(literal(1).label("one")).subquery("one")
+
+        result = await session.execute(
+            select(
+                receipt_found.label("receipt_found"),
+                select(claimed.c.id).scalar_subquery().label("claimed_id"),
+                left.label("left"),
+                code_active.label("code_active"),
+                prize,
+            ).select_from(one.outerjoin(prize, true()))
+        )
+        row = result.one()
+
+        if row.id is not None and row.is_new:
+            await session.commit()
+            if pooled is not None:
+                promocode_pool.confirm(pooled)
+                pooled = None
+            else:
+                promocode_service.check_low_stock(discount_amount, row.left, 1)
+            logger.info(
+                f"Выдан промокод {row.code} на {discount_amount} руб. за чек {receipt_id} (ID промокода в БД: {row.promocode_id})"
+            )
+            return _prize_result(row, items_count, already_issued=False)
+
+        # Ничего не выдано: закрываем транзакцию (снимает блокировку кода,
+        # если чек одновременно получил подарок в другой транзакции)
+        await session.rollback()
+        if pooled is not None:
+            if not row.code_active:
+                # Отключённый код выбрасываем и берём из пула следующий
+                promocode_pool.drop(pooled)
+                if row.receipt_found and row.id is None:
+                    return await issue_prize(session, receipt_id, items_count)
+            else:
+                promocode_pool.give_back(pooled)
+            pooled = None
+
+        if not row.receipt_found:
+            logger.error(f"Чек с ID {receipt_id} не найден")
+            return {"success": False, "error": "Чек не найден"}
 
-        # Сохраняем подарок в БД
-        session.add(new_prize)
-        await session.commit()
-
-        # Обновляем объект, чтобы получить ID
-        await session.refresh(new_prize)
+        if row.id is None and row.claimed_id is None and not promocode_pool.enabled:
+            logger.warning(f"Промокоды на {discount_amount} руб. закончились")
+            return out_of_codes
 
-        logger.info(
-            f"Выдан промокод {promocode.code} на {discount_amount} руб. за чек {receipt_id} (ID промокода в БД: {promocode.id})"
-        )
+        if row.id is None:
+            # Подарок выдан параллельной транзакцией уже после начала нашего запроса
+            existing = await session.execute(
+                select(*prize_columns).where(Prize.receipt_id == receipt_id)
+            )
+            row = existing.one()
 
-        return {
-            "success": True,
-            "prize_id": new_prize.id,
-            "type": prize_type,
-            "code": promocode.code,
-            "discount_amount": discount_amount,
-            "items_count": items_count,
-            "promocode_id": promocode.id,
-        }
+        logger.info(f"Подарок за чек с ID {receipt_id} уже был выдан: {row.code}")
+        return _prize_result(row, items_count, already_issued=True)
 
     except Exception as e:
         try:
             await session.rollback()
         except Exception as rollback_error:
             logger.error(f"Ошибка при откате транзакции: {str(rollback_error)}")
+        # Подарок не сохранён — код из пула можно выдать следующему
+        if pooled is not None:
+            promocode_pool.give_back(pooled)
 
         logger.error(f"Ошибка при выдаче подарка: {str(e)}")
         return {
             "success": False,
             "error": f"Произошла ошибка при выдаче подарка: {str(e)}",
         }
+
+
+def _prize_result(row, items_count: int, already_issued: bool) -> dict:
+    """Ответ issue_prize по строке подарка"""
+    return {
+        "success": True,
+        "prize_id": row.id,
+        "type": row.type,
+        "code": row.code,
+        "discount_amount": row.discount_amount,
+        "items_count": items_count,
+        "promocode_id": row.promocode_id,
+        "already_issued": already_issued,
+    }
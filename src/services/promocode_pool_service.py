@@ -0,0 +1,240 @@
+"""
+Локальный пул промокодов процесса
+
+При всплесках выдачи таблица promocodes становится узким местом:
+каждая выдача — отдельный запрос и commit. Пул резервирует коды номинала
+пачками по PROMOCODE_POOL_SIZE (leased_until/leased_by, FOR UPDATE
+SKIP LOCKED), раздаёт их из памяти и раз в PROMOCODE_CONFIRM_INTERVAL
+секунд одним UPDATE отмечает выданные коды использованными.
+
+Код, отключённый в админке, пока лежит в пуле, не выдаётся: выдача
+перепроверяет is_active тем же запросом (см. issue_prize) и выбрасывает
+такой код из пула (drop). Если код отключили уже после выдачи, flush
+отмечает его использованным, но свободные не уменьшает повторно —
+их уменьшило отключение.
+
+Если процесс упал, невыданные коды вернутся в оборот, когда истечёт
+резерв. Коды, выданные, но не отмеченные, в оборот не вернутся:
+их уже держит строка prizes (см. PromoCodeService.claimable_conditions),
+а repair() при старте пула доводит их до is_used.
+"""
+
+import asyncio
+import os
+import socket
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, update, and_, func
+
+from database import async_session
+from models.promocode_model import Promocode
+from models.prize_model import Prize
+from services.promocode_service import PromoCodeService
+from config import PROMOCODE_POOL_SIZE, PROMOCODE_LEASE_TTL, PROMOCODE_CONFIRM_INTERVAL
+from logger import logger
+
+# За сколько секунд до конца резерва оставшиеся коды возвращаются и берутся новые
+LEASE_MARGIN = 60
+
+
+class PooledCode(NamedTuple):
+    """Промокод из пула"""
+
+    id: int
+    code: str
+    discount_amount: int
+
+
+class _Tier:
+    """Зарезервированные коды одного номинала"""
+
+    def __init__(self) -> None:
+        self.codes: Deque[PooledCode] = deque()
+        self.leased_until = datetime.min
+        self.lock = asyncio.Lock()
+
+
+class PromocodePoolService:
+    """Сервис локального пула промокодов"""
+
+    def __init__(self, size: int = PROMOCODE_POOL_SIZE) -> None:
+        self.size = size
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._tiers: Dict[int, _Tier] = {}
+        self._confirmed: List[int] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._repaired = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    async def take(self, discount_amount: int) -> Optional[PooledCode]:
+        """
+        Выдаёт промокод из пула (резервирует новую пачку, если пул пуст)
+
+        Args:
+            discount_amount: Размер скидки (200 или 500)
+
+        Returns:
+            Optional[PooledCode]: Промокод или None, если коды закончились
+        """
+        tier = self._tiers.setdefault(discount_amount, _Tier())
+        async with tier.lock:
+            if not self._repaired:
+                await self.repair()
+            # Коды с истекающим резервом возвращаем: их может взять другой процесс
+            if tier.codes and datetime.now() > tier.leased_until - timedelta(seconds=LEASE_MARGIN):
+                await self._release([c.id for c in tier.codes])
+                tier.codes.clear()
+            if not tier.codes:
+                await self._reserve(discount_amount, tier)
+            if not tier.codes:
+                logger.warning(
+                    f"Все промокоды на {discount_amount} руб. закончились или отключены"
+                )
+                return None
+            return tier.codes.popleft()
+
+    def give_back(self, code: PooledCode) -> None:
+        """Возвращает невыданный код в пул (выдача не состоялась)"""
+        self._tiers.setdefault(code.discount_amount, _Tier()).codes.appendleft(code)
+
+    def drop(self, code: PooledCode) -> None:
+        """Выбрасывает код, отключённый, пока он лежал в пуле (в пул не возвращается)"""
+        logger.info(f"Промокод {code.code} отключён и убран из пула")
+
+    def confirm(self, code: PooledCode) -> None:
+        """Отмечает код выданным; в базу попадёт со следующей пачкой"""
+        self._confirmed.append(code.id)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(PROMOCODE_CONFIRM_INTERVAL)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Отмечает выданные коды использованными одним запросом"""
+        ids, self._confirmed = self._confirmed, []
+        if not ids:
+            return
+        try:
+            async with async_session() as session:
+                result = await session.execute(
+                    update(Promocode)
+                    .where(Promocode.id.in_(ids), Promocode.is_used == False)
+                    .values(is_used=True, used_at=datetime.now(), leased_until=None, leased_by=None)
+                    .returning(Promocode.discount_amount, Promocode.is_active)
+                )
+                await self._bump_used(session, result.all())
+                await session.commit()
+        except Exception as e:
+            # Коды держат строки prizes, повторим со следующей пачкой
+            logger.error(f"Не удалось отметить выданные промокоды: {str(e)}")
+            self._confirmed.extend(ids)
+
+    async def _reserve(self, discount_amount: int, tier: _Tier) -> None:
+        """Резервирует пачку свободных кодов номинала"""
+        leased_until = datetime.now() + timedelta(seconds=PROMOCODE_LEASE_TTL)
+        batch = (
+            select(Promocode.id)
+            .where(PromoCodeService.claimable_conditions(discount_amount))
+            .order_by(Promocode.id)
+            .limit(self.size)
+            .with_for_update(skip_locked=True)
+        )
+        async with async_session() as session:
+            result = await session.execute(
+                update(Promocode)
+                .where(Promocode.id.in_(batch))
+                .values(
+                    # Срок резерва — по часам базы, как и проверка в claimable_conditions
+                    leased_until=func.now() + timedelta(seconds=PROMOCODE_LEASE_TTL),
+                    leased_by=self.owner,
+                )
+                .returning(Promocode.id, Promocode.code)
+                .execution_options(synchronize_session=False)
+            )
+            rows = sorted(result.all())
+            await session.commit()
+        tier.codes.extend(PooledCode(id, code, discount_amount) for id, code in rows)
+        tier.leased_until = leased_until
+        logger.info(f"Зарезервировано {len(rows)} промокодов на {discount_amount} руб.")
+
+    async def _release(self, ids: List[int]) -> None:
+        """Снимает резерв с невыданных кодов"""
+        async with async_session() as session:
+            await session.execute(
+                update(Promocode)
+                .where(
+                    and_(
+                        Promocode.id.in_(ids),
+                        Promocode.leased_by == self.owner,
+                        Promocode.is_used == False,
+                    )
+                )
+                .values(leased_until=None, leased_by=None)
+            )
+            await session.commit()
+
+    async def repair(self) -> int:
+        """
+        Отмечает использованными коды, выданные из пула упавшим процессом
+
+        Returns:
+            int: Сколько кодов исправлено
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                update(Promocode)
+                .where(
+                    and_(
+                        Promocode.is_used == False,
+                        Promocode.id == Prize.promocode_id,
+                    )
+                )
+                .values(is_used=True, used_at=Prize.issued_at, leased_until=None, leased_by=None)
+                .returning(Promocode.discount_amount, Promocode.is_active)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            await self._bump_used(session, rows)
+            await session.commit()
+        self._repaired = True
+        if rows:
+            logger.warning(f"Отмечено использованными {len(rows)} выданных промокодов")
+        return len(rows)
+
+    @staticmethod
+    async def _bump_used(session, rows: List[Tuple[int, Optional[bool]]]) -> None:
+        """
+        Переносит отмеченные коды из свободных в использованные в счётчиках
+
+        Args:
+            session: Сессия базы данных
+            rows: (discount_amount, is_active) отмеченных кодов; отключённые
+                коды уже вычтены из свободных при отключении
+        """
+        used = Counter(amount for amount, _ in rows)
+        freed = Counter(amount for amount, is_active in rows if is_active != False)
+        for discount_amount, count in sorted(used.items()):
+            await PromoCodeService.bump_counters(
+                session, discount_amount, used=count, available=-freed[discount_amount]
+            )
+
+    async def close(self) -> None:
+        """Сохраняет выданные коды и снимает резерв с остальных (при остановке)"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self.flush()
+        for tier in self._tiers.values():
+            if tier.codes:
+                await self._release([c.id for c in tier.codes])
+                tier.codes.clear()
+
+
+# Создаем экземпляр сервиса
+promocode_pool = PromocodePoolService()
@@ -1,13 +1,45 @@
-from typing import Optional, List
-from sqlalchemy import select, and_
+from typing import Optional, List, Iterable, AsyncIterable, AsyncIterator, Union
+from sqlalchemy import select, update, and_, or_, exists, func, text, literal
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
+from database import engine, async_session
 from models.promocode_model import Promocode
+from models.promocode_counter_model import PromocodeCounter
 from models.prize_model import Prize
+from config import PROMOCODE_COUNTERS, PROMOCODE_LOW_STOCK
 from logger import logger
 
 
+# Сколько кодов загружается через COPY за один раз
+IMPORT_CHUNK_SIZE = 50000
+
+# Сколько строк выгрузки читается с сервера за раз
+EXPORT_CHUNK_SIZE = 5000
+
+# Номиналы, которые всегда показываются в статистике
+DISCOUNT_AMOUNTS = (200, 500)
+
+# Пересчёт счётчиков по таблице промокодов. Таблица счётчиков блокируется
+# от изменений: выдачи, начатые до пересчёта, допишут свои изменения после него
+REBUILD_COUNTERS_SQL = """
+INSERT INTO promocode_counters (discount_amount, total, used, available, updated_at)
+SELECT discount_amount,
+       count(*),
+       count(*) FILTER (WHERE is_used),
+       count(*) FILTER (WHERE NOT is_used AND is_active),
+       now()
+FROM promocodes
+GROUP BY discount_amount
+ON CONFLICT (discount_amount) DO UPDATE
+SET total = excluded.total,
+    used = excluded.used,
+    available = excluded.available,
+    updated_at = excluded.updated_at
+"""
+
+
 class PromoCodeService:
     """Сервис для работы с промокодами в базе данных"""
 
@@ -19,70 +51,245 @@ class PromoCodeService:
         Добавляет промокоды в базу данных
 
         Args:
-            session: Сессия базы данных
+            session: Сессия базы данных (не используется: импорт идёт отдельным соединением)
             codes: Список промокодов для добавления
             discount_amount: Размер скидки (200 или 500)
 
         Returns:
             dict: Результат операции
         """
-        try:
-            if discount_amount not in [200, 500]:
-                return {
-                    "success": False,
-                    "error": "Размер скидки должен быть 200 или 500",
-                }
-
-            added_count = 0
-            skipped_count = 0
-            errors = []
-
-            for code in codes:
-                code = code.strip()
-                if not code:
-                    continue
-
-                # Проверяем, существует ли уже такой промокод
-                existing = await session.execute(
-                    select(Promocode).where(Promocode.code == code)
-                )
+        return await PromoCodeService.import_promocodes(codes, discount_amount)
 
-                if existing.scalars().first():
-                    skipped_count += 1
-                    errors.append(f"Промокод {code} уже существует")
-                    continue
-
-                # Добавляем промокод
-                promocode = Promocode(
-                    code=code,
-                    discount_amount=discount_amount,
-                    is_used=False,
-                    is_active=True,
-                )
-                session.add(promocode)
-                added_count += 1
+    @staticmethod
+    async def import_promocodes(
+        codes: Union[Iterable[str], AsyncIterable[str]], discount_amount: int
+    ) -> dict:
+        """
+        Массовый импорт промокодов
 
-            await session.commit()
+        Коды читаются потоком и пачками по IMPORT_CHUNK_SIZE загружаются
+        через COPY во временную таблицу, откуда переносятся одним
+        INSERT ... SELECT DISTINCT ... ON CONFLICT (code) DO NOTHING.
+        Весь импорт — одна транзакция: при ошибке не добавляется ничего.
 
-            logger.info(
-                f"Добавлено {added_count} промокодов на {discount_amount} руб., пропущено {skipped_count}"
-            )
+        Args:
+            codes: Промокоды (список или асинхронный поток строк)
+            discount_amount: Размер скидки (200 или 500)
 
+        Returns:
+            dict: added_count, skipped_count (дубликаты), invalid_count
+        """
+        if discount_amount not in [200, 500]:
             return {
-                "success": True,
-                "added_count": added_count,
-                "skipped_count": skipped_count,
-                "errors": errors,
+                "success": False,
+                "error": "Размер скидки должен быть 200 или 500",
             }
 
+        async def iterate():
+            if hasattr(codes, "__aiter__"):
+                async for line in codes:
+                    yield line
+            else:
+                for line in codes:
+                    yield line
+
+        total = 0
+        added_count = 0
+        invalid_count = 0
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    text(
+                        "CREATE TEMP TABLE promocodes_import (code varchar(50)) ON COMMIT DROP"
+                    )
+                )
+                driver = (await conn.get_raw_connection()).driver_connection
+
+                async def flush(chunk: set) -> int:
+                    await driver.copy_records_to_table(
+                        "promocodes_import", records=[(c,) for c in chunk], columns=["code"]
+                    )
+                    result = await conn.execute(
+                        text(
+                            "INSERT INTO promocodes (code, discount_amount, is_used, is_active, created_at) "
+                            "SELECT DISTINCT code, :amount, false, true, now() FROM promocodes_import "
+                            "ON CONFLICT (code) DO NOTHING"
+                        ),
+                        {"amount": discount_amount},
+                    )
+                    await conn.execute(text("TRUNCATE promocodes_import"))
+                    return result.rowcount
+
+                # Дубликаты внутри пачки отсекаются множеством, между пачками
+                # и с уже загруженными кодами — ON CONFLICT
+                chunk: set = set()
+                async for line in iterate():
+                    code = line.strip()
+                    if not code:
+                        continue
+                    if len(code) > 50:
+                        invalid_count += 1
+                        continue
+                    total += 1
+                    chunk.add(code)
+                    if len(chunk) >= IMPORT_CHUNK_SIZE:
+                        added_count += await flush(chunk)
+                        chunk = set()
+                if chunk:
+                    added_count += await flush(chunk)
+
+                # Счётчики — последним запросом, чтобы строка номинала
+                # не была заблокирована для выдач на всё время импорта
+                await PromoCodeService.bump_counters(
+                    conn, discount_amount, total=added_count, available=added_count
+                )
+
         except Exception as e:
-            await session.rollback()
             logger.error(f"Ошибка при добавлении промокодов: {str(e)}")
             return {
                 "success": False,
                 "error": f"Ошибка при добавлении промокодов: {str(e)}",
             }
 
+        skipped_count = total - added_count
+        logger.info(
+            f"Добавлено {added_count} промокодов на {discount_amount} руб., "
+            f"дубликатов {skipped_count}, некорректных {invalid_count}"
+        )
+        errors = []
+        if invalid_count:
+            errors.append(f"Пропущено {invalid_count} кодов длиннее 50 символов")
+        return {
+            "success": True,
+            "added_count": added_count,
+            "skipped_count": skipped_count,
+            "invalid_count": invalid_count,
+            "errors": errors,
+        }
+
+    @staticmethod
+    async def bump_counters(
+        conn, discount_amount: int, total: int = 0, used: int = 0, available: int = 0
+    ) -> None:
+        """
+        Изменяет счётчики номинала в текущей транзакции (без commit)
+
+        Вызывается в той же транзакции, что и изменение промокодов, поэтому
+        счётчики не расходятся с таблицей. Строка номинала заблокирована
+        до commit, так что вызов должен быть последним запросом транзакции.
+
+        Args:
+            conn: Сессия или соединение с открытой транзакцией
+            discount_amount: Размер скидки
+            total: Изменение общего количества
+            used: Изменение количества использованных
+            available: Изменение количества свободных
+        """
+        if not PROMOCODE_COUNTERS or not (total or used or available):
+            return
+        stmt = insert(PromocodeCounter).values(
+            discount_amount=discount_amount, total=total, used=used, available=available
+        )
+        left = (await conn.execute(PromoCodeService._upsert_counters(stmt))).scalar()
+        PromoCodeService.check_low_stock(discount_amount, left, -available)
+
+    @staticmethod
+    def _upsert_counters(stmt):
+        """Добавляет к INSERT в promocode_counters прибавление к существующей строке"""
+        return stmt.on_conflict_do_update(
+            index_elements=[PromocodeCounter.discount_amount],
+            set_={
+                "total": PromocodeCounter.total + stmt.excluded.total,
+                "used": PromocodeCounter.used + stmt.excluded.used,
+                "available": PromocodeCounter.available + stmt.excluded.available,
+                "updated_at": func.now(),
+            },
+        ).returning(PromocodeCounter.available)
+
+    @staticmethod
+    def count_claimed(discount_amount: int, claimed):
+        """
+        Изменение счётчиков для выдачи одним запросом (в WITH)
+
+        Args:
+            discount_amount: Размер скидки
+            claimed: CTE выданных кодов
+
+        Returns:
+            Insert: Оператор, возвращающий новый остаток (или ничего, если кодов не выдано)
+        """
+        stmt = insert(PromocodeCounter).from_select(
+            ["discount_amount", "total", "used", "available"],
+            select(literal(discount_amount), literal(0), func.count(), -func.count())
+            .select_from(claimed)
+            .having(func.count() > 0),
+        )
+        return PromoCodeService._upsert_counters(stmt)
+
+    @staticmethod
+    def check_low_stock(discount_amount: int, left: Optional[int], taken: int) -> None:
+        """Предупреждает один раз — когда остаток опустился ниже порога"""
+        if taken > 0 and left is not None and left < PROMOCODE_LOW_STOCK <= left + taken:
+            logger.warning(
+                f"Заканчиваются промокоды на {discount_amount} руб.: осталось {left}"
+            )
+
+    @staticmethod
+    async def rebuild_counters() -> None:
+        """Пересчитывает счётчики по таблице промокодов (исправляет расхождения)"""
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("LOCK TABLE promocode_counters IN SHARE ROW EXCLUSIVE MODE")
+            )
+            await conn.execute(text(REBUILD_COUNTERS_SQL))
+        logger.info("Счётчики промокодов пересчитаны")
+
+    @staticmethod
+    def claimable_conditions(discount_amount: int):
+        """
+        Условие «код можно выдать»: свободен, активен, не зарезервирован
+        другим процессом и не привязан к подарку (выдан из пула процессом,
+        который упал до пометки кода использованным)
+        """
+        return and_(
+            Promocode.discount_amount == discount_amount,
+            Promocode.is_used == False,
+            Promocode.is_active == True,
+            or_(Promocode.leased_until.is_(None), Promocode.leased_until < func.now()),
+            ~exists().where(Prize.promocode_id == Promocode.id),
+        )
+
+    @staticmethod
+    def claim_statement(discount_amount: int, *guards):
+        """
+        UPDATE, помечающий использованным первый свободный код номинала
+
+        Код выбирается с FOR UPDATE SKIP LOCKED. Дополнительные условия
+        (guards) не зависят от строки промокода и проверяются до выбора кода,
+        так что при невыполненном условии ни одна строка не блокируется.
+
+        Args:
+            discount_amount: Размер скидки (200 или 500)
+            *guards: Дополнительные условия выдачи
+
+        Returns:
+            Update: Оператор без RETURNING
+        """
+        available = (
+            select(Promocode.id)
+            .where(PromoCodeService.claimable_conditions(discount_amount), *guards)
+            .order_by(Promocode.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        return (
+            update(Promocode)
+            .where(Promocode.id == available)
+            .values(is_used=True, used_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+
     @staticmethod
     async def get_available_promocode(
         session: AsyncSession, discount_amount: int
@@ -98,20 +305,13 @@ class PromoCodeService:
             Optional[Promocode]: Промокод или None если промокоды закончились
         """
         try:
-            # Ищем доступный промокод
-            query = await session.execute(
-                select(Promocode)
-                .where(
-                    and_(
-                        Promocode.discount_amount == discount_amount,
-                        Promocode.is_used == False,
-                        Promocode.is_active == True,
-                    )
-                )
-                .limit(1)
+            # Выбор и пометка промокода — один запрос: SKIP LOCKED пропускает
+            # строки, которые прямо сейчас забирают другие выдачи, поэтому
+            # параллельные выдачи не ждут друг друга и не получат один код
+            result = await session.execute(
+                PromoCodeService.claim_statement(discount_amount).returning(Promocode)
             )
-
-            promocode = query.scalars().first()
+            promocode = result.scalars().first()
 
             if not promocode:
                 logger.warning(
@@ -119,9 +319,11 @@ class PromoCodeService:
                 )
                 return None
 
-            # Помечаем промокод как использованный
-            promocode.is_used = True
-            promocode.used_at = datetime.now()
+            # Отсоединяем объект, чтобы commit не сбросил загруженные поля
+            session.expunge(promocode)
+            await PromoCodeService.bump_counters(
+                session, discount_amount, used=1, available=-1
+            )
             await session.commit()
 
             logger.info(f"Выдан промокод {promocode.code} на {discount_amount} руб.")
@@ -137,6 +339,10 @@ class PromoCodeService:
         """
         Получает статистику по промокодам
 
+        Статистика читается из promocode_counters (несколько строк),
+        а если счётчики отключены или ещё пусты — считается одним
+        запросом GROUP BY discount_amount.
+
         Args:
             session: Сессия базы данных
 
@@ -144,82 +350,53 @@ class PromoCodeService:
             dict: Статистика промокодов
         """
         try:
-            from sqlalchemy import func
-
-            # Общее количество промокодов
-            total_query = await session.execute(select(func.count(Promocode.id)))
-            total_count = total_query.scalar() or 0
-
-            # Количество по типам скидок
-            promo_200_total = await session.execute(
-                select(func.count(Promocode.id)).where(Promocode.discount_amount == 200)
-            )
-            promo_200_total = promo_200_total.scalar() or 0
-
-            promo_500_total = await session.execute(
-                select(func.count(Promocode.id)).where(Promocode.discount_amount == 500)
-            )
-            promo_500_total = promo_500_total.scalar() or 0
-
-            # Использованные промокоды
-            used_200 = await session.execute(
-                select(func.count(Promocode.id)).where(
-                    and_(Promocode.discount_amount == 200, Promocode.is_used == True)
-                )
-            )
-            used_200 = used_200.scalar() or 0
-
-            used_500 = await session.execute(
-                select(func.count(Promocode.id)).where(
-                    and_(Promocode.discount_amount == 500, Promocode.is_used == True)
-                )
-            )
-            used_500 = used_500.scalar() or 0
-
-            # Доступные промокоды
-            available_200 = await session.execute(
-                select(func.count(Promocode.id)).where(
-                    and_(
-                        Promocode.discount_amount == 200,
-                        Promocode.is_used == False,
-                        Promocode.is_active == True,
+            rows = []
+            if PROMOCODE_COUNTERS:
+                result = await session.execute(
+                    select(
+                        PromocodeCounter.discount_amount,
+                        PromocodeCounter.total,
+                        PromocodeCounter.used,
+                        PromocodeCounter.available,
                     )
                 )
-            )
-            available_200 = available_200.scalar() or 0
-
-            available_500 = await session.execute(
-                select(func.count(Promocode.id)).where(
-                    and_(
-                        Promocode.discount_amount == 500,
-                        Promocode.is_used == False,
-                        Promocode.is_active == True,
-                    )
+                rows = result.all()
+            if not rows:
+                result = await session.execute(
+                    select(
+                        Promocode.discount_amount,
+                        func.count(),
+                        func.count().filter(Promocode.is_used == True),
+                        func.count().filter(
+                            and_(Promocode.is_used == False, Promocode.is_active == True)
+                        ),
+                    ).group_by(Promocode.discount_amount)
                 )
-            )
-            available_500 = available_500.scalar() or 0
-
-            return {
-                "total_count": total_count,
-                "promo_200_total": promo_200_total,
-                "promo_500_total": promo_500_total,
-                "used_200": used_200,
-                "used_500": used_500,
-                "available_200": available_200,
-                "available_500": available_500,
-            }
+                rows = result.all()
+            return PromoCodeService._stats_from_rows(rows)
 
         except Exception as e:
             logger.error(f"Ошибка при получении статистики промокодов: {str(e)}")
-            return {
-                "total_count": 0,
-                "promo_200_total": 0,
-                "promo_500_total": 0,
-                "used_200": 0,
-                "used_500": 0,
-                "available_200": 0,
-                "available_500": 0,
-            }
+            return PromoCodeService._stats_from_rows([])
+
+    @staticmethod
+    def _stats_from_rows(rows) -> dict:
+        """Словарь статистики из строк (номинал, всего, использовано, свободно)"""
+        by_amount = {amount: (0, 0, 0) for amount in DISCOUNT_AMOUNTS}
+        for amount, total, used, available in rows:
+            by_amount[amount] = (total, used, available)
+
+        stats = {"total_count": sum(total for total, _, _ in by_amount.values())}
+        for amount, (total, used, available) in by_amount.items():
+            stats[f"promo_{amount}_total"] = total
+            stats[f"used_{amount}"] = used
+            stats[f"available_{amount}"] = available
+        stats["low_stock"] = [
+            amount
+            for amount in DISCOUNT_AMOUNTS
+            if by_amount[amount][2] < PROMOCODE_LOW_STOCK
+        ]
+        return stats
 
     @staticmethod
     async def deactivate_promocode(session: AsyncSession, promocode_id: int) -> dict:
@@ -242,7 +419,14 @@ class PromoCodeService:
             if not promocode:
                 return {"success": False, "error": "Промокод не найден"}
 
+            if promocode.is_active != False and not promocode.is_used:
+                await PromoCodeService.bump_counters(
+                    session, promocode.discount_amount, available=-1
+                )
             promocode.is_active = False
+            # Резерв пула снимаем: код больше не выдаётся
+            promocode.leased_until = None
+            promocode.leased_by = None
             await session.commit()
 
             logger.info(f"Промокод {promocode.code} деактивирован")
@@ -280,6 +464,10 @@ class PromoCodeService:
             if not promocode:
                 return {"success": False, "error": "Промокод не найден"}
 
+            if promocode.is_active != True and not promocode.is_used:
+                await PromoCodeService.bump_counters(
+                    session, promocode.discount_amount, available=1
+                )
             promocode.is_active = True
             await session.commit()
 
@@ -297,6 +485,29 @@ class PromoCodeService:
                 "error": f"Ошибка при активации промокода: {str(e)}",
             }
 
+    @staticmethod
+    def list_conditions(
+        discount_amount: Optional[int] = None,
+        is_used: Optional[bool] = None,
+        is_active: Optional[bool] = None,
+        code_prefix: Optional[str] = None,
+    ) -> list:
+        """Условия WHERE для списка и выгрузки промокодов"""
+        conditions = []
+        if discount_amount is not None:
+            conditions.append(Promocode.discount_amount == discount_amount)
+        if is_used is not None:
+            conditions.append(Promocode.is_used == is_used)
+        if is_active is not None:
+            conditions.append(Promocode.is_active == is_active)
+        if code_prefix:
+            # LIKE 'префикс%' идёт по индексу ix_promocodes_code_pattern (text_pattern_ops)
+            escaped = (
+                code_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            conditions.append(Promocode.code.like(escaped + "%", escape="\\"))
+        return conditions
+
     @staticmethod
     async def get_promocodes_list(
         session: AsyncSession,
@@ -304,9 +515,15 @@ class PromoCodeService:
         is_used: Optional[bool] = None,
         is_active: Optional[bool] = None,
         limit: int = 50,
+        code_prefix: Optional[str] = None,
+        before_id: Optional[int] = None,
     ) -> List[Promocode]:
         """
-        Получает список промокодов с фильтрацией
+        Получает страницу промокодов с фильтрацией
+
+        Промокоды идут от новых к старым (по id). Следующая страница
+        запрашивается по id последнего промокода предыдущей (before_id),
+        поэтому глубокие страницы читаются так же быстро, как первая.
 
         Args:
             session: Сессия базы данных
@@ -314,6 +531,8 @@ class PromoCodeService:
             is_used: Статус использования для фильтрации (опционально)
             is_active: Статус активности для фильтрации (опционально)
             limit: Максимальное количество промокодов
+            code_prefix: Начало промокода для поиска (опционально)
+            before_id: Вернуть промокоды с id меньше этого (опционально)
 
         Returns:
             List[Promocode]: Список промокодов
@@ -321,18 +540,16 @@ class PromoCodeService:
         try:
             query = select(Promocode)
 
-            conditions = []
-            if discount_amount is not None:
-                conditions.append(Promocode.discount_amount == discount_amount)
-            if is_used is not None:
-                conditions.append(Promocode.is_used == is_used)
-            if is_active is not None:
-                conditions.append(Promocode.is_active == is_active)
+            conditions = PromoCodeService.list_conditions(
+                discount_amount, is_used, is_active, code_prefix
+            )
+            if before_id is not None:
+                conditions.append(Promocode.id < before_id)
 
             if conditions:
                 query = query.where(and_(*conditions))
 
-            query = query.order_by(Promocode.created_at.desc()).limit(limit)
+            query = query.order_by(Promocode.id.desc()).limit(limit)
 
             result = await session.execute(query)
             return result.scalars().all()
@@ -341,6 +558,40 @@ class PromoCodeService:
             logger.error(f"Ошибка при получении списка промокодов: {str(e)}")
             return []
 
+    @staticmethod
+    async def iter_promocodes(
+        discount_amount: Optional[int] = None,
+        is_used: Optional[bool] = None,
+        is_active: Optional[bool] = None,
+        code_prefix: Optional[str] = None,
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+    ) -> AsyncIterator[List]:
+        """
+        Пачки строк промокодов для выгрузки через серверный курсор
+
+        Yields:
+            List: Строки (id, code, discount_amount, is_used, is_active, created_at, used_at)
+        """
+        query = select(
+            Promocode.id,
+            Promocode.code,
+            Promocode.discount_amount,
+            Promocode.is_used,
+            Promocode.is_active,
+            Promocode.created_at,
+            Promocode.used_at,
+        )
+        conditions = PromoCodeService.list_conditions(
+            discount_amount, is_used, is_active, code_prefix
+        )
+        if conditions:
+            query = query.where(and_(*conditions))
+        query = query.order_by(Promocode.id).execution_options(yield_per=chunk_size)
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                yield list(partition)
+
 
 # Создаем экземпляр сервиса
 promocode_service = PromoCodeService()
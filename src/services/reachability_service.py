@@ -0,0 +1,151 @@
+"""
+Доступность пользователей для сообщений бота
+
+Каждая отправка отмечает результат в users: успешная — last_delivery_ok_at
+и сброс blocked_at, ответ «бот заблокирован», «чат не найден»,
+«пользователь удалён» — blocked_at. Аудитории рассылок по умолчанию
+не включают пользователей с blocked_at, а раз в сутки небольшая пачка
+давно недоступных пользователей проверяется повторно (send_chat_action)
+на случай, если бота разблокировали.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session
+from models.user_model import User
+from config import REPROBE_AFTER_DAYS, REPROBE_BATCH, REPROBE_RATE
+from logger import logger
+
+# Ответы Telegram на BadRequest, после которых писать пользователю бесполезно
+UNREACHABLE_ERRORS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+
+def is_unreachable_error(error: Exception) -> bool:
+    """
+    Проверяет, что ошибка отправки означает недоступный чат
+
+    Args:
+        error: Исключение при отправке
+
+    Returns:
+        bool: True для «бот заблокирован», «чат не найден» и т.п.
+    """
+    from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        text = str(error).lower()
+        return any(fragment in text for fragment in UNREACHABLE_ERRORS)
+    return False
+
+
+class ReachabilityService:
+    """Сервис учёта доступности пользователей"""
+
+    @staticmethod
+    async def mark_reachable(session: AsyncSession, user_id: int) -> None:
+        """Отмечает успешную доставку (без commit)"""
+        await session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(last_delivery_ok_at=datetime.now(), blocked_at=None)
+        )
+
+    @staticmethod
+    async def mark_blocked(session: AsyncSession, user_ids: Iterable[int]) -> None:
+        """Отмечает пользователей недоступными (без commit)"""
+        ids = list(user_ids)
+        if not ids:
+            return
+        await session.execute(
+            update(User)
+            .where(User.id.in_(ids), User.blocked_at.is_(None))
+            .values(blocked_at=datetime.now())
+        )
+
+    @staticmethod
+    async def record(user_id: int, error: Optional[Exception] = None) -> None:
+        """
+        Записывает результат отправки в отдельной транзакции
+
+        Args:
+            user_id: Получатель
+            error: Ошибка отправки; None — сообщение доставлено
+        """
+        if error is not None and not is_unreachable_error(error):
+            return
+        try:
+            async with async_session() as session:
+                if error is None:
+                    await ReachabilityService.mark_reachable(session, user_id)
+                else:
+                    await ReachabilityService.mark_blocked(session, [user_id])
+                    logger.info(f"Пользователь {user_id} недоступен: {str(error)}")
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Не удалось записать доступность пользователя {user_id}: {str(e)}")
+
+    @staticmethod
+    async def reprobe(bot, limit: int = REPROBE_BATCH) -> dict:
+        """
+        Повторно проверяет давно недоступных пользователей
+
+        Проверка — send_chat_action: пользователь видит только «печатает…».
+        Кто по-прежнему недоступен, уходит в конец очереди (blocked_at = сейчас).
+
+        Args:
+            bot: Экземпляр бота
+            limit: Сколько пользователей проверить
+
+        Returns:
+            dict: Статистика проверки
+        """
+        threshold = datetime.now() - timedelta(days=REPROBE_AFTER_DAYS)
+        async with async_session() as session:
+            result = await session.execute(
+                select(User.id)
+                .where(User.blocked_at < threshold)
+                .order_by(User.blocked_at)
+                .limit(limit)
+            )
+            user_ids = list(result.scalars().all())
+
+        restored = 0
+        still_blocked = 0
+        for user_id in user_ids:
+            try:
+                await bot.send_chat_action(user_id, "typing")
+                error = None
+            except Exception as e:
+                error = e
+            async with async_session() as session:
+                if error is None:
+                    await ReachabilityService.mark_reachable(session, user_id)
+                    restored += 1
+                elif is_unreachable_error(error):
+                    await session.execute(
+                        update(User)
+                        .where(User.id == user_id)
+                        .values(blocked_at=datetime.now())
+                    )
+                    still_blocked += 1
+                else:
+                    logger.warning(f"Проверка пользователя {user_id} не удалась: {str(error)}")
+                await session.commit()
+            await asyncio.sleep(1 / REPROBE_RATE)
+
+        logger.info(
+            f"Повторная проверка недоступных: проверено {len(user_ids)}, "
+            f"снова доступны {restored}, недоступны {still_blocked}"
+        )
+        return {"checked": len(user_ids), "restored": restored, "still_blocked": still_blocked}
+
+
+# Создаем экземпляр сервиса
+reachability_service = ReachabilityService()
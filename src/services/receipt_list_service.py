@@ -0,0 +1,203 @@
+"""
+Список чеков в админке
+
+Чеки читаются страницами от новых к старым по ключу (created_at, id):
+следующая страница начинается после последнего чека предыдущей, поэтому
+глубокие страницы стоят столько же, сколько первая. Чеки без created_at
+идут в конце списка (NULLS LAST) по убыванию id. Читаются только
+колонки списка (без raw_api_response), а вместо точного COUNT(*)
+показывается оценка планировщика.
+
+Поиск по подстроке в аптеке, адресе и наименованиях товаров Айсида
+идёт по GIN-индексам pg_trgm, а не полным просмотром таблицы.
+"""
+
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, and_, or_, func, tuple_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.receipt_model import Receipt
+
+# Чеков на странице
+PAGE_SIZE = 50
+
+# Короче этого поиск по триграммам не сужает выборку
+MIN_SEARCH_LENGTH = 3
+
+# Колонки, по которым ищется подстрока (у каждой GIN-индекс gin_trgm_ops)
+SEARCH_COLUMNS = (Receipt.pharmacy, Receipt.address, Receipt.aisida_items)
+
+# Колонки списка
+LIST_COLUMNS = (
+    Receipt.id,
+    Receipt.user_id,
+    Receipt.amount,
+    Receipt.pharmacy,
+    Receipt.address,
+    Receipt.items_count,
+    Receipt.status,
+    Receipt.created_at,
+)
+
+
+def contains(column, value: str):
+    """ILIKE '%значение%' с экранированием % и _ из ввода"""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return column.ilike(f"%{escaped}%", escape="\\")
+
+
+@dataclass
+class ReceiptFilter:
+    """Фильтр списка чеков (пустой фильтр — все чеки)"""
+
+    status: Optional[str] = None  # Статус чека
+    pharmacy: Optional[str] = None  # Часть названия аптеки
+    search: Optional[str] = None  # Часть аптеки, адреса или наименования товара
+    start_date: Optional[datetime] = None  # Создан не раньше
+    end_date: Optional[datetime] = None  # Создан не позже
+
+    def conditions(self) -> list:
+        """Условия WHERE для таблицы receipts"""
+        conditions = []
+        if self.status:
+            conditions.append(Receipt.status == self.status)
+        if self.pharmacy:
+            conditions.append(contains(Receipt.pharmacy, self.pharmacy))
+        if self.search:
+            conditions.append(or_(*(contains(column, self.search) for column in SEARCH_COLUMNS)))
+        if self.start_date:
+            conditions.append(Receipt.created_at >= self.start_date)
+        if self.end_date:
+            conditions.append(Receipt.created_at <= self.end_date)
+        return conditions
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.conditions()
+
+
+class ReceiptListService:
+    """Сервис списка чеков"""
+
+    @staticmethod
+    async def get_page(
+        session: AsyncSession,
+        receipt_filter: ReceiptFilter,
+        before: Optional[Tuple[Optional[datetime], int]] = None,
+        limit: int = PAGE_SIZE,
+    ) -> Tuple[List, Optional[Tuple[Optional[datetime], int]]]:
+        """
+        Страница чеков от новых к старым
+
+        Args:
+            session: Сессия базы данных
+            receipt_filter: Фильтр
+            before: Ключ (created_at, id) последнего чека предыдущей страницы
+                (created_at может быть None)
+            limit: Размер страницы
+
+        Returns:
+            Tuple[List, Optional[Tuple[Optional[datetime], int]]]: Строки страницы
+            и ключ для следующей страницы (None — страница последняя)
+        """
+        conditions = receipt_filter.conditions()
+        query = select(*LIST_COLUMNS).order_by(
+            Receipt.created_at.desc().nulls_last(), Receipt.id.desc()
+        )
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        rows = []
+        if before is None or before[0] is not None:
+            dated = conditions + [Receipt.created_at.is_not(None)]
+            if before is not None:
+                dated.append(tuple_(Receipt.created_at, Receipt.id) < before)
+            rows = (await session.execute(query.where(and_(*dated)).limit(limit + 1))).all()
+        if len(rows) <= limit:
+            # Хвост без даты — отдельным запросом, чтобы оба шли по индексу
+            undated = conditions + [Receipt.created_at.is_(None)]
+            if before is not None and before[0] is None:
+                undated.append(Receipt.id < before[1])
+            rows += (
+                await session.execute(query.where(and_(*undated)).limit(limit + 1 - len(rows)))
+            ).all()
+
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1].created_at, rows[-1].id)
+
+    @staticmethod
+    async def estimate_count(session: AsyncSession, receipt_filter: ReceiptFilter) -> int:
+        """
+        Приблизительное количество чеков
+
+        Без фильтра — по статистике таблицы (pg_class.reltuples),
+        с фильтром — по оценке планировщика для запроса (EXPLAIN).
+        """
+        if receipt_filter.is_empty:
+            result = await session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'receipts'::regclass")
+            )
+            # -1 — таблица ещё ни разу не анализировалась
+            return max(result.scalar() or 0, 0)
+
+        query = select(Receipt.id).where(and_(*receipt_filter.conditions()))
+        sql = query.compile(
+            dialect=session.bind.dialect, compile_kwargs={"literal_binds": True}
+        )
+        # Без text(): двоеточия во вводе пользователя не должны стать параметрами
+        connection = await session.connection()
+        result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    @staticmethod
+    async def search(session: AsyncSession, query: str, limit: int = 20) -> List:
+        """
+        Последние чеки, у которых аптека, адрес или товар содержат строку
+
+        Args:
+            session: Сессия базы данных
+            query: Строка поиска (не короче MIN_SEARCH_LENGTH)
+            limit: Сколько чеков вернуть
+
+        Returns:
+            List: Строки с колонками списка
+        """
+        query = (query or "").strip()
+        if len(query) < MIN_SEARCH_LENGTH:
+            return []
+        rows, _ = await ReceiptListService.get_page(
+            session, ReceiptFilter(search=query), limit=limit
+        )
+        return rows
+
+    @staticmethod
+    async def search_pharmacies(session: AsyncSession, query: str, limit: int = 10) -> List:
+        """
+        Названия аптек, содержащие строку, — для подсказок в фильтре
+
+        Returns:
+            List: Строки (pharmacy, receipts): сначала самые похожие, затем самые частые
+        """
+        query = (query or "").strip()
+        if len(query) < MIN_SEARCH_LENGTH:
+            return []
+        receipts = func.count().label("receipts")
+        result = await session.execute(
+            select(Receipt.pharmacy, receipts)
+            .where(contains(Receipt.pharmacy, query))
+            .group_by(Receipt.pharmacy)
+            .order_by(func.similarity(Receipt.pharmacy, query).desc(), receipts.desc())
+            .limit(limit)
+        )
+        return result.all()
+
+
+# Создаем экземпляр сервиса
+receipt_list_service = ReceiptListService()
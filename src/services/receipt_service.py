@@ -31,9 +31,6 @@
 """
 
 import re
-import cv2
-import numpy as np
-from pyzbar.pyzbar import decode
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
@@ -42,6 +39,7 @@ import json
 from models.receipt_model import Receipt
 from models.user_model import User
 from services.check_api_service import verify_check
+from services.lottery_ticket_service import lottery_ticket_service
 from config import PROVERKACHEKA_API_TOKEN
 from errors import ReceiptValidationError, QRCodeError
 from logger import logger
@@ -104,6 +102,11 @@ async def process_receipt_photo(user_id: int, photo_file_path: str) -> dict:
         # Если API не смог распознать, пробуем локальное распознавание
         logger.info("API не смог распознать QR-код, пробуем локальное распознавание")
 
+        # OpenCV и pyzbar тяжёлые, загружаем их только здесь,
+        # чтобы админка и служебные скрипты их не импортировали
+        import cv2
+        from pyzbar.pyzbar import decode
+
         # Загружаем изображение
         image = cv2.imread(photo_file_path)
         if image is None:
@@ -359,6 +362,7 @@ async def verify_receipt_with_api(session: AsyncSession, receipt_id: int) -> dic
                 f"Чек {receipt_id} - изменяю статус с '{old_status}' на 'rejected'"
             )
 
+            await lottery_ticket_service.sync_receipt(session, receipt)
             await session.commit()
 
             # Проверяем что статус действительно изменился
@@ -425,6 +429,8 @@ async def verify_receipt_with_api(session: AsyncSession, receipt_id: int) -> dic
         # Сохраняем наименования товаров, адрес и полный API ответ
         receipt.aisida_items = json.dumps(aisida_items, ensure_ascii=False)
         receipt.raw_api_response = json.dumps(api_result, ensure_ascii=False)
+        # Выдаём билет розыгрыша (если в чеке есть товары «Айсида»)
+        await lottery_ticket_service.sync_receipt(session, receipt)
         # Сохраняем изменения
         await session.commit()
 
@@ -638,6 +644,7 @@ async def test_receipt_status_update(
         # Изменяем статус
         receipt.status = new_status
         receipt.verification_date = datetime.now()
+        await lottery_ticket_service.sync_receipt(session, receipt)
 
         logger.info(f"ТЕСТ: Чек {receipt_id} - устанавливаю статус: '{new_status}'")
 
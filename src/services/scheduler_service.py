@@ -7,7 +7,11 @@ from apscheduler.triggers.cron import CronTrigger
 
 from services.weekly_lottery_service import weekly_lottery_service
 from services.google_sheets_service import google_sheets_service
+from services.reachability_service import reachability_service
+from services.job_lease_service import job_lease_service
+from services.promocode_service import promocode_service
 from database import async_session
+from config import PROMOCODE_COUNTERS
 from logger import logger
 from sqlalchemy import select, and_
 from models.weekly_lottery_model import WeeklyLottery
@@ -19,6 +23,8 @@ class LotteryScheduler:
     def __init__(self, bot=None):
         self.scheduler = AsyncIOScheduler()
         self.bot = bot
+        # Хранилище FSM в Postgres (если используется) для очистки устаревших записей
+        self.fsm_storage = None
         self.is_running = False
 
     async def conduct_weekly_lottery_job(self):
@@ -39,7 +45,8 @@ class LotteryScheduler:
                         )
                     else:
                         logger.info(
-                            f"Еженедельный розыгрыш завершён, но участников не было"
+                            f"Еженедельный розыгрыш завершён без победителя: "
+                            f"{result.get('message')}"
                         )
                 else:
                     logger.error(
@@ -51,6 +58,16 @@ class LotteryScheduler:
                 f"Критическая ошибка в задаче еженедельного розыгрыша: {str(e)}"
             )
 
+    async def commit_lottery_week_job(self):
+        """Задача публикации обязательства розыгрыша следующей недели"""
+        from services.lottery_draw_service import lottery_draw_service
+
+        try:
+            async with async_session() as session:
+                await lottery_draw_service.commit_next_week(session)
+        except Exception as e:
+            logger.error(f"Ошибка при публикации обязательства розыгрыша: {str(e)}")
+
     async def export_users_to_sheets_job(self):
         """Задача выгрузки пользователей в Google Sheets"""
         try:
@@ -105,15 +122,49 @@ class LotteryScheduler:
                         logger.info(
                             f"Напоминание отправлено пользователю {lottery.winner_user_id}"
                         )
+                        await reachability_service.record(lottery.winner_user_id)
                     except Exception as e:
                         logger.error(
                             f"Ошибка при отправке напоминания пользователю {lottery.winner_user_id}: {str(e)}"
                         )
+                        await reachability_service.record(lottery.winner_user_id, e)
         except Exception as e:
             logger.error(
                 f"Критическая ошибка в задаче напоминания о контакте: {str(e)}"
             )
 
+    async def reprobe_blocked_users_job(self):
+        """Задача повторной проверки пользователей, заблокировавших бота"""
+        try:
+            await reachability_service.reprobe(self.bot)
+        except Exception as e:
+            logger.error(f"Ошибка при проверке недоступных пользователей: {str(e)}")
+
+    async def rebuild_promocode_counters_job(self):
+        """Задача сверки счётчиков промокодов с таблицей промокодов"""
+        try:
+            await promocode_service.rebuild_counters()
+        except Exception as e:
+            logger.error(f"Ошибка при пересчёте счётчиков промокодов: {str(e)}")
+
+    async def purge_fsm_states_job(self):
+        """Задача очистки устаревших состояний FSM"""
+        try:
+            await self.fsm_storage.purge_expired()
+        except Exception as e:
+            logger.error(f"Ошибка при очистке состояний FSM: {str(e)}")
+
+    def _exclusive(self, job_id: str, job):
+        """
+        Оборачивает задачу: при нескольких репликах бота каждый запуск
+        выполняет только та, что первой взяла аренду задачи в Postgres
+        """
+
+        async def run():
+            await job_lease_service.run_exclusive(job_id, job)
+
+        return run
+
     def start_scheduler(self):
         """Запускает планировщик задач"""
         if self.is_running:
@@ -123,7 +174,7 @@ class LotteryScheduler:
         try:
             # Добавляем задачу еженедельного розыгрыша (каждый понедельник в 10:00)
             self.scheduler.add_job(
-                self.conduct_weekly_lottery_job,
+                self._exclusive("weekly_lottery", self.conduct_weekly_lottery_job),
                 trigger=CronTrigger(
                     day_of_week=0, hour=10, minute=0
                 ),  # 0 = понедельник
@@ -133,9 +184,20 @@ class LotteryScheduler:
                 max_instances=1,
             )
 
+            # Обязательство розыгрыша следующей недели публикуется заранее
+            # (ежедневно — повторные запуски его не меняют)
+            self.scheduler.add_job(
+                self._exclusive("commit_lottery_week", self.commit_lottery_week_job),
+                trigger=CronTrigger(hour=3, minute=0),
+                id="commit_lottery_week",
+                name="Публикация обязательства розыгрыша следующей недели",
+                replace_existing=True,
+                max_instances=1,
+            )
+
             # Добавляем задачу напоминания о предоставлении контактных данных победителям (каждый вторник в 10:00)
             self.scheduler.add_job(
-                self.send_contact_reminders_job,
+                self._exclusive("contact_reminder", self.send_contact_reminders_job),
                 trigger=CronTrigger(day_of_week=1, hour=11, minute=0),  # 1 = вторник
                 id="contact_reminder",
                 name="Напоминание победителям о предоставлении контактных данных",
@@ -145,7 +207,7 @@ class LotteryScheduler:
 
             # Экспорт пользователей каждые 15 минут
             self.scheduler.add_job(
-                self.export_users_to_sheets_job,
+                self._exclusive("export_users_to_sheets", self.export_users_to_sheets_job),
                 trigger=CronTrigger(minute="*/15"),
                 id="export_users_to_sheets",
                 name="Экспорт пользователей в Google Sheets (каждые 15 минут)",
@@ -153,6 +215,40 @@ class LotteryScheduler:
                 max_instances=1,
             )
 
+            # Повторная проверка недоступных пользователей раз в сутки ночью
+            self.scheduler.add_job(
+                self._exclusive("reprobe_blocked_users", self.reprobe_blocked_users_job),
+                trigger=CronTrigger(hour=4, minute=0),
+                id="reprobe_blocked_users",
+                name="Повторная проверка пользователей, заблокировавших бота",
+                replace_existing=True,
+                max_instances=1,
+            )
+
+            # Сверка счётчиков промокодов раз в сутки ночью
+            if PROMOCODE_COUNTERS:
+                self.scheduler.add_job(
+                    self._exclusive(
+                        "rebuild_promocode_counters", self.rebuild_promocode_counters_job
+                    ),
+                    trigger=CronTrigger(hour=4, minute=30),
+                    id="rebuild_promocode_counters",
+                    name="Сверка счётчиков промокодов",
+                    replace_existing=True,
+                    max_instances=1,
+                )
+
+            # Очистка устаревших состояний FSM раз в час
+            if self.fsm_storage is not None:
+                self.scheduler.add_job(
+                    self._exclusive("purge_fsm_states", self.purge_fsm_states_job),
+                    trigger=CronTrigger(minute=30),
+                    id="purge_fsm_states",
+                    name="Очистка устаревших состояний FSM",
+                    replace_existing=True,
+                    max_instances=1,
+                )
+
             self.scheduler.start()
             self.is_running = True
             logger.info(
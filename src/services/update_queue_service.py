@@ -0,0 +1,208 @@
+from datetime import timedelta
+from typing import Optional, List, Iterable, Tuple
+from sqlalchemy import delete, update, and_, case, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from aiogram.types import Update
+
+from models.update_queue_model import QueuedUpdate
+from logger import logger
+
+
+# Берём в работу только самый ранний незавершённый апдейт каждого чата,
+# поэтому апдейты одного чата обрабатываются строго по очереди,
+# а разные чаты — параллельно на всех воркерах
+CLAIM_SQL = text(
+    """
+UPDATE update_queue AS q
+SET status = 'processing',
+    locked_by = :worker_id,
+    locked_at = now(),
+    attempts = q.attempts + 1
+WHERE q.id IN (
+    SELECT c.id
+    FROM update_queue AS c
+    WHERE c.status = 'pending'
+      AND NOT EXISTS (
+          SELECT 1 FROM update_queue AS p
+          WHERE p.chat_id = c.chat_id
+            AND p.id < c.id
+            AND p.status IN ('pending', 'processing')
+      )
+    ORDER BY c.id
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING q.id, q.update_id, q.payload, q.attempts
+"""
+)
+
+
+def get_update_chat_id(update: Update) -> Optional[int]:
+    """
+    Определяет чат апдейта (для упорядочивания обработки)
+
+    Args:
+        update: Апдейт Telegram
+
+    Returns:
+        Optional[int]: ID чата или пользователя, None если определить нельзя
+    """
+    event = update.event
+    chat = getattr(event, "chat", None)
+    if chat is None:
+        message = getattr(event, "message", None)
+        chat = getattr(message, "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    return user.id if user else None
+
+
+class UpdateQueueService:
+    """Сервис очереди апдейтов Telegram в Postgres"""
+
+    @staticmethod
+    async def enqueue(session: AsyncSession, updates: Iterable[Update]) -> int:
+        """
+        Сохраняет апдейты в очередь (повторы по update_id игнорируются)
+
+        Args:
+            session: Сессия базы данных
+            updates: Апдейты Telegram
+
+        Returns:
+            int: Количество добавленных апдейтов
+        """
+        rows = [
+            {
+                "update_id": u.update_id,
+                "chat_id": get_update_chat_id(u),
+                "payload": u.model_dump_json(exclude_none=True, by_alias=True),
+                "status": "pending",
+                "attempts": 0,
+            }
+            for u in updates
+        ]
+        if not rows:
+            return 0
+
+        result = await session.execute(
+            insert(QueuedUpdate)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[QueuedUpdate.update_id])
+        )
+        await session.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def claim(
+        session: AsyncSession, worker_id: str, limit: int
+    ) -> List[Tuple[int, int, str, int]]:
+        """
+        Берёт в работу до limit апдейтов
+
+        Args:
+            session: Сессия базы данных
+            worker_id: Идентификатор воркера
+            limit: Максимальное количество апдейтов
+
+        Returns:
+            List[Tuple[int, int, str, int]]: (id, update_id, payload, attempts)
+        """
+        result = await session.execute(
+            CLAIM_SQL, {"worker_id": worker_id, "limit": limit}
+        )
+        rows = [tuple(row) for row in result.all()]
+        await session.commit()
+        return rows
+
+    @staticmethod
+    async def complete(session: AsyncSession, queue_id: int) -> None:
+        """Удаляет обработанный апдейт из очереди"""
+        await session.execute(delete(QueuedUpdate).where(QueuedUpdate.id == queue_id))
+        await session.commit()
+
+    @staticmethod
+    async def fail(
+        session: AsyncSession,
+        queue_id: int,
+        attempts: int,
+        error: str,
+        max_attempts: int,
+    ) -> None:
+        """
+        Возвращает апдейт в очередь или помечает его как окончательно упавший
+
+        Args:
+            session: Сессия базы данных
+            queue_id: ID записи очереди
+            attempts: Сколько попыток уже сделано
+            error: Текст ошибки
+            max_attempts: Максимальное количество попыток
+        """
+        status = "failed" if attempts >= max_attempts else "pending"
+        await session.execute(
+            update(QueuedUpdate)
+            .where(QueuedUpdate.id == queue_id)
+            .values(status=status, locked_by=None, locked_at=None, last_error=error)
+        )
+        await session.commit()
+        if status == "failed":
+            logger.error(
+                f"Апдейт из очереди #{queue_id} не обработан после {attempts} попыток: {error}"
+            )
+
+    @staticmethod
+    async def requeue_stale(session: AsyncSession, timeout: int, max_attempts: int) -> int:
+        """
+        Возвращает в очередь апдейты, зависшие у упавших воркеров
+
+        Время сравнивается по часам базы (locked_at ставит now() в CLAIM_SQL).
+        Апдейт, исчерпавший попытки, помечается failed: иначе апдейт, роняющий
+        воркер, возвращался бы бесконечно и держал бы очередь своего чата.
+
+        Args:
+            session: Сессия базы данных
+            timeout: Через сколько секунд обработки апдейт считается зависшим
+            max_attempts: Максимальное количество попыток
+
+        Returns:
+            int: Количество возвращённых или помеченных failed апдейтов
+        """
+        exhausted = QueuedUpdate.attempts >= max_attempts
+        result = await session.execute(
+            update(QueuedUpdate)
+            .where(
+                and_(
+                    QueuedUpdate.status == "processing",
+                    QueuedUpdate.locked_at < func.now() - timedelta(seconds=timeout),
+                )
+            )
+            .values(
+                status=case((exhausted, "failed"), else_="pending"),
+                last_error=case(
+                    (exhausted, "Воркер не завершил обработку (превышено время)"),
+                    else_=QueuedUpdate.last_error,
+                ),
+                locked_by=None,
+                locked_at=None,
+            )
+            .returning(QueuedUpdate.id, QueuedUpdate.status)
+        )
+        rows = result.all()
+        await session.commit()
+        failed = [queue_id for queue_id, status in rows if status == "failed"]
+        if len(rows) > len(failed):
+            logger.warning(f"Возвращено в очередь зависших апдейтов: {len(rows) - len(failed)}")
+        if failed:
+            logger.error(
+                f"Апдейты из очереди {failed} не обработаны после {max_attempts} попыток: "
+                "воркер не завершил обработку"
+            )
+        return len(rows)
+
+
+# Создаем экземпляр сервиса
+update_queue_service = UpdateQueueService()
@@ -0,0 +1,122 @@
+"""
+Список пользователей и статистика UTM в админке
+
+Пользователи читаются страницами от новых к старым по ключу
+(registered_at, id), пользователи без даты регистрации идут в конце
+(NULLS LAST); количество чеков считается только для строк страницы. Статистика UTM — один GROUP BY в базе, а выгрузка CSV
+читает его результат через серверный курсор.
+"""
+
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import select, and_, func, tuple_, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session
+from models.user_model import User
+from models.receipt_model import Receipt
+
+# Пользователей на странице
+PAGE_SIZE = 100
+
+# Сколько строк выгрузки читается с сервера за раз
+CHUNK_SIZE = 1000
+
+
+def utm_stats_query():
+    """Количество пользователей по сочетаниям UTM, от самых частых"""
+    # Пустая строка — литералом: выражения в SELECT и GROUP BY должны совпадать
+    empty = literal_column("''")
+    utm = (
+        func.coalesce(User.utm_source, empty).label("utm_source"),
+        func.coalesce(User.utm_medium, empty).label("utm_medium"),
+        func.coalesce(User.utm_campaign, empty).label("utm_campaign"),
+    )
+    users = func.count().label("users")
+    return select(*utm, users).group_by(*utm).order_by(users.desc())
+
+
+class UserListService:
+    """Сервис списка пользователей"""
+
+    @staticmethod
+    async def get_page(
+        session: AsyncSession,
+        before: Optional[Tuple[Optional[datetime], int]] = None,
+        limit: int = PAGE_SIZE,
+    ) -> Tuple[List, Optional[Tuple[Optional[datetime], int]]]:
+        """
+        Страница пользователей от новых к старым с количеством чеков
+
+        Args:
+            session: Сессия базы данных
+            before: Ключ (registered_at, id) последнего пользователя предыдущей страницы
+                (registered_at может быть None)
+            limit: Размер страницы
+
+        Returns:
+            Tuple[List, Optional[Tuple[Optional[datetime], int]]]: Строки страницы
+            и ключ для следующей страницы (None — страница последняя)
+        """
+        # Подзапрос выполняется только для строк страницы (индекс ix_receipts_user_id)
+        receipts = (
+            select(func.count())
+            .where(Receipt.user_id == User.id)
+            .scalar_subquery()
+            .label("receipts")
+        )
+        query = select(
+            User.id,
+            User.username,
+            User.full_name,
+            User.utm_source,
+            User.utm_medium,
+            User.utm_campaign,
+            User.registered_at,
+            receipts,
+        )
+        query = query.order_by(User.registered_at.desc().nulls_last(), User.id.desc())
+        # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+        rows = []
+        if before is None or before[0] is not None:
+            dated = [User.registered_at.is_not(None)]
+            if before is not None:
+                dated.append(tuple_(User.registered_at, User.id) < before)
+            rows = (await session.execute(query.where(and_(*dated)).limit(limit + 1))).all()
+        if len(rows) <= limit:
+            # Хвост без даты — отдельным запросом, чтобы оба шли по индексу
+            undated = [User.registered_at.is_(None)]
+            if before is not None and before[0] is None:
+                undated.append(User.id < before[1])
+            rows += (
+                await session.execute(query.where(and_(*undated)).limit(limit + 1 - len(rows)))
+            ).all()
+
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1].registered_at, rows[-1].id)
+
+    @staticmethod
+    async def get_utm_stats(session: AsyncSession) -> List:
+        """
+        Статистика UTM одним запросом
+
+        Returns:
+            List: Строки (utm_source, utm_medium, utm_campaign, users)
+        """
+        return (await session.execute(utm_stats_query())).all()
+
+    @staticmethod
+    async def iter_utm_stats(chunk_size: int = CHUNK_SIZE) -> AsyncIterator[List]:
+        """Пачки строк статистики UTM через серверный курсор (для выгрузки)"""
+        query = utm_stats_query().execution_options(yield_per=chunk_size)
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+
+# Создаем экземпляр сервиса
+user_list_service = UserListService()
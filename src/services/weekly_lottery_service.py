@@ -1,14 +1,13 @@
-import random
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.weekly_lottery_model import WeeklyLottery
 from models.receipt_model import Receipt
 from models.user_model import User
+from config import LOTTERY_DRAW_MODE
 from logger import logger
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from pathlib import Path
 
 # Определяем корневую директорию проекта для абсолютных путей
@@ -62,51 +61,13 @@ class WeeklyLotteryService:
 
         return current_monday, current_sunday
 
-    @staticmethod
-    async def get_eligible_receipts(
-        session: AsyncSession, week_start: datetime, week_end: datetime
-    ) -> list[Receipt]:
-        """
-        Получает все подтверждённые чеки за указанную неделю
-
-        Args:
-            session: Сессия базы данных
-            week_start: Начало недели
-            week_end: Конец недели
-
-        Returns:
-            list[Receipt]: Список подходящих чеков
-        """
-        try:
-            # Получаем все подтверждённые чеки за неделю
-            query = await session.execute(
-                select(Receipt).where(
-                    and_(
-                        Receipt.status == "verified",
-                        Receipt.created_at >= week_start,
-                        Receipt.created_at <= week_end,
-                    )
-                )
-            )
-            receipts = query.scalars().all()
-            logger.info(
-                f"Найдено {len(receipts)} подтверждённых чеков "
-                f"с {week_start.strftime('%d.%m.%Y')} по {week_end.strftime('%d.%m.%Y')}"
-            )
-            # Фильтруем по наличию продукции «Айсида»
-            eligible = [r for r in receipts if r.items_count > 0]
-            logger.info(
-                f"После фильтрации осталось {len(eligible)} подходящих чеков для розыгрыша"
-            )
-            return eligible
-
-        except Exception as e:
-            logger.error(f"Ошибка при получении подходящих чеков: {str(e)}")
-            return []
-
     @staticmethod
     async def conduct_lottery(
-        session: AsyncSession, bot=None, *, for_current_week: bool = False
+        session: AsyncSession,
+        bot=None,
+        *,
+        for_current_week: bool = False,
+        mode: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Проводит еженедельный розыгрыш
@@ -115,10 +76,13 @@ class WeeklyLotteryService:
             session: Сессия базы данных
             bot: Экземпляр бота для отправки уведомлений
             for_current_week: Флаг, указывающий на тип недели для розыгрыша
+            mode: Режим розыгрыша (по умолчанию LOTTERY_DRAW_MODE)
 
         Returns:
             Dict[str, Any]: Результат розыгрыша
         """
+        from services.lottery_draw_service import lottery_draw_service
+
         try:
             # Выбираем даты в зависимости от типа лотереи
             if for_current_week:
@@ -132,6 +96,14 @@ class WeeklyLotteryService:
                     f"Проводим розыгрыш за предыдущую неделю {week_start.strftime('%d.%m.%Y')} - {week_end.strftime('%d.%m.%Y')}"
                 )
 
+            # Розыгрыши одной недели (планировщик, админка) выполняются по очереди:
+            # блокировка держится до конца транзакции, поэтому вторая попытка
+            # увидит запись первой и не создаст дубликат
+            await session.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                {"key": f"weekly_lottery:{week_start.isoformat()}"},
+            )
+
             # Проверяем, не проводился ли уже розыгрыш за эту неделю
             existing_lottery = await session.execute(
                 select(WeeklyLottery).where(
@@ -151,12 +123,39 @@ class WeeklyLotteryService:
                     "error": "Розыгрыш за эту неделю уже проводился",
                 }
 
-            # Получаем подходящие чеки
-            eligible_receipts = await WeeklyLotteryService.get_eligible_receipts(
-                session, week_start, week_end
+            # Без обязательства, опубликованного до начала недели (неделя
+            # выкатки, пропущенный запуск планировщика), жеребьёвку не проводим:
+            # создаём розыгрыш без победителя, его выберет администратор
+            secret = await lottery_draw_service.get_week_secret(session, week_start)
+            if secret is None:
+                lottery_record = WeeklyLottery(
+                    week_start=week_start,
+                    week_end=week_end,
+                    conducted_at=datetime.now(),
+                )
+                session.add(lottery_record)
+                await session.commit()
+                logger.warning(
+                    f"Нет обязательства розыгрыша за неделю {week_start.strftime('%d.%m.%Y')}: "
+                    f"розыгрыш {lottery_record.id} создан без победителя"
+                )
+                return {
+                    "success": True,
+                    "winner": None,
+                    "lottery_id": lottery_record.id,
+                    "participants_count": 0,
+                    "message": (
+                        "Обязательство розыгрыша не было опубликовано до начала недели. "
+                        "Выберите победителя вручную."
+                    ),
+                }
+
+            # Разыгрываем билеты недели
+            draw = await lottery_draw_service.draw(
+                session, week_start, week_end, mode or LOTTERY_DRAW_MODE, secret
             )
 
-            if not eligible_receipts:
+            if draw is None:
                 logger.info("Нет подходящих чеков для розыгрыша")
 
                 # Создаём запись о розыгрыше без победителя
@@ -176,17 +175,17 @@ class WeeklyLotteryService:
                     "message": "Нет участников для розыгрыша",
                 }
 
-            # Выбираем случайный чек
-            winner_receipt = random.choice(eligible_receipts)
+            winner_receipt_id = draw["receipt_id"]
+            winner_user_id = draw["user_id"]
+            participants_count = draw["tickets_count"]
 
-            # Создаём запись о розыгрыше
+            # Создаём запись о розыгрыше вместе с протоколом
             lottery_record = WeeklyLottery(
                 week_start=week_start,
                 week_end=week_end,
-                winner_user_id=winner_receipt.user_id,
-                winner_receipt_id=winner_receipt.id,
                 conducted_at=datetime.now(),
             )
+            lottery_draw_service.apply_to_lottery(lottery_record, draw)
 
             session.add(lottery_record)
             await session.commit()
@@ -204,19 +203,21 @@ class WeeklyLotteryService:
                 await session.commit()
 
             logger.info(
-                f"Розыгрыш проведён! Победитель: пользователь {winner_receipt.user_id}, "
-                f"чек {winner_receipt.id}, уведомление отправлено: {notification_sent}"
+                f"Розыгрыш проведён! Победитель: пользователь {winner_user_id}, "
+                f"чек {winner_receipt_id}, уведомление отправлено: {notification_sent}"
             )
 
             return {
                 "success": True,
                 "winner": {
-                    "user_id": winner_receipt.user_id,
-                    "receipt_id": winner_receipt.id,
+                    "user_id": winner_user_id,
+                    "receipt_id": winner_receipt_id,
                     "lottery_id": lottery_record.id,
                 },
-                "participants_count": len(eligible_receipts),
+                "participants_count": participants_count,
                 "notification_sent": notification_sent,
+                "ticket_set_hash": draw["ticket_set_hash"],
+                "seed": draw["seed"],
             }
 
         except Exception as e:
@@ -246,6 +247,10 @@ class WeeklyLotteryService:
         Returns:
             bool: True если уведомление отправлено успешно
         """
+        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+        from services.media_cache_service import media_cache_service
+        from services.reachability_service import reachability_service
+
         try:
             if not lottery_record.winner_user_id:
                 return False
@@ -270,7 +275,6 @@ class WeeklyLotteryService:
             # Отправляем картинку победителю
             # Используем абсолютный путь к файлу картинки
             photo_path = BASE_DIR / "data" / "pics" / "victory.png"
-            photo = FSInputFile(str(photo_path))
             # Кнопка для запроса контакта
             markup = InlineKeyboardMarkup(
                 inline_keyboard=[
@@ -282,9 +286,10 @@ class WeeklyLotteryService:
                     ]
                 ]
             )
-            await bot.send_photo(
+            await media_cache_service.send_photo(
+                bot,
                 lottery_record.winner_user_id,
-                photo=photo,
+                str(photo_path),
                 caption=message,
                 reply_markup=markup,
             )
@@ -292,10 +297,13 @@ class WeeklyLotteryService:
             logger.info(
                 f"Уведомление о победе отправлено пользователю {lottery_record.winner_user_id}"
             )
+            await reachability_service.record(lottery_record.winner_user_id)
             return True
 
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления победителю: {str(e)}")
+            if lottery_record.winner_user_id:
+                await reachability_service.record(lottery_record.winner_user_id, e)
             return False
 
     @staticmethod
@@ -337,9 +345,13 @@ class WeeklyLotteryService:
             # При ручном выборе разрешаем выбирать любой существующий чек
             # без проверок на статус, товары Айсида или принадлежность к неделе
 
-            # Обновляем победителя
+            # Обновляем победителя; протокол жеребьёвки к нему больше не относится
             lottery.winner_user_id = receipt.user_id
             lottery.winner_receipt_id = receipt.id
+            lottery.draw_commitment = None
+            lottery.draw_secret = None
+            lottery.draw_exclusions = None
+            lottery.draw_seed = None
             await session.commit()
 
             logger.info(
@@ -0,0 +1,301 @@
+"""
+Очередь апдейтов Telegram в Postgres и процессы-воркеры
+
+Процесс приёма (long polling или webhook) только сохраняет сырые апдейты
+в таблицу update_queue и подтверждает их Telegram после коммита — апдейт
+не теряется ни при рестарте, ни при падении хендлера.
+
+Обработку ведут UPDATE_WORKER_PROCESSES отдельных процессов. Каждый берёт
+апдейты через FOR UPDATE SKIP LOCKED и держит в работе не больше
+UPDATE_WORKER_CONCURRENCY апдейтов одновременно. Апдейты одного чата
+обрабатываются строго по порядку, разных чатов — параллельно.
+
+Воркеры можно запустить и отдельно (например, на другой машине):
+
+    python src/update_queue.py
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+from typing import List, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+
+from config import (
+    UPDATE_WORKER_PROCESSES,
+    UPDATE_WORKER_CONCURRENCY,
+    UPDATE_QUEUE_POLL_INTERVAL,
+    UPDATE_QUEUE_VISIBILITY_TIMEOUT,
+    UPDATE_QUEUE_MAX_ATTEMPTS,
+)
+from database import async_session
+from services.update_queue_service import update_queue_service
+from webhook import WebhookIngestor
+from logger import logger
+
+
+class QueueWebhookIngestor(WebhookIngestor):
+    """Приёмник webhook, который сохраняет апдейты в очередь"""
+
+    async def dispatch(self, update: Update) -> None:
+        """
+        Сохраняет апдейт в очередь до ответа Telegram
+
+        Если запись не удалась, исключение уходит наружу (ответ 500),
+        и Telegram повторит доставку: update_id помечается виденным только
+        после коммита (см. WebhookIngestor.ingest).
+        """
+        async with async_session() as session:
+            await update_queue_service.enqueue(session, [update])
+
+
+async def poll_into_queue(
+    bot: Bot,
+    allowed_updates: Optional[List[str]] = None,
+    polling_timeout: int = 30,
+) -> None:
+    """
+    Получает апдейты long polling'ом и складывает их в очередь
+
+    Смещение offset сдвигается только после коммита, поэтому апдейты,
+    полученные перед остановкой процесса, Telegram пришлёт повторно.
+
+    Args:
+        bot: Экземпляр бота
+        allowed_updates: Типы апдейтов для получения
+        polling_timeout: Таймаут long polling, секунды
+    """
+    offset = None
+    while True:
+        try:
+            updates = await bot(
+                GetUpdates(
+                    offset=offset,
+                    timeout=polling_timeout,
+                    allowed_updates=allowed_updates,
+                ),
+                request_timeout=polling_timeout + 10,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка получения апдейтов: {str(e)}")
+            await asyncio.sleep(5)
+            continue
+
+        if not updates:
+            continue
+
+        try:
+            async with async_session() as session:
+                added = await update_queue_service.enqueue(session, updates)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # offset не сдвигаем: следующий getUpdates вернёт те же апдейты
+            logger.error(f"Не удалось сохранить апдейты в очередь: {str(e)}")
+            await asyncio.sleep(5)
+            continue
+        offset = updates[-1].update_id + 1
+        logger.info(f"В очередь добавлено апдейтов: {added}")
+
+
+class UpdateWorker:
+    """Обработчик апдейтов из очереди"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        dispatcher: Dispatcher,
+        worker_id: Optional[str] = None,
+        concurrency: int = UPDATE_WORKER_CONCURRENCY,
+        poll_interval: float = UPDATE_QUEUE_POLL_INTERVAL,
+        visibility_timeout: int = UPDATE_QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts: int = UPDATE_QUEUE_MAX_ATTEMPTS,
+    ) -> None:
+        """
+        Args:
+            bot: Экземпляр бота
+            dispatcher: Диспетчер aiogram
+            worker_id: Идентификатор воркера (по умолчанию хост:pid)
+            concurrency: Сколько апдейтов обрабатывать одновременно
+            poll_interval: Пауза между опросами пустой очереди, секунды
+            visibility_timeout: Через сколько секунд апдейт упавшего воркера
+                возвращается в очередь
+            max_attempts: После скольких неудачных попыток апдейт помечается failed
+        """
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        """Просит воркер завершиться после обработки взятых апдейтов"""
+        self._stopping.set()
+
+    async def run(self) -> None:
+        """Основной цикл: берёт апдейты, пока есть свободные слоты"""
+        logger.info(
+            f"Воркер {self.worker_id} запущен (одновременно до {self.concurrency} апдейтов)"
+        )
+        loop = asyncio.get_running_loop()
+        next_requeue = 0.0
+
+        while not self._stopping.is_set():
+            try:
+                if loop.time() >= next_requeue:
+                    async with async_session() as session:
+                        await update_queue_service.requeue_stale(
+                            session, self.visibility_timeout, self.max_attempts
+                        )
+                    next_requeue = loop.time() + self.visibility_timeout / 2
+
+                free = self.concurrency - len(self._tasks)
+                claimed = []
+                if free > 0:
+                    async with async_session() as session:
+                        claimed = await update_queue_service.claim(
+                            session, self.worker_id, free
+                        )
+
+                for queue_id, update_id, payload, attempts in claimed:
+                    task = asyncio.create_task(
+                        self._process(queue_id, update_id, payload, attempts)
+                    )
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                logger.error(f"Ошибка воркера {self.worker_id}: {str(e)}")
+                claimed = []
+
+            if not claimed:
+                # Очередь пуста или все слоты заняты — ждём
+                try:
+                    await asyncio.wait_for(
+                        self._stopping.wait(), timeout=self.poll_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+        if self._tasks:
+            logger.info(f"Ожидаем завершения {len(self._tasks)} апдейтов")
+            await asyncio.wait(set(self._tasks))
+        logger.info(f"Воркер {self.worker_id} остановлен")
+
+    async def _process(
+        self, queue_id: int, update_id: int, payload: str, attempts: int
+    ) -> None:
+        try:
+            update = Update.model_validate_json(payload, context={"bot": self.bot})
+            await self.dispatcher.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке апдейта {update_id}: {str(e)}")
+            try:
+                async with async_session() as session:
+                    await update_queue_service.fail(
+                        session, queue_id, attempts, str(e), self.max_attempts
+                    )
+            except Exception as db_error:
+                # Апдейт вернётся в очередь по visibility_timeout
+                logger.error(
+                    f"Не удалось отметить ошибку апдейта {update_id}: {str(db_error)}"
+                )
+            return
+
+        try:
+            async with async_session() as session:
+                await update_queue_service.complete(session, queue_id)
+        except Exception as e:
+            logger.error(f"Не удалось удалить апдейт {update_id} из очереди: {str(e)}")
+
+
+async def _worker_main(index: int) -> None:
+    # Импортируем здесь: процесс запускается через spawn и собирает
+    # бота и диспетчер заново
+    from main import create_bot, create_dispatcher
+
+    bot = create_bot()
+    # Апдейты не отбрасываются: отброшенный был бы удалён из очереди как обработанный
+    dp = create_dispatcher(shed_load=False)
+    worker = UpdateWorker(bot, dp, worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}")
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+
+    try:
+        await worker.run()
+    finally:
+        # Выдача подарков идёт в воркерах: как и в on_shutdown основного процесса,
+        # сохраняем выданные промокоды и возвращаем зарезервированные в оборот
+        from services.promocode_pool_service import promocode_pool
+
+        if promocode_pool.enabled:
+            try:
+                await promocode_pool.close()
+            except Exception as e:
+                logger.error(f"Не удалось закрыть пул промокодов: {str(e)}")
+        await dp.storage.close()
+        await bot.session.close()
+
+
+def run_worker_process(index: int) -> None:
+    """Точка входа процесса-воркера"""
+    asyncio.run(_worker_main(index))
+
+
+def start_worker_processes(count: int = UPDATE_WORKER_PROCESSES) -> List[multiprocessing.Process]:
+    """
+    Запускает процессы-воркеры
+
+    Args:
+        count: Количество процессов
+
+    Returns:
+        List[multiprocessing.Process]: Запущенные процессы
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(count):
+        process = context.Process(
+            target=run_worker_process, args=(index,), name=f"update-worker-{index}"
+        )
+        process.start()
+        processes.append(process)
+    logger.info(f"Запущено процессов-воркеров: {count}")
+    return processes
+
+
+def stop_worker_processes(
+    processes: List[multiprocessing.Process], timeout: float = 30
+) -> None:
+    """Останавливает воркеры, давая им доделать взятые апдейты"""
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+
+
+if __name__ == "__main__":
+    workers = start_worker_processes()
+    try:
+        for worker_process in workers:
+            worker_process.join()
+    except KeyboardInterrupt:
+        stop_worker_processes(workers)
@@ -1,5 +1,8 @@
 import os
+import json
+import asyncio
 import datetime
+from typing import Optional
 from fastapi import FastAPI, Depends, Request, Form, UploadFile, File
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
@@ -18,21 +21,36 @@ from services.google_sheets_service import google_sheets_service
 from services.lottery_service import select_winner, notify_winner, notify_participants
 from services.weekly_lottery_service import WeeklyLotteryService
 from services.promocode_service import promocode_service
+from services.lottery_ticket_service import lottery_ticket_service
+from services.broadcast_service import broadcast_service
+from services.audience_service import audience_service, AudienceFilter
+from services.receipt_list_service import receipt_list_service, ReceiptFilter
+from services.user_list_service import user_list_service
+from services.export_service import export_service, iter_csv, ENTITIES, FORMATS, ExportFilter
 from starlette.middleware.sessions import SessionMiddleware
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
 from models.admin_model import AdminUser
 from pathlib import Path
+from contextlib import asynccontextmanager
 from sqlalchemy import delete as sa_delete
-from aiogram import Bot
-from aiogram.types import FSInputFile, LinkPreviewOptions, InputMediaPhoto
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
 from config import BOT_TOKEN
 from logger import logger
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Продолжаем рассылки, прерванные перезапуском админки
+    try:
+        await broadcast_service.resume_unfinished()
+    except Exception as e:
+        logger.error(f"Не удалось возобновить рассылки: {str(e)}")
+    yield
+    # Отпускаем рассылки, чтобы следующий запуск подхватил их сразу
+    await broadcast_service.stop_all()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(SessionMiddleware, secret_key="CHANGE_THIS_SECRET_KEY")
 BASE_DIR = os.path.dirname(__file__)
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
@@ -75,32 +93,65 @@ async def list_receipts(
     current_admin: AdminUser = Depends(get_current_admin),
     status: str = None,
     pharmacy: str = None,
+    search: str = None,
     start_date: str = None,
     end_date: str = None,
+    before_ts: str = None,
+    before_id: Optional[int] = None,
     session: AsyncSession = Depends(get_db),
 ):
-    query = select(Receipt)
-    if status:
-        query = query.where(Receipt.status == status)
-    if pharmacy:
-        query = query.where(Receipt.pharmacy.ilike(f"%{pharmacy}%"))
-    if start_date:
-        sd = datetime.datetime.fromisoformat(start_date)
-        query = query.where(Receipt.created_at >= sd)
-    if end_date:
-        ed = datetime.datetime.fromisoformat(end_date)
-        query = query.where(Receipt.created_at <= ed)
-    query = query.order_by(Receipt.created_at.desc())
-    result = await session.execute(query)
-    receipts = result.scalars().all()
+    receipt_filter = ReceiptFilter(
+        status=status or None,
+        pharmacy=pharmacy or None,
+        search=search or None,
+        start_date=datetime.datetime.fromisoformat(start_date) if start_date else None,
+        end_date=datetime.datetime.fromisoformat(end_date) if end_date else None,
+    )
+    before = None
+    if before_id is not None:
+        # Пустой before_ts — страницы чеков без даты создания
+        before = (datetime.datetime.fromisoformat(before_ts) if before_ts else None, before_id)
+
+    receipts, next_key = await receipt_list_service.get_page(session, receipt_filter, before)
+    estimated_total = await receipt_list_service.estimate_count(session, receipt_filter)
+
+    from urllib.parse import urlencode
+
+    query = urlencode(
+        {
+            k: v
+            for k, v in (
+                ("status", status),
+                ("pharmacy", pharmacy),
+                ("search", search),
+                ("start_date", start_date),
+                ("end_date", end_date),
+            )
+            if v
+        }
+    )
+    next_query = None
+    if next_key is not None:
+        next_query = urlencode(
+            {
+                "before_ts": next_key[0].isoformat() if next_key[0] else "",
+                "before_id": next_key[1],
+            }
+        )
+
     return templates.TemplateResponse(
         "receipts.html",
         {
             "request": request,
             "receipts": receipts,
+            "estimated_total": estimated_total,
+            "query": query,
+            "is_first_page": before is None,
+            "next_query": next_query,
             "filters": {
                 "status": status,
                 "pharmacy": pharmacy,
+                "search": search,
                 "start_date": start_date,
                 "end_date": end_date,
             },
@@ -108,6 +159,41 @@ async def list_receipts(
     )
 
 
+@app.get("/admin/api/receipts/search")
+async def search_receipts(
+    q: str = "",
+    limit: int = 20,
+    current_admin: AdminUser = Depends(get_current_admin),
+    session: AsyncSession = Depends(get_db),
+):
+    """Поиск чеков по подстроке в аптеке, адресе или наименовании товара"""
+    rows = await receipt_list_service.search(session, q, limit=min(limit, 100))
+    return [
+        {
+            "id": r.id,
+            "user_id": r.user_id,
+            "amount": str(r.amount),
+            "pharmacy": r.pharmacy,
+            "address": r.address,
+            "items_count": r.items_count,
+            "status": r.status,
+            "created_at": r.created_at.isoformat() if r.created_at else None,
+        }
+        for r in rows
+    ]
+
+
+@app.get("/admin/api/pharmacies")
+async def search_pharmacies(
+    q: str = "",
+    current_admin: AdminUser = Depends(get_current_admin),
+    session: AsyncSession = Depends(get_db),
+):
+    """Подсказки названий аптек для фильтра чеков"""
+    rows = await receipt_list_service.search_pharmacies(session, q)
+    return [{"pharmacy": pharmacy, "receipts": receipts} for pharmacy, receipts in rows]
+
+
 @app.post("/admin/receipts/{receipt_id}/moderate")
 async def moderate_receipt(
     receipt_id: int,
@@ -119,6 +205,8 @@ async def moderate_receipt(
     if receipt and action in ["verified", "rejected"]:
         receipt.status = action
         receipt.verification_date = datetime.datetime.now()
+        # Билет розыгрыша выдаётся или аннулируется вместе со сменой статуса
+        await lottery_ticket_service.sync_receipt(session, receipt)
         await session.commit()
     return RedirectResponse(url="/admin/receipts", status_code=303)
 
@@ -167,7 +255,7 @@ async def run_weekly_lottery(
             w = result["winner"]
             message = f"Еженедельная лотерея проведена! Победитель: {w['user_id']}, Чек: {w['receipt_id']}"
         else:
-            message = "Еженедельная лотерея проведена. Нет участников."
+            message = result.get("message") or "Еженедельная лотерея проведена. Нет участников."
     else:
         message = f"Ошибка: {result.get('error')}"
     return RedirectResponse(url=f"/admin/users?message={message}", status_code=303)
@@ -177,26 +265,37 @@ async def run_weekly_lottery(
 async def list_users(
     request: Request,
     current_admin: AdminUser = Depends(get_current_admin),
+    before_ts: str = None,
+    before_id: Optional[int] = None,
     session: AsyncSession = Depends(get_db),
 ):
-    result = await session.execute(select(User))
-    users = result.scalars().all()
-    # Получаем количество добавленных чеков для каждого пользователя
-    receipt_counts_result = await session.execute(
-        select(Receipt.user_id, func.count(Receipt.id)).group_by(Receipt.user_id)
-    )
-    receipt_counts = {user_id: count for user_id, count in receipt_counts_result.all()}
-    utm_counts = {}
-    for u in users:
-        key = f"{u.utm_source or ''}|{u.utm_medium or ''}|{u.utm_campaign or ''}"
-        utm_counts[key] = utm_counts.get(key, 0) + 1
+    before = None
+    if before_id is not None:
+        # Пустой before_ts — страницы пользователей без даты регистрации
+        before = (datetime.datetime.fromisoformat(before_ts) if before_ts else None, before_id)
+
+    users, next_key = await user_list_service.get_page(session, before)
+    utm_stats = await user_list_service.get_utm_stats(session)
+
+    next_query = None
+    if next_key is not None:
+        from urllib.parse import urlencode
+
+        next_query = urlencode(
+            {
+                "before_ts": next_key[0].isoformat() if next_key[0] else "",
+                "before_id": next_key[1],
+            }
+        )
+
     response = templates.TemplateResponse(
         "users.html",
         {
             "request": request,
             "users": users,
-            "utm_counts": utm_counts,
-            "receipt_counts": receipt_counts,
+            "utm_stats": utm_stats,
+            "is_first_page": before is None,
+            "next_query": next_query,
         },
     )
     return response
@@ -205,34 +304,92 @@ async def list_users(
 @app.get("/admin/users/utm_export")
 async def export_utm_stats(
     current_admin: AdminUser = Depends(get_current_admin),
-    session: AsyncSession = Depends(get_db),
 ):
-    # Получаем пользователей и считаем статистику UTM
-    result = await session.execute(select(User))
-    users = result.scalars().all()
-    utm_counts = {}
-    for u in users:
-        key = f"{u.utm_source or ''}|{u.utm_medium or ''}|{u.utm_campaign or ''}"
-        utm_counts[key] = utm_counts.get(key, 0) + 1
-
-    import io, csv
-
-    output = io.StringIO()
-    # Добавляем BOM для корректного открытия в Excel с кодировкой UTF-8
-    output.write("\ufeff")
-    writer = csv.writer(output, delimiter=";")
-    writer.writerow(["utm_source", "utm_medium", "utm_campaign", "count"])
-    for utm_str, count in utm_counts.items():
-        source, medium, campaign = utm_str.split("|")
-        writer.writerow([source, medium, campaign, count])
-    output.seek(0)
+    # Статистика UTM считается в базе и отдаётся потоком
     return StreamingResponse(
-        output,
+        iter_csv(
+            ["utm_source", "utm_medium", "utm_campaign", "count"],
+            user_list_service.iter_utm_stats(),
+        ),
         media_type="text/csv",
         headers={"Content-Disposition": "attachment; filename=utm_stats.csv"},
     )
 
 
+def _end_of_day(value: str) -> datetime.datetime:
+    """Конец периода: дата без времени включает весь день"""
+    moment = datetime.datetime.fromisoformat(value)
+    if len(value) == 10:
+        moment += datetime.timedelta(days=1, microseconds=-1)
+    return moment
+
+
+@app.get("/admin/export", response_class=HTMLResponse)
+async def export_page(
+    request: Request,
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Страница выгрузок: сущность, колонки, фильтры и формат"""
+    return templates.TemplateResponse(
+        "export.html", {"request": request, "entities": ENTITIES, "formats": FORMATS}
+    )
+
+
+@app.get("/admin/export/{entity}")
+async def export_entity(
+    request: Request,
+    entity: str,
+    format: str = "csv",
+    start_date: str = None,
+    end_date: str = None,
+    utm_source: str = None,
+    utm_medium: str = None,
+    utm_campaign: str = None,
+    status: str = None,
+    pharmacy: str = None,
+    search: str = None,
+    prize_type: str = None,
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """
+    Выгрузка сущности потоком с серверного курсора
+
+    Колонки — параметр columns (можно повторять или перечислить через запятую),
+    по умолчанию — основные колонки сущности.
+    """
+    if entity not in ENTITIES or format not in FORMATS:
+        raise HTTPException(status_code=404, detail="Неизвестная выгрузка")
+
+    columns = [
+        column.strip()
+        for value in request.query_params.getlist("columns")
+        for column in value.split(",")
+        if column.strip()
+    ]
+    export_filter = ExportFilter(
+        start_date=datetime.datetime.fromisoformat(start_date) if start_date else None,
+        end_date=_end_of_day(end_date) if end_date else None,
+        utm_source=utm_source or None,
+        utm_medium=utm_medium or None,
+        utm_campaign=utm_campaign or None,
+        status=status or None,
+        pharmacy=pharmacy or None,
+        search=search or None,
+        prize_type=prize_type or None,
+    )
+    media_type = (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        if format == "xlsx"
+        else "text/csv"
+    )
+    filename = f"{entity}_{datetime.datetime.now():%Y%m%d_%H%M}.{format}"
+    return StreamingResponse(
+        export_service.stream(entity, format, columns, export_filter),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
 @app.get("/admin/login", response_class=HTMLResponse)
 async def login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
@@ -306,15 +463,45 @@ async def list_lotteries(
     session: AsyncSession = Depends(get_db),
 ):
     from models.weekly_lottery_model import WeeklyLottery
+    from services.lottery_draw_service import lottery_draw_service
 
     result = await session.execute(select(WeeklyLottery).order_by(WeeklyLottery.created_at.desc()))
     lotteries = result.scalars().all()
+    # Участие по неделям — готовые счётчики, без агрегации по чекам
+    weeks = await lottery_ticket_service.get_recent_weeks(session)
+    # Обязательства публикуются до начала недели, секреты — только в протоколе
+    commitments = await lottery_draw_service.get_recent_commitments(session)
     return templates.TemplateResponse(
         "lotteries.html",
-        {"request": request, "lotteries": lotteries, "message": message},
+        {
+            "request": request,
+            "lotteries": lotteries,
+            "weeks": weeks,
+            "commitments": commitments,
+            "message": message,
+        },
     )
 
 
+# Промокодов на странице админки
+PROMOCODES_PAGE_SIZE = 100
+
+
+def _promocode_filters(
+    discount_amount: Optional[str],
+    is_used: Optional[str],
+    is_active: Optional[str],
+    q: Optional[str],
+) -> dict:
+    """Фильтры промокодов из параметров запроса"""
+    return {
+        "discount_amount": int(discount_amount) if discount_amount and discount_amount.isdigit() else None,
+        "is_used": is_used == "true" if is_used else None,
+        "is_active": is_active == "true" if is_active else None,
+        "code_prefix": q.strip() if q and q.strip() else None,
+    }
+
+
 @app.get("/admin/promocodes", response_class=HTMLResponse)
 async def list_promocodes(
     request: Request,
@@ -322,26 +509,43 @@ async def list_promocodes(
     discount_amount: str = None,
     is_used: str = None,
     is_active: str = None,
+    q: str = None,
+    before: Optional[int] = None,
     message: str = None,
     session: AsyncSession = Depends(get_db),
 ):
-    """Страница управления промокодами"""
+    """Страница управления промокодами (постранично, от новых к старым)"""
 
     # Получаем статистику
     stats = await promocode_service.get_promocodes_stats(session)
 
-    # Парсим фильтры
-    discount_filter = int(discount_amount) if discount_amount and discount_amount.isdigit() else None
-    used_filter = is_used == "true" if is_used else (False if is_used == "false" else None)
-    active_filter = is_active == "true" if is_active else (False if is_active == "false" else None)
+    filters = _promocode_filters(discount_amount, is_used, is_active, q)
 
-    # Получаем список промокодов с фильтрацией
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница
     promocodes = await promocode_service.get_promocodes_list(
         session,
-        discount_amount=discount_filter,
-        is_used=used_filter,
-        is_active=active_filter,
-        limit=100,
+        limit=PROMOCODES_PAGE_SIZE + 1,
+        before_id=before,
+        **filters,
+    )
+    next_before = None
+    if len(promocodes) > PROMOCODES_PAGE_SIZE:
+        promocodes = promocodes[:PROMOCODES_PAGE_SIZE]
+        next_before = promocodes[-1].id
+
+    from urllib.parse import urlencode
+
+    query = urlencode(
+        {
+            k: v
+            for k, v in (
+                ("discount_amount", discount_amount),
+                ("is_used", is_used),
+                ("is_active", is_active),
+                ("q", q),
+            )
+            if v
+        }
     )
 
     return templates.TemplateResponse(
@@ -354,36 +558,96 @@ async def list_promocodes(
                 "discount_amount": discount_amount,
                 "is_used": is_used,
                 "is_active": is_active,
+                "q": q,
             },
+            "query": query,
+            "is_first_page": before is None,
+            "next_before": next_before,
             "message": message,
         },
     )
 
 
+@app.get("/admin/promocodes/export")
+async def export_promocodes(
+    current_admin: AdminUser = Depends(get_current_admin),
+    discount_amount: str = None,
+    is_used: str = None,
+    is_active: str = None,
+    q: str = None,
+):
+    """Выгрузка отфильтрованных промокодов в CSV (потоком с серверного курсора)"""
+    filters = _promocode_filters(discount_amount, is_used, is_active, q)
+
+    async def rows():
+        async for chunk in promocode_service.iter_promocodes(**filters):
+            yield [
+                (
+                    pid,
+                    code,
+                    amount,
+                    "да" if used else "нет",
+                    "да" if active else "нет",
+                    created_at.strftime("%d.%m.%Y %H:%M") if created_at else "",
+                    used_at.strftime("%d.%m.%Y %H:%M") if used_at else "",
+                )
+                for pid, code, amount, used, active, created_at, used_at in chunk
+            ]
+
+    header = ["id", "code", "discount_amount", "is_used", "is_active", "created_at", "used_at"]
+    return StreamingResponse(
+        iter_csv(header, rows()),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=promocodes.csv"},
+    )
+
+
+async def _iter_upload_lines(upload: UploadFile, chunk_size: int = 1024 * 1024):
+    """Строки загруженного файла по одной, без чтения файла целиком"""
+    import codecs
+
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    tail = ""
+    while True:
+        data = await upload.read(chunk_size)
+        if not data:
+            break
+        lines = (tail + decoder.decode(data)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
 @app.post("/admin/promocodes/add")
 async def add_promocodes(
     request: Request,
     discount_amount: int = Form(...),
-    codes: str = Form(...),
+    codes: str = Form(""),
+    codes_file: Optional[UploadFile] = File(None),
     current_admin: AdminUser = Depends(get_current_admin),
-    session: AsyncSession = Depends(get_db),
 ):
-    """Добавление новых промокодов"""
-
-    # Парсим промокоды из текста
-    codes_list = [line.strip() for line in codes.split("\n") if line.strip()]
+    """Добавление новых промокодов (из текстового поля или файла, по коду в строке)"""
 
-    if not codes_list:
+    if codes_file is not None and codes_file.filename:
+        source = _iter_upload_lines(codes_file)
+    elif codes.strip():
+        source = codes.split("\n")
+    else:
         return RedirectResponse(
             url="/admin/promocodes?message=Не найдено ни одного промокода",
             status_code=303,
         )
 
-    # Добавляем промокоды через сервис
-    result = await promocode_service.add_promocodes(session, codes_list, discount_amount)
+    # Массовый импорт через COPY, дубликаты пропускаются
+    result = await promocode_service.import_promocodes(source, discount_amount)
 
     if result["success"]:
-        message = f"Добавлено {result['added_count']} промокодов, пропущено {result['skipped_count']}"
+        message = f"Добавлено {result['added_count']} промокодов, дубликатов {result['skipped_count']}"
+        if result["invalid_count"]:
+            message += f", некорректных {result['invalid_count']}"
     else:
         message = f"Ошибка: {result['error']}"
 
@@ -446,8 +710,9 @@ async def confirm_weekly_lottery(
     from models.user_model import User
     from services.weekly_lottery_service import WeeklyLotteryService
     from aiogram import Bot
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.enums import ParseMode
     from config import BOT_TOKEN
-    from aiogram.types import FSInputFile
     from sqlalchemy import update as sa_update
 
     # Определяем корень проекта для абсолютных путей
@@ -468,45 +733,36 @@ async def confirm_weekly_lottery(
         # Уже был помечен кем-то другим
         return RedirectResponse(url="/admin/lotteries", status_code=303)
 
-    # Отправляем уведомления победителю и участникам
-    bot = Bot(token=str(BOT_TOKEN), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    async with bot:
-        # Если есть победитель: запрашиваем контактные данные
-        if lottery.winner_user_id:
+    # Победителю — сразу: одно сообщение с запросом контактов
+    if lottery.winner_user_id:
+        bot = Bot(token=str(BOT_TOKEN), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        async with bot:
             await WeeklyLotteryService.notify_winner(session, bot, lottery)
 
-        # В любом случае уведомляем всех пользователей о завершении розыгрыша
-        # Используем абсолютный путь к файлу картинки
-        photo_path = BASE_DIR / "data" / "pics" / "lottery.png"
-        lottery_photo = FSInputFile(str(photo_path))
-        result = await session.execute(select(User))
-        all_users = result.scalars().all()
-        # Формируем текст для участников
-        if lottery.winner_user_id:
-            winner_user = await session.get(User, lottery.winner_user_id)
-            winner_mention = f"(@{winner_user.username})" if winner_user and winner_user.username else ""
-            participant_caption = (
-                "Розыгрыш завершён!\n"
-                f"Победитель: чек № {lottery.winner_receipt_id} {winner_mention}.\n"
-                "Спасибо за участие! Оставайтесь с «Айсида»"
-            )
-        else:
-            participant_caption = "Розыгрыш завершён!\nУчастников не было.\nСпасибо за участие! Оставайтесь с «Айсида»"
-        for user in all_users:
-            # Не отправляем победителю повторно
-            if lottery.winner_user_id and user.id == lottery.winner_user_id:
-                continue
-
-            try:
-                await bot.send_photo(
-                    user.id,
-                    photo=lottery_photo,
-                    caption=participant_caption,
-                )
-            except Exception as e:
-                pass
-    # Уже помечено выше атомарным апдейтом
-    return RedirectResponse(url="/admin/lotteries", status_code=303)
+    # В любом случае уведомляем всех пользователей о завершении розыгрыша
+    # Используем абсолютный путь к файлу картинки
+    photo_path = BASE_DIR / "data" / "pics" / "lottery.png"
+    # Формируем текст для участников
+    if lottery.winner_user_id:
+        winner_user = await session.get(User, lottery.winner_user_id)
+        winner_mention = f"(@{winner_user.username})" if winner_user and winner_user.username else ""
+        participant_caption = (
+            "Розыгрыш завершён!\n"
+            f"Победитель: чек № {lottery.winner_receipt_id} {winner_mention}.\n"
+            "Спасибо за участие! Оставайтесь с «Айсида»"
+        )
+    else:
+        participant_caption = "Розыгрыш завершён!\nУчастников не было.\nСпасибо за участие! Оставайтесь с «Айсида»"
+    # Рассылка участникам идёт в фоне; победителю не отправляем повторно
+    broadcast = await broadcast_service.create(
+        text=participant_caption,
+        media=[str(photo_path)],
+        kind="lottery",
+        audience=AudienceFilter(exclude_user_ids=[lottery.winner_user_id]),
+    )
+    broadcast_service.start(broadcast.id)
+    # notification_sent уже помечен выше атомарным апдейтом
+    return RedirectResponse(url=f"/admin/broadcasts/{broadcast.id}", status_code=303)
 
 
 @app.post("/admin/lotteries/{lottery_id}/reroll")
@@ -516,26 +772,54 @@ async def reroll_weekly_lottery(
     session: AsyncSession = Depends(get_db),
 ):
     from models.weekly_lottery_model import WeeklyLottery
-    from services.weekly_lottery_service import WeeklyLotteryService
-    import random
+    from services.lottery_draw_service import lottery_draw_service
 
     lottery = await session.get(WeeklyLottery, lottery_id)
     if not lottery or lottery.notification_sent:
         return RedirectResponse(url="/admin/lotteries", status_code=303)
 
-    # Получаем подходящие чеки недели, исключаем текущий
-    receipts = await WeeklyLotteryService.get_eligible_receipts(session, lottery.week_start, lottery.week_end)
-    candidates = [r for r in receipts if r.id != lottery.winner_receipt_id]
-    if not candidates:
+    # Переигрываем с тем же секретом недели, исключая прежних победителей
+    try:
+        draw = await lottery_draw_service.reroll(session, lottery)
+    except ValueError as e:
+        return RedirectResponse(url=f"/admin/lotteries?message={e}", status_code=303)
+    if draw is None:
         return RedirectResponse(url="/admin/lotteries", status_code=303)
 
-    winner_receipt = random.choice(candidates)
-    lottery.winner_receipt_id = winner_receipt.id
-    lottery.winner_user_id = winner_receipt.user_id
+    lottery_draw_service.apply_to_lottery(lottery, draw)
     await session.commit()
     return RedirectResponse(url="/admin/lotteries", status_code=303)
 
 
+@app.get("/admin/lotteries/{lottery_id}/verify")
+async def verify_weekly_lottery(
+    lottery_id: int,
+    current_admin: AdminUser = Depends(get_current_admin),
+    session: AsyncSession = Depends(get_db),
+):
+    """Повторяет розыгрыш по сохранённому протоколу"""
+    from models.weekly_lottery_model import WeeklyLottery
+    from services.lottery_draw_service import lottery_draw_service
+
+    lottery = await session.get(WeeklyLottery, lottery_id)
+    if not lottery:
+        return RedirectResponse(url="/admin/lotteries", status_code=303)
+
+    result = await lottery_draw_service.verify(session, lottery)
+    if not result["success"]:
+        message = result["error"]
+    elif result["winner_match"]:
+        message = f"Протокол розыгрыша {lottery_id} подтверждён: победитель — чек {result['receipt_id']}"
+    elif not result["commitment_match"]:
+        message = "Секрет не соответствует обязательству, опубликованному до начала недели"
+    elif not result["tickets_match"]:
+        message = "Набор билетов изменился после розыгрыша (чеки переведены в другой статус)"
+    else:
+        message = f"Повтор выбрал другой чек: {result['receipt_id']}"
+
+    return RedirectResponse(url=f"/admin/lotteries?message={message}", status_code=303)
+
+
 @app.post("/admin/lotteries/{lottery_id}/select_winner")
 async def select_manual_winner(
     lottery_id: int,
@@ -703,22 +987,29 @@ async def broadcasts_page(
     current_admin: AdminUser = Depends(get_current_admin),
     message: str = None,
 ):
-    return templates.TemplateResponse("broadcasts.html", {"request": request, "message": message})
+    broadcasts = await broadcast_service.get_recent()
+    return templates.TemplateResponse(
+        "broadcasts.html", {"request": request, "message": message, "broadcasts": broadcasts}
+    )
 
 
 @app.post("/admin/broadcasts/send")
 async def send_broadcast(
-    request: Request, html_text: str = Form(...), audience: str = Form("all"), user_ids: str = Form("")
+    request: Request,
+    html_text: str = Form(...),
+    audience: str = Form("all"),
+    user_ids: str = Form(""),
+    current_admin: AdminUser = Depends(get_current_admin),
 ):
     """Отправка рассылки всем или выбранным пользователям.
 
     - html_text: HTML форматированный текст (parse_mode=HTML)
     - audience: all | specific
     - user_ids: "1,2,3" (если audience=specific)
+    - utm_source, utm_medium, utm_campaign, has_verified_receipts, active_days,
+      include_unreachable: фильтры сегмента
     - images: multiple files
     """
-    from sqlalchemy import select as sa_select
-
     # Получаем файлы изображений из запроса вручную, так как их может быть несколько
     try:
         form = await request.form()
@@ -729,27 +1020,40 @@ async def send_broadcast(
     image_files = form.getlist("images") if "images" in form else []
     disable_preview = form.get("disable_preview") == "1"
 
-    # Список целевых user_id
-    target_ids = []
-    async with async_session() as session:
-        if audience == "all":
-            result = await session.execute(sa_select(User))
-            users = result.scalars().all()
-            target_ids = [u.id for u in users]
-        else:
-            # Парсим из строки
-            for raw in (user_ids or "").split(","):
-                raw = raw.strip()
-                if not raw:
-                    continue
-                try:
-                    target_ids.append(int(raw))
-                except ValueError:
-                    logger.warning(f"Пропускаю некорректный user_id: '{raw}'")
-
-    if not target_ids:
+    # Список целевых user_id (None — все пользователи)
+    target_ids = None
+    if audience != "all":
+        target_ids = []
+        # Парсим из строки
+        for raw in (user_ids or "").split(","):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                target_ids.append(int(raw))
+            except ValueError:
+                logger.warning(f"Пропускаю некорректный user_id: '{raw}'")
+
+        if not target_ids:
+            return RedirectResponse(
+                url="/admin/broadcasts?message=Не выбран(а) аудитория/пользователи",
+                status_code=303,
+            )
+
+    # Сегмент считается в SQL: UTM, наличие подтверждённых чеков, активность
+    active_days = str(form.get("active_days") or "").strip()
+    segment = AudienceFilter(
+        user_ids=target_ids,
+        utm_source=form.get("utm_source") or None,
+        utm_medium=form.get("utm_medium") or None,
+        utm_campaign=form.get("utm_campaign") or None,
+        has_verified_receipts=form.get("has_verified_receipts") == "1",
+        active_days=int(active_days) if active_days.isdigit() else None,
+        include_unreachable=form.get("include_unreachable") == "1",
+    )
+    if await audience_service.count(segment) == 0:
         return RedirectResponse(
-            url="/admin/broadcasts?message=Не выбран(а) аудитория/пользователи",
+            url="/admin/broadcasts?message=В выбранном сегменте нет пользователей",
             status_code=303,
         )
 
@@ -774,44 +1078,111 @@ async def send_broadcast(
         except Exception as e:
             logger.error(f"Ошибка сохранения файла '{getattr(f, 'filename', None)}': {e}")
 
-    # Отправка
-    bot = Bot(token=str(BOT_TOKEN), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    sent = 0
-    failed = 0
-    errors: list[str] = []
-    async with bot:
-        # Если несколько изображений — отправим через media group
-        for uid in target_ids:
-            try:
-                if saved_paths:
-                    if len(saved_paths) == 1:
-                        photo = FSInputFile(str(saved_paths[0]))
-                        await bot.send_photo(uid, photo=photo, caption=html_text)
-                    else:
-                        media = []
-                        for idx, p in enumerate(saved_paths):
-                            file = FSInputFile(str(p))
-                            if idx == 0 and html_text:
-                                media.append(InputMediaPhoto(media=file, caption=html_text))
-                            else:
-                                media.append(InputMediaPhoto(media=file))
-                        await bot.send_media_group(uid, media=media)
-                else:
-                    await bot.send_message(
-                        uid,
-                        html_text,
-                        link_preview_options=LinkPreviewOptions(is_disabled=True) if disable_preview else None,
-                    )
-                sent += 1
-            except Exception as e:
-                failed += 1
-                err_text = f"uid={uid}: {e.__class__.__name__}: {e}"
-                errors.append(err_text)
-                logger.error(f"Ошибка отправки рассылки {err_text}")
-
-    details = ""
-    if errors:
-        preview = " | ".join(errors[:3])
-        details = f"; детали: {preview}"
-    msg = f"Рассылка завершена. Успешно: {sent}, ошибок: {failed}{details}"
-    return RedirectResponse(url=f"/admin/broadcasts?message={msg}", status_code=303)
+    # Рассылка идёт в фоне, админ сразу видит страницу с прогрессом
+    broadcast = await broadcast_service.create(
+        text=html_text,
+        media=[str(p) for p in saved_paths],
+        disable_preview=disable_preview,
+        audience=segment,
+    )
+    broadcast_service.start(broadcast.id)
+    return RedirectResponse(url=f"/admin/broadcasts/{broadcast.id}", status_code=303)
+
+
+def _broadcast_progress(broadcast) -> dict:
+    """Счётчики рассылки для страницы прогресса"""
+    processed = broadcast.sent_count + broadcast.failed_count + broadcast.blocked_count
+    return {
+        "status": broadcast.status,
+        "total": broadcast.total,
+        "processed": processed,
+        "sent": broadcast.sent_count,
+        "failed": broadcast.failed_count,
+        "blocked": broadcast.blocked_count,
+    }
+
+
+@app.get("/admin/broadcasts/{broadcast_id}", response_class=HTMLResponse)
+async def broadcast_job_page(
+    request: Request,
+    broadcast_id: int,
+    current_admin: AdminUser = Depends(get_current_admin),
+    message: str = None,
+):
+    broadcast = await broadcast_service.get_broadcast(broadcast_id)
+    if broadcast is None:
+        return RedirectResponse(url="/admin/broadcasts?message=Рассылка не найдена", status_code=303)
+    return templates.TemplateResponse(
+        "broadcast_job.html",
+        {
+            "request": request,
+            "broadcast": broadcast,
+            "progress": _broadcast_progress(broadcast),
+            "message": message,
+        },
+    )
+
+
+@app.get("/admin/broadcasts/{broadcast_id}/events")
+async def broadcast_events(
+    request: Request,
+    broadcast_id: int,
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Прогресс рассылки через Server-Sent Events (раз в секунду до завершения)"""
+
+    async def events():
+        rate = 0.0
+        last = None
+        while not await request.is_disconnected():
+            broadcast = await broadcast_service.get_broadcast(broadcast_id)
+            if broadcast is None:
+                break
+            progress = _broadcast_progress(broadcast)
+            now = asyncio.get_running_loop().time()
+            if last is not None and now > last[1]:
+                # Скорость сглаживаем: счётчики в базе обновляются раз в пару секунд
+                current = (progress["processed"] - last[0]) / (now - last[1])
+                rate = current if rate == 0 else 0.7 * rate + 0.3 * current
+            if broadcast.status != "running":
+                rate = 0.0
+            last = (progress["processed"], now)
+            remaining = max(0, progress["total"] - progress["processed"])
+            progress["rate"] = round(rate, 1)
+            progress["eta"] = int(remaining / rate) if rate > 0 else None
+            yield f"data: {json.dumps(progress)}\n\n"
+            if broadcast.status in ("done", "failed", "cancelled"):
+                break
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/admin/broadcasts/{broadcast_id}/{action}")
+async def control_broadcast(
+    broadcast_id: int,
+    action: str,
+    current_admin: AdminUser = Depends(get_current_admin),
+):
+    """Пауза, продолжение и отмена рассылки"""
+    actions = {
+        "pause": (broadcast_service.pause, "Рассылка поставлена на паузу"),
+        "resume": (broadcast_service.resume, "Рассылка продолжена"),
+        "cancel": (broadcast_service.cancel, "Рассылка отменена"),
+    }
+    if action not in actions:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    handler, done_message = actions[action]
+    if await handler(broadcast_id):
+        message = done_message
+    elif action == "resume":
+        message = "Рассылка ещё останавливается или не на паузе, повторите через пару секунд"
+    else:
+        message = "Рассылка уже завершена"
+    return RedirectResponse(
+        url=f"/admin/broadcasts/{broadcast_id}?message={message}", status_code=303
+    )
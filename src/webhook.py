@@ -0,0 +1,166 @@
+"""
+Приём апдейтов Telegram через webhook
+
+WebhookIngestor проверяет секретный токен, отбрасывает повторы по update_id
+и передаёт апдейт диспетчеру в фоновой задаче: Telegram получает ответ 200
+сразу, не дожидаясь окончания работы хендлера (распознавания чека, запросов к API).
+
+Обслуживать webhook можно отдельным aiohttp-приложением (create_aiohttp_app)
+или роутером FastAPI под uvicorn (create_fastapi_router).
+"""
+
+import asyncio
+import hmac
+from collections import OrderedDict
+from typing import Any, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from logger import logger
+
+# Заголовок, в котором Telegram присылает secret_token из setWebhook
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookIngestor:
+    """Приёмник апдейтов webhook: проверка, дедупликация и передача диспетчеру"""
+
+    def __init__(
+        self,
+        bot: Bot,
+        dispatcher: Dispatcher,
+        secret_token: str,
+        dedupe_size: int = 10000,
+    ) -> None:
+        """
+        Args:
+            bot: Экземпляр бота
+            dispatcher: Диспетчер aiogram
+            secret_token: Секрет, переданный в setWebhook
+            dedupe_size: Сколько последних update_id помнить для отсева повторов
+        """
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.secret_token = secret_token
+        self.dedupe_size = dedupe_size
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def check_secret(self, header_value: Optional[str]) -> bool:
+        """Проверяет секретный токен запроса (сравнение за постоянное время)"""
+        if not header_value:
+            return False
+        # Байты, а не str: compare_digest не принимает строки с не-ASCII символами
+        return hmac.compare_digest(
+            header_value.encode("utf-8"), self.secret_token.encode("utf-8")
+        )
+
+    def is_seen(self, update_id: int) -> bool:
+        """
+        Сообщает, принимался ли update_id раньше
+
+        Telegram повторяет доставку, если не получил ответ вовремя,
+        поэтому один и тот же апдейт может прийти несколько раз.
+        """
+        return update_id in self._seen
+
+    def mark_seen(self, update_id: int) -> None:
+        """Запоминает принятый update_id"""
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+
+    async def ingest(self, payload: dict) -> None:
+        """
+        Принимает тело запроса webhook и запускает обработку в фоне
+
+        update_id запоминается только после успешной передачи апдейта:
+        если dispatch упал, повтор доставки от Telegram не будет отброшен.
+
+        Args:
+            payload: JSON апдейта
+        """
+        try:
+            update = Update.model_validate(payload, context={"bot": self.bot})
+        except Exception as e:
+            # Некорректный апдейт бессмысленно получать повторно — просто логируем
+            logger.error(f"Не удалось разобрать апдейт webhook: {str(e)}")
+            return
+
+        if self.is_seen(update.update_id):
+            logger.info(f"Повторный апдейт {update.update_id} пропущен")
+            return
+
+        await self.dispatch(update)
+        self.mark_seen(update.update_id)
+
+    async def dispatch(self, update: Update) -> None:
+        """Передаёт апдейт диспетчеру в фоновой задаче"""
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update: Update) -> Any:
+        try:
+            return await self.dispatcher.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке апдейта {update.update_id}: {str(e)}")
+
+    async def wait_closed(self, timeout: float = 30) -> None:
+        """Дожидается обработки уже принятых апдейтов (при остановке)"""
+        if not self._tasks:
+            return
+        logger.info(f"Ожидаем завершения {len(self._tasks)} апдейтов")
+        await asyncio.wait(set(self._tasks), timeout=timeout)
+
+
+def create_aiohttp_app(ingestor: WebhookIngestor, path: str):
+    """
+    Создаёт отдельное aiohttp-приложение с обработчиком webhook
+
+    Args:
+        ingestor: Приёмник апдейтов
+        path: Путь webhook (например, /telegram/webhook)
+    """
+    from aiohttp import web
+
+    async def handle(request: "web.Request") -> "web.Response":
+        if not ingestor.check_secret(request.headers.get(SECRET_TOKEN_HEADER)):
+            return web.Response(status=401)
+        try:
+            payload = await request.json()
+        except Exception:
+            return web.Response(status=400)
+        await ingestor.ingest(payload)
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    return app
+
+
+def create_fastapi_router(ingestor: WebhookIngestor, path: str):
+    """
+    Создаёт роутер FastAPI с обработчиком webhook
+
+    Args:
+        ingestor: Приёмник апдейтов
+        path: Путь webhook (например, /telegram/webhook)
+    """
+    from fastapi import APIRouter, Request, Response
+
+    router = APIRouter()
+
+    @router.post(path, include_in_schema=False)
+    async def handle(request: Request) -> Response:
+        if not ingestor.check_secret(request.headers.get(SECRET_TOKEN_HEADER)):
+            return Response(status_code=401)
+        try:
+            payload = await request.json()
+        except Exception:
+            return Response(status_code=400)
+        await ingestor.ingest(payload)
+        return Response(status_code=200)
+
+    return router